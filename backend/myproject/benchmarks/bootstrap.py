@@ -0,0 +1,116 @@
+"""
+What the frontend downloads before its first render: the company,
+department and employee lists (three requests) against one
+`GET /api/bootstrap/` snapshot. For each it reports the bytes on the wire,
+uncompressed and with every content coding the server offers, and the time
+until the data is decoded on the client (requests plus `json.loads`), for an
+admin (every company) and a manager (one company).
+
+The snapshot is timed when its companies changed (rebuilt in the request),
+when only the response cache is cold (stored snapshots are assembled) and
+fully cached.
+
+    python -m benchmarks.bootstrap --companies 20 --departments 10 --employees 50
+"""
+import argparse
+import gzip
+import json
+import time
+
+from benchmarks.common import percentile, setup_database
+
+LIST_PATHS = ('/api/companies/', '/api/departments/', '/api/employees/')
+
+
+def decode(response):
+    body = response.content
+    if response.get('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    elif response.get('Content-Encoding') == 'br':
+        from core_app.snapshots import brotli
+        body = brotli.decompress(body)
+    return json.loads(body)
+
+
+def run(args):
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+
+    from core_app import snapshots
+    from core_app.models import Task, User
+    from core_app.response_cache import get_response_cache
+    from core_app.snapshots import compress
+    from core_app.synthetic import seed_synthetic_data
+
+    companies, departments = seed_synthetic_data(args.companies, args.departments, args.employees, seed=0)
+    users = {
+        'admin': User.objects.create(username='admin', email='admin@example.com', password='unused', role='admin'),
+        'manager': User.objects.create(
+            username='manager', email='manager@example.com', password='unused', role='manager', company=companies[0],
+        ),
+    }
+    encodings = ['identity', 'gzip'] + (['br'] if snapshots.brotli else [])
+    client = Client()
+
+    def timed(requests, headers, prepare=lambda: None):
+        """p50 over the runs of `requests` (paths fetched one after the other and decoded) in ms, and the bytes"""
+        timings = []
+        for _ in range(args.requests):
+            prepare()
+            start = time.perf_counter()
+            size = 0
+            for path in requests:
+                response = client.get(path, headers=headers)
+                assert response.status_code == 200, response.content
+                decode(response)
+                size += len(response.content)
+            timings.append((time.perf_counter() - start) * 1000)
+        return percentile(timings, 50), size
+
+    def outdate():
+        Task.enqueue('rebuild_snapshot', [company.pk for company in companies])
+        get_response_cache().clear()
+
+    print(f"companies={args.companies} departments={args.companies * args.departments} "
+          f"employees={args.companies * args.departments * args.employees} requests={args.requests}")
+    for role, user in users.items():
+        headers = {'Authorization': f'Token {Token.objects.create(user=user).key}'}
+        lists = b''.join(client.get(path, headers=headers).content for path in LIST_PATHS)
+        snapshot = client.get('/api/bootstrap/', headers=headers).content
+        print(f"\n{role}")
+        for encoding in encodings:
+            # The lists compressed the way a compressing proxy would, one response at a time
+            list_bytes = sum(
+                len(compress(client.get(path, headers=headers).content, encoding)) for path in LIST_PATHS
+            )
+            print(f"  bytes {encoding:<9} lists={list_bytes:>10}  bootstrap={len(compress(snapshot, encoding)):>10}")
+        print(f"  uncompressed lists={len(lists)} bootstrap={len(snapshot)}")
+
+        p50, size = timed(LIST_PATHS, headers, get_response_cache().clear)
+        print(f"  3 lists, response cache cold          p50={p50:9.3f}ms  bytes={size}")
+        p50, size = timed(LIST_PATHS, headers)
+        print(f"  3 lists, response cache warm          p50={p50:9.3f}ms  bytes={size}")
+        for encoding in encodings:
+            encoded = {**headers, 'Accept-Encoding': encoding}
+            p50, size = timed(['/api/bootstrap/'], encoded, outdate)
+            print(f"  bootstrap {encoding:<9} rebuilt          p50={p50:9.3f}ms  bytes={size}")
+            p50, size = timed(['/api/bootstrap/'], encoded, get_response_cache().clear)
+            print(f"  bootstrap {encoding:<9} assembled        p50={p50:9.3f}ms  bytes={size}")
+            p50, size = timed(['/api/bootstrap/'], encoded)
+            print(f"  bootstrap {encoding:<9} cached           p50={p50:9.3f}ms  bytes={size}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--companies', type=int, default=20)
+    parser.add_argument('--departments', type=int, default=10, help='Departments per company.')
+    parser.add_argument('--employees', type=int, default=50, help='Employees per department.')
+    parser.add_argument('--requests', type=int, default=20, help='Measured runs per variant.')
+    args = parser.parse_args()
+
+    setup_database()
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
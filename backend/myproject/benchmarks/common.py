@@ -0,0 +1,66 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks run against a throwaway test database (in memory for SQLite) so
+they never touch the development data. Run them from `backend/myproject`:
+
+    python -m benchmarks.<name> --help
+"""
+import os
+import resource
+import statistics
+import sys
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+
+def setup_database():
+    """Create and migrate a fresh test database for this process."""
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+
+def create_employees(count, companies=1, departments=1, **kwargs):
+    """Bulk insert `count` employees spread over the given companies/departments."""
+    from core_app.models import recount_denormalized_counters
+    from core_app.synthetic import create_companies
+    from core_app.synthetic import create_employees as create_synthetic_employees
+
+    company_objs, department_objs = create_companies(companies, departments)
+    create_synthetic_employees(department_objs, count, **kwargs)
+    recount_denormalized_counters()
+    return company_objs, department_objs
+
+
+def measure(func, repeat=5):
+    """Run `func` `repeat` times and return timing statistics in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'min_ms': min(timings), 'median_ms': statistics.median(timings), 'max_ms': max(timings)}
+
+
+def percentile(timings, q):
+    """The `q`th percentile (1-99) of `timings`"""
+    return statistics.quantiles(timings, n=100, method='inclusive')[q - 1]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def report(name, stats):
+    print(f"{name:<40} " + '  '.join(f"{key}={value:10.2f}" for key, value in stats.items()))
@@ -0,0 +1,45 @@
+"""
+Serialization time of `EmployeeSerializer` over many rows, comparing
+`days_employed` computed per row in Python (the previous behaviour) with the
+`with_days_employed()` database annotation.
+
+    python -m benchmarks.days_employed --rows 100000
+"""
+import argparse
+
+from benchmarks.common import create_employees, measure, report, setup_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_database()
+    create_employees(args.rows, companies=10, departments=10)
+
+    from core_app.models import Employee
+    from core_app.serializers import EmployeeSerializer
+
+    def python_days():
+        return EmployeeSerializer(Employee.objects.all(), many=True).data
+
+    def annotated_days():
+        return EmployeeSerializer(Employee.objects.with_days_employed(), many=True).data
+
+    def tenure_filter_python():
+        return [e for e in Employee.objects.all() if e.hired_on and EmployeeSerializer().get_days_employed(e) >= 365]
+
+    def tenure_filter_sql():
+        return list(Employee.objects.with_days_employed().filter(days_employed__gte=365))
+
+    print(f"{args.rows} employees")
+    report('serialize, days in Python', measure(python_days, args.repeat))
+    report('serialize, days annotated', measure(annotated_days, args.repeat))
+    report('tenure >= 365, Python loop', measure(tenure_filter_python, args.repeat))
+    report('tenure >= 365, SQL', measure(tenure_filter_sql, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
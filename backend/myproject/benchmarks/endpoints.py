@@ -0,0 +1,266 @@
+"""
+Drive every endpoint in `core_app/urls.py` through the Django test client
+against synthetic data and report, per URL name, throughput, p50/p95/p99
+latency, SQL queries per request and the peak RSS of the process.
+
+Results can be saved as JSON and compared against a stored baseline; the
+exit status is 1 when an endpoint got slower than the tolerance allows or
+runs more queries than before.
+
+    python -m benchmarks.endpoints --output results.json
+    python -m benchmarks.endpoints --baseline baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.common import peak_rss_mb, percentile, setup_database
+
+PASSWORD = 'benchmark-password'
+
+
+class Fixtures:
+    """Seeded data plus the rows the write endpoints consume, one per iteration."""
+
+    def __init__(self, args, iterations):
+        from rest_framework.authtoken.models import Token
+
+        from core_app.models import Company, Department, Employee, User
+        from core_app.synthetic import create_employees, seed_synthetic_data
+
+        companies, departments = seed_synthetic_data(args.companies, args.departments, args.employees, seed=args.seed)
+        self.company = companies[0]
+        self.department = departments[0]
+        self.employee = Employee.objects.filter(department=self.department).order_by('id').first()
+
+        self.admin = User.objects.create(username='bench', email='bench@example.com', password=PASSWORD, role='admin')
+        self.token = Token.objects.create(user=self.admin).key
+        self.user = User.objects.create(username='bench-user', email='bench-user@example.com', password=PASSWORD, role='employee')
+
+        self.doomed_companies = [
+            company.id for company in Company.objects.bulk_create(Company(name=f'Doomed {i}') for i in range(iterations))
+        ]
+        self.doomed_departments = [
+            department.id for department in Department.objects.bulk_create(
+                Department(company=self.company, name=f'Doomed {i}') for i in range(iterations)
+            )
+        ]
+        create_employees([self.department], iterations * 2, seed=args.seed)
+        new_ids = list(Employee.objects.order_by('-id').values_list('id', flat=True)[:iterations * 2])
+        self.doomed_employees = new_ids[:iterations]
+        self.applicants = new_ids[iterations:]
+        Employee.objects.filter(id__in=self.applicants).update(status='application_received', hired_on=None)
+
+        leavers = User.objects.bulk_create(
+            User(username=f'leaver{i}', email=f'leaver{i}@example.com', password='!', role='employee')
+            for i in range(iterations)
+        )
+        self.leaver_tokens = [token.key for token in Token.objects.bulk_create(
+            Token(user=user, key=Token.generate_key()) for user in leavers
+        )]
+
+    def import_file(self, i, rows):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        lines = ['company,department,name,email,mobile_number,address,designation']
+        lines.extend(
+            f'{self.company.id},{self.department.id},Imported {i}-{j},imported{i}-{j}@bench.example.com,'
+            f'+123456789,{j} Import Street,Developer'
+            for j in range(rows)
+        )
+        return SimpleUploadedFile('employees.csv', '\n'.join(lines).encode())
+
+
+def scenarios(fixtures, args):
+    """URL name -> function(i) returning (method, path, data), in the order they run"""
+    company, department, employee = fixtures.company, fixtures.department, fixtures.employee
+    return {
+        # Reads
+        'company-list': lambda i: ('get', '/api/companies/', None),
+        'company-detail': lambda i: ('get', f'/api/companies/{company.id}/', None),
+        'company-summary': lambda i: ('get', f'/api/companies/{company.id}/summary/', None),
+        'summary': lambda i: ('get', '/api/summary/', None),
+        'bootstrap': lambda i: ('get', '/api/bootstrap/', None),
+        'changes': lambda i: ('get', '/api/changes/?since=0&limit=100', None),
+        'department-list': lambda i: ('get', '/api/departments/', None),
+        'department-detail': lambda i: ('get', f'/api/departments/{department.id}/', None),
+        'employee-list': lambda i: ('get', f'/api/employees/?company={company.id}&page_size=100', None),
+        'employee-detail': lambda i: ('get', f'/api/employees/{employee.id}/', None),
+        'employee-search': lambda i: ('get', f'/api/employees/search/?q={employee.name[:3 + i % 5]}', None),
+        'employee-export': lambda i: ('get', f'/api/employees/export/?company={company.id}', None),
+        'get-all-users': lambda i: ('get', '/api/users/', None),
+        'get-user': lambda i: ('get', f'/api/users/{fixtures.user.id}/', None),
+        'metrics': lambda i: ('get', '/api/metrics/', None),
+        # Writes
+        'login': lambda i: ('post', '/api/login/', {'email': fixtures.admin.email, 'password': PASSWORD}),
+        'update-user': lambda i: ('put', f'/api/users/{fixtures.user.id}/update/', {'role': ('manager', 'employee')[i % 2]}),
+        'company-create': lambda i: ('post', '/api/companies/create/', {'name': f'Created {i}'}),
+        'company-update': lambda i: ('put', f'/api/companies/{company.id}/update/', {'name': f'Renamed {i}'}),
+        'department-create': lambda i: ('post', '/api/departments/create/', {'company': company.id, 'name': f'Created {i}'}),
+        'department-update': lambda i: (
+            'put', f'/api/departments/{department.id}/update/', {'company': company.id, 'name': f'Renamed {i}'},
+        ),
+        'employee-create': lambda i: ('post', '/api/employees/create/', {
+            'company': company.id, 'department': department.id, 'name': f'Created {i}',
+            'email': f'created{i}@bench.example.com', 'mobile_number': '+123456789', 'address': '1 Main Street',
+            'designation': 'Developer',
+        }),
+        'employee-update': lambda i: ('put', f'/api/employees/{employee.id}/update/', {'address': f'{i} Main Street'}),
+        'employee-transitions': lambda i: (
+            'post', '/api/employees/transitions/', [{'id': fixtures.applicants[i], 'status': 'interview_scheduled'}],
+        ),
+        'employee-bulk-import': lambda i: (
+            'post', '/api/employees/bulk/', {'file': fixtures.import_file(i, args.import_rows)},
+        ),
+        # Deletes
+        'company-delete': lambda i: ('delete', f'/api/companies/{fixtures.doomed_companies[i]}/delete/', None),
+        'department-delete': lambda i: ('delete', f'/api/departments/{fixtures.doomed_departments[i]}/delete/', None),
+        'employee-delete': lambda i: ('delete', f'/api/employees/{fixtures.doomed_employees[i]}/delete/', None),
+        'logout': lambda i: ('post', '/api/logout/', None),
+    }
+
+
+def send(client, fixtures, name, request, i):
+    method, path, data = request
+    # logout deletes the token, so each iteration logs out a user of its own
+    token = fixtures.leaver_tokens[i] if name == 'logout' else fixtures.token
+    kwargs = {'headers': {'Authorization': f'Token {token}'}}
+    if data is not None and method != 'get':
+        if name == 'employee-bulk-import':
+            kwargs['data'] = data
+        else:
+            kwargs.update(data=json.dumps(data), content_type='application/json')
+    response = getattr(client, method)(path, **kwargs)
+    if response.streaming:
+        # The export queries run while the body streams
+        b''.join(response.streaming_content)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{name}: {method.upper()} {path} returned {response.status_code}: {response.content[:200]!r}')
+    return response
+
+
+def run(args):
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    from core_app import urls
+
+    iterations = args.warmup + args.requests
+    fixtures = Fixtures(args, iterations)
+    plans = scenarios(fixtures, args)
+    missing = {pattern.name for pattern in urls.urlpatterns} - set(plans)
+    if missing:
+        raise SystemExit(f"No benchmark scenario for: {', '.join(sorted(missing))}")
+
+    client = Client()
+    endpoints = {}
+    for name, plan in plans.items():
+        if args.only and name not in args.only:
+            continue
+        for i in range(args.warmup):
+            send(client, fixtures, name, plan(i), i)
+
+        timings, queries = [], []
+        start = time.perf_counter()
+        for i in range(args.warmup, iterations):
+            request = plan(i)
+            with CaptureQueriesContext(connection) as captured:
+                request_start = time.perf_counter()
+                send(client, fixtures, name, request, i)
+                timings.append((time.perf_counter() - request_start) * 1000)
+            queries.append(len(captured))
+        elapsed = time.perf_counter() - start
+
+        endpoints[name] = {
+            'requests': len(timings),
+            'throughput_rps': len(timings) / elapsed,
+            'p50_ms': percentile(timings, 50),
+            'p95_ms': percentile(timings, 95),
+            'p99_ms': percentile(timings, 99),
+            'mean_queries': sum(queries) / len(queries),
+            'max_queries': max(queries),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        print_row(name, endpoints[name])
+
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'companies': args.companies,
+            'departments': args.departments,
+            'employees': args.employees,
+            'seed': args.seed,
+            'requests': args.requests,
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'endpoints': endpoints,
+    }
+
+
+def print_row(name, stats):
+    print(f"{name:<22} {stats['throughput_rps']:9.1f} req/s  p50={stats['p50_ms']:8.2f}ms  "
+          f"p95={stats['p95_ms']:8.2f}ms  p99={stats['p99_ms']:8.2f}ms  "
+          f"queries={stats['max_queries']:3d}  rss={stats['peak_rss_mb']:7.1f}MiB")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of `results` against `baseline`, as readable strings"""
+    regressions = []
+    for name, stats in results['endpoints'].items():
+        base = baseline['endpoints'].get(name)
+        if base is None:
+            continue
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if stats[key] > base[key] * (1 + tolerance):
+                regressions.append(f'{name}: {key} {base[key]:.2f} -> {stats[key]:.2f}')
+        if stats['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']:.1f} -> {stats['throughput_rps']:.1f} req/s")
+        # Query counts are deterministic, any increase is a regression
+        if stats['max_queries'] > base['max_queries']:
+            regressions.append(f"{name}: queries {base['max_queries']} -> {stats['max_queries']}")
+    if results['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append(f"peak RSS {baseline['peak_rss_mb']:.1f} -> {results['peak_rss_mb']:.1f} MiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--companies', type=int, default=10)
+    parser.add_argument('--departments', type=int, default=5, help='Departments per company.')
+    parser.add_argument('--employees', type=int, default=100, help='Employees per department.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=100, help='Measured requests per endpoint.')
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per endpoint.')
+    parser.add_argument('--import-rows', type=int, default=100, help='Rows per bulk import request.')
+    parser.add_argument('--only', action='append', help='Only run this URL name (can be repeated).')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare against the results in this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown, as a fraction.')
+    args = parser.parse_args()
+
+    setup_database()
+    results = run(args)
+    print(f"peak RSS {results['peak_rss_mb']:.1f} MiB")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline.')
+
+
+if __name__ == '__main__':
+    main()
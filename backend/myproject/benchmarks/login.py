@@ -0,0 +1,78 @@
+"""
+Login throughput (logins/sec) of the sync DRF login view driven from a
+thread pool, and of the async login view running on one event loop, at a
+fixed concurrency.
+
+    python -m benchmarks.login --users 50 --logins 200 --concurrency 16
+    DJANGO_PASSWORD_HASHER=scrypt python -m benchmarks.login
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup_database
+
+PASSWORD = 'benchmark-password'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    setup_database()
+
+    from django.conf import settings
+    from django.contrib.auth.hashers import make_password
+    from django.test import AsyncRequestFactory, Client
+    from rest_framework.authtoken.models import Token
+
+    from core_app import async_views
+    from core_app.models import User
+
+    encoded = make_password(PASSWORD)
+    users = User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com', password=encoded, role='employee')
+        for i in range(args.users)
+    )
+    # Tokens exist up front so that both variants only read from the database
+    Token.objects.bulk_create(Token(user=user, key=Token.generate_key()) for user in users)
+    emails = [users[i % len(users)].email for i in range(args.logins)]
+
+    def sync_login(email):
+        response = Client().post('/api/login/', {'email': email, 'password': PASSWORD})
+        assert response.status_code == 200, response.content
+
+    def run_sync():
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(sync_login, emails))
+
+    async def run_async():
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def login(email):
+            async with semaphore:
+                request = factory.post(
+                    '/api/login/', json.dumps({'email': email, 'password': PASSWORD}), content_type='application/json',
+                )
+                response = await async_views.login_view(request)
+                assert response.status_code == 200, response.content
+
+        await asyncio.gather(*(login(email) for email in emails))
+
+    print(f"hasher={settings.PASSWORD_HASHER} logins={args.logins} concurrency={args.concurrency} "
+          f"hash_workers={settings.LOGIN_HASH_WORKERS}")
+    for name, run in (('sync (WSGI view, threads)', run_sync), ('async (ASGI view)', lambda: asyncio.run(run_async()))):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<28} {args.logins / elapsed:8.1f} logins/sec  ({elapsed:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
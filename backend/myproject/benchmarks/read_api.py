@@ -0,0 +1,106 @@
+"""
+p50/p99 latency of the read endpoints served by the sync views through the
+WSGI handler (a thread per in-flight request, like a threaded WSGI server)
+and by the async views through the ASGI handler (one event loop), at a fixed
+concurrency.
+
+Each mode runs in a subprocess of its own because `DJANGO_ASYNC_API` decides
+at import time which views the URLs point to.
+
+    python -m benchmarks.read_api --employees 5000 --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODES = {'wsgi': '0', 'asgi': '1'}
+
+
+def run_mode(args):
+    """Seed a database, replay the request mix and print the stats as JSON."""
+    from benchmarks.common import create_employees, percentile, setup_database
+
+    setup_database()
+
+    from django.test import AsyncClient, Client
+    from rest_framework.authtoken.models import Token
+
+    from core_app.models import Employee, User
+
+    create_employees(args.employees, companies=5, departments=4)
+    user = User.objects.create(username='bench', email='bench@example.com', password='unused', role='admin')
+    headers = {'Authorization': f'Token {Token.objects.create(user=user).key}'}
+
+    employee_ids = list(Employee.objects.values_list('id', flat=True)[:200])
+    mix = ['/api/companies/', '/api/employees/?page_size=50&status=hired', '/api/departments/']
+    paths = [
+        mix[i % len(mix)] if i % 2 else f'/api/employees/{employee_ids[i % len(employee_ids)]}/'
+        for i in range(args.requests)
+    ]
+    timings = []
+
+    def sync_get(path):
+        start = time.perf_counter()
+        response = Client().get(path, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.content
+
+    async def run_async():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def get(path):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, response.content
+
+        await asyncio.gather(*(get(path) for path in paths))
+
+    start = time.perf_counter()
+    if args.mode == 'wsgi':
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(sync_get, paths))
+    else:
+        asyncio.run(run_async())
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'p50_ms': percentile(timings, 50),
+        'p99_ms': percentile(timings, 99),
+        'requests_per_sec': len(timings) / elapsed,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    print(f"employees={args.employees} requests={args.requests} concurrency={args.concurrency}")
+    for mode, async_api in MODES.items():
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.read_api', '--mode', mode, '--employees', str(args.employees),
+             '--requests', str(args.requests), '--concurrency', str(args.concurrency)],
+            env={**os.environ, 'DJANGO_ASYNC_API': async_api}, capture_output=True, text=True, check=True,
+        ).stdout
+        stats = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<6} p50={stats['p50_ms']:8.2f}ms  p99={stats['p99_ms']:8.2f}ms  "
+              f"{stats['requests_per_sec']:8.1f} req/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Latency of the employee search (`GET /api/employees/search/?q=`) over a large
+synthetic table, for type-ahead prefixes from one letter to whole names and
+for words of the email, designation and address, as an admin (every company)
+and as a manager (one company). Reports p50/p95 per query of the index
+lookup alone (`search.search_ids`) and of the whole request.
+
+    python -m benchmarks.search --employees 1000000
+"""
+import argparse
+import time
+
+from benchmarks.common import percentile, setup_database
+
+QUERIES = [
+    'j', 'ja', 'jan', 'jane', 'jane s', 'jane smi', 'jane smith', 'smith jane',
+    'garcia', 'maria.lopez', 'sofia.kim12345', 'harbour', '42 harbour', 'developer', 'support spec',
+    'zzz',
+]
+
+
+def run(args):
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+
+    from core_app import search
+    from core_app.models import User
+    from core_app.synthetic import create_companies, create_employees
+
+    start = time.perf_counter()
+    companies, departments = create_companies(args.companies, args.departments)
+    create_employees(departments, args.employees, seed=0, batch_size=10000)
+    print(f"employees={args.employees} companies={args.companies} seeded and indexed in "
+          f"{time.perf_counter() - start:.1f}s, requests={args.requests} per query")
+
+    users = {
+        'admin': User.objects.create(username='admin', email='admin@example.com', password='unused', role='admin'),
+        'manager': User.objects.create(
+            username='manager', email='manager@example.com', password='unused', role='manager', company=companies[0],
+        ),
+    }
+    client = Client()
+    for role, user in users.items():
+        headers = {'Authorization': f'Token {Token.objects.create(user=user).key}'}
+        print(f"\n{role}")
+        for query in QUERIES:
+            lookups, requests = [], []
+            for _ in range(args.requests):
+                begin = time.perf_counter()
+                ids = search.search_ids(user, query, 0, args.page_size)
+                lookups.append((time.perf_counter() - begin) * 1000)
+                begin = time.perf_counter()
+                response = client.get('/api/employees/search/', {'q': query, 'page_size': args.page_size}, headers=headers)
+                requests.append((time.perf_counter() - begin) * 1000)
+                assert response.status_code == 200, response.content
+            print(f"  {query!r:<18} results={len(ids):>3}  "
+                  f"lookup p50={percentile(lookups, 50):8.2f}ms p95={percentile(lookups, 95):8.2f}ms  "
+                  f"request p50={percentile(requests, 50):8.2f}ms p95={percentile(requests, 95):8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=1000000)
+    parser.add_argument('--companies', type=int, default=20)
+    parser.add_argument('--departments', type=int, default=10, help='Departments per company.')
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=20, help='Measured runs per query.')
+    args = parser.parse_args()
+
+    setup_database()
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
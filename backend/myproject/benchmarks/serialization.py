@@ -0,0 +1,65 @@
+"""
+Time to build the body of the full employee list (`GET /api/employees/`):
+model instances through `EmployeeSerializer` against the `values()` path,
+each rendered with DRF's stdlib JSONRenderer and with the orjson one. Every
+variant is checked to produce the same bytes.
+
+    python -m benchmarks.serialization --rows 10000 --rows 100000
+"""
+import argparse
+
+from benchmarks.common import create_employees, measure, report, setup_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, action='append', help='Employees (can be repeated, default 10k and 100k).')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_database()
+
+    from rest_framework import renderers
+
+    from core_app import renderers as fast_renderers
+    from core_app.models import Employee
+    from core_app.serializers import EmployeeSerializer
+
+    if fast_renderers.orjson is None:
+        raise SystemExit('orjson is not installed, the renderers would be the same.')
+
+    def employees():
+        return Employee.objects.with_days_employed().order_by('id')
+
+    def instances_data():
+        return EmployeeSerializer(employees(), many=True).data
+
+    def values_data():
+        return EmployeeSerializer.represent_values(employees().values(*EmployeeSerializer.value_names()))
+
+    variants = {
+        'instances + json': (instances_data, renderers.JSONRenderer()),
+        'instances + orjson': (instances_data, fast_renderers.JSONRenderer()),
+        'values + json': (values_data, renderers.JSONRenderer()),
+        'values + orjson': (values_data, fast_renderers.JSONRenderer()),
+    }
+
+    created = 0
+    for rows in sorted(args.rows or [10_000, 100_000]):
+        create_employees(rows - created, companies=10, departments=10)
+        created = rows
+
+        bodies = {name: renderer.render(build()) for name, (build, renderer) in variants.items()}
+        if len(set(bodies.values())) != 1:
+            raise SystemExit('The variants rendered different bytes.')
+
+        print(f"{rows} employees, {len(bodies['values + orjson']) / 1024 / 1024:.1f} MiB; fetch + serialize + render:")
+        for name, (build, renderer) in variants.items():
+            report(name, measure(lambda: renderer.render(build()), args.repeat))
+        data = instances_data()
+        report('render only, json', measure(lambda: variants['instances + json'][1].render(data), args.repeat))
+        report('render only, orjson', measure(lambda: variants['instances + orjson'][1].render(data), args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,112 @@
-from django.contrib import admin
+"""
+Admin panel. The changelists stay usable on large tables:
+
+- foreign keys shown in a list are joined in the same query
+  (`list_select_related`), and `raw_id_fields` keep the forms from rendering
+  a choice for every department;
+- searches are prefix matches on indexed columns (see `filters.prefix_filter`),
+  not `LIKE '%...%'` scans;
+- pagination counts at most EstimatedCountPaginator.exact_count_limit rows,
+  and the unfiltered total isn't counted again (`show_full_result_count`);
+- bulk actions and deletes are set-based (see transitions.py), with counters,
+  the change log and caches maintained as the model saves do.
+"""
+from functools import reduce
+from operator import or_
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.db import transaction
+
+from .filters import prefix_filter
 from .models import User, Company, Department, Employee
+from .pagination import EstimatedCountPaginator
+from .transitions import apply_transitions, delete_employees, move_employees
+
+
+class LeanModelAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Indexed columns matched by prefix, case-sensitively
+    search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(reduce(or_, (prefix_filter(field, search_term) for field in self.search_fields))), False
+
+    def delete_queryset(self, request, queryset):
+        # One object at a time, so that counters and the change log are maintained
+        with transaction.atomic():
+            for obj in queryset:
+                obj.delete()
+
+
+@admin.register(User)
+class UserAdmin(LeanModelAdmin):
+    list_display = ('email', 'username', 'role', 'company', 'is_staff')
+    list_select_related = ('company',)
+    list_filter = ('role', 'is_staff')
+    search_fields = ('email', 'username')
+    raw_id_fields = ('company',)
+
+
+@admin.register(Company)
+class CompanyAdmin(LeanModelAdmin):
+    list_display = ('name', 'num_departments', 'num_employees', 'updated_at')
+    search_fields = ('name',)
+    readonly_fields = ('num_departments', 'num_employees', 'version')
+
+
+@admin.register(Department)
+class DepartmentAdmin(LeanModelAdmin):
+    list_display = ('name', 'company', 'num_employees', 'updated_at')
+    list_select_related = ('company',)
+    list_filter = ('company',)
+    search_fields = ('name',)
+    raw_id_fields = ('company',)
+    readonly_fields = ('num_employees', 'version')
+
+
+class EmployeeActionForm(ActionForm):
+    department = forms.IntegerField(required=False, min_value=1, label='Department id')
+
+
+@admin.register(Employee)
+class EmployeeAdmin(LeanModelAdmin):
+    list_display = ('name', 'email', 'designation', 'status', 'company', 'department', 'hired_on')
+    # Department.__str__ shows its company's name
+    list_select_related = ('company', 'department__company')
+    list_filter = ('status', 'company')
+    search_fields = ('name', 'email')
+    raw_id_fields = ('company', 'department')
+    readonly_fields = ('hired_on', 'version')
+    action_form = EmployeeActionForm
+    actions = ['mark_hired', 'move_to_department']
+
+    @admin.action(description='Mark selected employees as hired')
+    def mark_hired(self, request, queryset):
+        ids = list(queryset.values_list('pk', flat=True))
+        results = apply_transitions([{'id': pk, 'status': 'hired'} for pk in ids])
+        updated = sum(result.get('result') == 'updated' for result in results)
+        skipped = sum('errors' in result for result in results)
+        self.message_user(request, f'{updated} employee(s) marked as hired.', messages.SUCCESS)
+        if skipped:
+            self.message_user(
+                request, f'{skipped} employee(s) skipped: only scheduled interviews can be hired.', messages.WARNING,
+            )
+
+    @admin.action(description='Move selected employees to the department id')
+    def move_to_department(self, request, queryset):
+        department_id = request.POST.get('department', '')
+        department = Department.objects.filter(pk=department_id).first() if department_id.isdigit() else None
+        if department is None:
+            self.message_user(request, 'Enter the id of an existing department to move them to.', messages.ERROR)
+            return
+        moved = move_employees(queryset, department)
+        self.message_user(request, f'{moved} employee(s) moved to {department.name}.', messages.SUCCESS)
 
-# Register the models in the admin panel
-admin.site.register(User)
-admin.site.register(Company)
-admin.site.register(Department)
-admin.site.register(Employee)
+    def delete_queryset(self, request, queryset):
+        delete_employees(queryset)
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core_app'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+
+        from .authentication import token_deleted, user_saved
+        from .instrumentation import install_query_recorder
+
+        # Count the queries of every connection for the per-request metrics
+        connection_created.connect(install_query_recorder, dispatch_uid='core_app.install_query_recorder')
+        # Keep the token cache in step with the users and tokens, whoever changes them
+        post_save.connect(user_saved, sender=settings.AUTH_USER_MODEL, dispatch_uid='core_app.user_saved')
+        post_delete.connect(token_deleted, sender=Token, dispatch_uid='core_app.token_deleted')
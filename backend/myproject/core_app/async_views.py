@@ -0,0 +1,209 @@
+"""
+Native async views, served when the project runs under ASGI (see
+`myproject/asgi.py` and the `ASYNC_API` setting).
+
+The read views have the same URLs, permissions and JSON output as their
+counterparts in `views`, but run on the event loop instead of being handed
+to a worker thread as a whole: a request waiting on the database or on a
+slow client doesn't tie up a thread. They only render JSON (no browsable API).
+"""
+import asyncio
+import json
+import weakref
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aauthenticate, get_user_model
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+
+from .authentication import CachedTokenAuthentication
+from .conditional import adetail_validators, alist_validators, conditional
+from .filters import filter_employees
+from .models import Company, Department, Employee
+from .renderers import JSONRenderer
+from .response_cache import cached_detail, cached_list, company_pk, department_company
+from .scoping import scope
+from .serializers import CompanySerializer, DepartmentSerializer, EmployeeSerializer, UserSerializer
+from .views import prepare_list, serialize_list
+
+User = get_user_model()
+
+# Roles allowed to read companies, departments and employees (IsAdminOrManagerOrEmployee)
+READ_ROLES = ('admin', 'manager', 'employee')
+
+_hash_slots = weakref.WeakKeyDictionary()
+
+
+def get_hash_slots():
+    """
+    The semaphore bounding the logins that check a password at once to
+    LOGIN_HASH_WORKERS. Hashing is deliberately slow CPU work; aauthenticate()
+    runs it on a thread, so the event loop keeps serving other requests, and
+    the semaphore keeps a login storm from hashing on a thread per request.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _hash_slots:
+        _hash_slots[loop] = asyncio.Semaphore(settings.LOGIN_HASH_WORKERS)
+    return _hash_slots[loop]
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+# async login view, same contract as views.login_view
+@csrf_exempt
+@require_POST
+async def login_view(request):
+    data = _request_data(request)
+    if not hasattr(data, 'get'):
+        return JsonResponse({'error': 'Malformed request body.'}, status=400)
+
+    email = data.get('email')
+    password = data.get('password')
+
+    if not email or not password:
+        return JsonResponse({'error': 'Email and password are required.'}, status=400)
+
+    # The authentication backends check the password (hashing it anyway for
+    # an unknown email, and upgrading an outdated hash) and send the signals
+    async with get_hash_slots():
+        user = await aauthenticate(request, username=email, password=password)
+    if user is None:
+        return JsonResponse({'error': 'Invalid credentials.'}, status=401)
+
+    # Get or create a token for the user
+    token, created = await Token.objects.aget_or_create(user=user)
+    return JsonResponse({'token': token.key, 'userRole': user.role, 'userId': user.id}, status=200)
+
+
+def render(data, status=200):
+    """The bytes DRF's JSONRenderer would produce for `data`"""
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def error_response(exc):
+    """Same status, body and headers as DRF's exception handling for `exc`"""
+    if isinstance(exc, Http404):
+        exc = exceptions.NotFound(*exc.args)
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = render(data, exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response.headers['WWW-Authenticate'] = CachedTokenAuthentication().authenticate_header(None)
+    elif isinstance(exc, exceptions.MethodNotAllowed):
+        response.headers['Allow'] = 'GET, HEAD'
+    return response
+
+
+def api_read_view(roles=None):
+    """
+    The async counterpart of `@api_view(['GET'])` plus `@permission_classes`:
+    token authentication, then a role check (any authenticated user when
+    `roles` is None). The view gets a DRF `Request` and returns a response.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            request = Request(request)
+            try:
+                if request.method not in ('GET', 'HEAD'):
+                    raise exceptions.MethodNotAllowed(request.method)
+                credentials = await CachedTokenAuthentication().aauthenticate(request)
+                if credentials is None:
+                    raise exceptions.NotAuthenticated()
+                request.user, request.auth = credentials
+                if roles is not None and request.user.role not in roles:
+                    raise exceptions.PermissionDenied()
+                return await view(request, *args, **kwargs)
+            except (exceptions.APIException, Http404) as exc:
+                return error_response(exc)
+        return inner
+    return decorator
+
+
+async def list_response(request, queryset, serializer_class, ordering=None):
+    """Async `views.list_response`"""
+    queryset, fields, paginator = prepare_list(request, queryset, serializer_class, ordering)
+    if not paginator.is_requested(request):
+        rows = [row async for row in queryset.aiterator()]
+        return render(serialize_list(rows, serializer_class, fields))
+
+    # The cursor paginator is synchronous; only the page query goes to a thread
+    page = await sync_to_async(paginator.paginate_queryset)(queryset, request)
+    return render(paginator.get_paginated_response(serialize_list(page, serializer_class, fields)).data)
+
+
+# view to get a specific user
+@api_read_view()
+async def get_user(request, id):
+    if id != request.user.pk and request.user.role != 'admin':
+        return render({"detail": "Not authorized to access this resource."}, 403)
+    try:
+        user = await User.objects.aget(pk=id)
+    except User.DoesNotExist:
+        return render({"detail": "User not found."}, 404)
+    return render(UserSerializer(user).data)
+
+
+# View to get a list of all companies
+@api_read_view(READ_ROLES)
+@cached_list('company-list')
+@conditional(alist_validators(lambda request: scope(Company.objects.all(), request.user)))
+async def company_list(request):
+    return await list_response(request, scope(Company.objects.all(), request.user), CompanySerializer)
+
+
+# View to get a single company
+@api_read_view(READ_ROLES)
+@cached_detail('company-detail', company_pk)
+@conditional(adetail_validators(lambda request: scope(Company.objects.all(), request.user)))
+async def company_detail(request, pk):
+    company = await aget_object_or_404(scope(Company.objects.all(), request.user), pk=pk)
+    return render(CompanySerializer(company).data)
+
+
+# View to list all departments
+@api_read_view(READ_ROLES)
+@cached_list('department-list')
+@conditional(alist_validators(lambda request: scope(Department.objects.all(), request.user)))
+async def department_list(request):
+    return await list_response(request, scope(Department.objects.all(), request.user), DepartmentSerializer)
+
+
+# View to get a single department
+@api_read_view(READ_ROLES)
+@cached_detail('department-detail', department_company)
+@conditional(adetail_validators(lambda request: scope(Department.objects.all(), request.user)))
+async def department_detail(request, pk):
+    department = await aget_object_or_404(scope(Department.objects.all(), request.user), pk=pk)
+    return render(DepartmentSerializer(department).data)
+
+
+# View to list all employees
+@api_read_view(READ_ROLES)
+@conditional(alist_validators(
+    lambda request: filter_employees(request, scope(Employee.objects.all(), request.user))[0], changes_daily=True,
+))
+async def employee_list(request):
+    employees, ordering = filter_employees(request, scope(Employee.objects.with_days_employed(), request.user))
+    return await list_response(request, employees, EmployeeSerializer, ordering)
+
+
+# View to get a single employee
+@api_read_view(READ_ROLES)
+@conditional(adetail_validators(lambda request: scope(Employee.objects.all(), request.user), changes_daily=True))
+async def employee_detail(request, pk):
+    employee = await aget_object_or_404(scope(Employee.objects.with_days_employed(), request.user), pk=pk)
+    return render(EmployeeSerializer(employee).data)
@@ -0,0 +1,129 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+
+def get_token_cache():
+    """
+    The cache holding token -> (user id, role, is_active, company id) entries.
+
+    `TOKEN_CACHE_ALIAS` names an entry of `CACHES`: a bounded in-process
+    LocMemCache (LRU with a TTL) by default, or a shared backend such as
+    Redis or Memcached when several processes must see invalidations.
+    """
+    return caches[settings.TOKEN_CACHE_ALIAS]
+
+
+def _cache_key(key):
+    # Don't use raw token keys as cache keys, they may end up in a shared cache.
+    # The version changes with the shape of the cached entries
+    return 'auth-token:v2:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token(key):
+    get_token_cache().delete(_cache_key(key))
+
+
+def invalidate_user_tokens(user):
+    """Drop the cached entries of every token belonging to `user`"""
+    keys = Token.objects.filter(user=user).values_list('key', flat=True)
+    get_token_cache().delete_many([_cache_key(key) for key in keys])
+
+
+# The user fields cached with a token
+CACHED_USER_FIELDS = {'role', 'is_active', 'company', 'company_id'}
+
+
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    `post_save` receiver for the user model: whatever saved it (the API,
+    the Django admin, a shell), a change of role, is_active or company
+    applies to the user's tokens right away instead of after TOKEN_CACHE_TTL.
+    """
+    if created or (update_fields is not None and not CACHED_USER_FIELDS & set(update_fields)):
+        # New users have no tokens; logins only update the password or last_login
+        return
+    invalidate_user_tokens(instance)
+
+
+def token_deleted(sender, instance, **kwargs):
+    """`post_delete` receiver for Token: logouts, and the tokens deleted with their user"""
+    invalidate_token(instance.key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that caches the token lookup.
+
+    A cache hit returns a User with only id, role, is_active and company_id
+    loaded (the other fields are deferred and fetched on first access), so
+    permission checks and company scoping don't query the database at all.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cache_key = _cache_key(key)
+        entry = cache.get(cache_key)
+
+        if entry is None:
+            entry = _token_entries(key).first()
+            if entry is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            cache.set(cache_key, entry, settings.TOKEN_CACHE_TTL)
+
+        return _credentials(key, entry)
+
+    async def aauthenticate(self, request):
+        """Async `authenticate()`, for the views in `async_views`"""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        elif len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.')
+            )
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        cache = get_token_cache()
+        cache_key = _cache_key(key)
+        entry = await cache.aget(cache_key)
+
+        if entry is None:
+            entry = await _token_entries(key).afirst()
+            if entry is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            await cache.aset(cache_key, entry, settings.TOKEN_CACHE_TTL)
+
+        return _credentials(key, entry)
+
+
+def _token_entries(key):
+    return Token.objects.filter(key=key).values_list('user_id', 'user__role', 'user__is_active', 'user__company_id')
+
+
+def _credentials(key, entry):
+    user_id, role, is_active, company_id = entry
+    if not is_active:
+        raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+    User = get_user_model()
+    loaded = {'id': user_id, 'role': role, 'is_active': is_active, 'company_id': company_id}
+    # from_db() expects the values in model field order
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]
+    user = User.from_db(DEFAULT_DB_ALIAS, field_names, [loaded[name] for name in field_names])
+    return (user, Token(key=key, user_id=user_id))
@@ -0,0 +1,208 @@
+import codecs
+import csv
+import json
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .instrumentation import extend_query_budget
+from .models import Change, Company, Department, Employee, Task, recount_denormalized_counters
+from .serializers import EmployeeImportSerializer
+from .versioning import company_changed
+
+# Rows validated and inserted per transaction
+IMPORT_BATCH_SIZE = 1000
+# Rows fetched from the database per round trip when exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# Bytes that weren't UTF-8 (decoded as surrogate escapes), and NULs
+UNDECODABLE_RE = re.compile('[\x00\udc80-\udcff]')
+
+EXPORT_COLUMNS = [
+    'id', 'company', 'department', 'status', 'name', 'email',
+    'mobile_number', 'address', 'designation', 'hired_on', 'days_employed',
+]
+
+
+class UnreadableFile(Exception):
+    """The upload's CSV header row can't be decoded as UTF-8 or parsed"""
+
+
+def _undecodable(values):
+    """Whether any of `values` kept bytes that aren't UTF-8 (as surrogate escapes) or a NUL"""
+    return any(isinstance(value, str) and UNDECODABLE_RE.search(value) for value in values)
+
+
+def read_rows(upload):
+    """
+    Lazily yield `(row_number, row)` pairs from an uploaded CSV or NDJSON file
+    in UTF-8, with or without a byte order mark (Excel writes one). Row
+    numbers are 1-based and count data rows only. Rows that can't be decoded
+    or parsed (another encoding, NUL bytes) are yielded as `(row_number, None)`;
+    a CSV header row that can't be raises UnreadableFile before any row.
+    """
+    name = (upload.name or '').lower()
+    is_ndjson = name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in (upload.content_type or '')
+    # Undecodable bytes are kept as surrogate escapes, so they spoil their row only
+    lines = codecs.iterdecode(upload, 'utf-8-sig', errors='surrogateescape')
+
+    if not is_ndjson:
+        reader = csv.DictReader(lines)
+        try:
+            header = reader.fieldnames
+        except csv.Error as exc:
+            raise UnreadableFile(str(exc))
+        if header and _undecodable(header):
+            raise UnreadableFile('The header row is not valid UTF-8.')
+        row_number = 0
+        while True:
+            row_number += 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error:
+                # The reader moves on to the next line
+                yield row_number, None
+                continue
+            if _undecodable(row.values()):
+                yield row_number, None
+                continue
+            # Empty cells mean "not provided" so that model defaults apply
+            yield row_number, {key: value for key, value in row.items() if key and value not in ('', None)}
+
+    row_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = None if _undecodable([line]) else json.loads(line)
+        except ValueError:
+            row = None
+        yield row_number, row if isinstance(row, dict) else None
+
+
+def import_employees(rows, batch_size=None, companies=None):
+    """
+    Validate and insert employees from `(row_number, row)` pairs in batches.
+    Rows may only reference the `companies` queryset (default: all of them).
+    Returns the number of created employees and a list of per-row errors.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    if companies is None:
+        companies = Company.objects.all()
+    created, errors, batch, batches = 0, [], [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            created += _import_batch(batch, errors, companies)
+            batch, batches = [], batches + 1
+    if batch:
+        created += _import_batch(batch, errors, companies)
+        batches += 1
+    # The query budget of the import view is per batch
+    extend_query_budget(batches - 1)
+    return created, errors
+
+
+def _import_batch(batch, errors, companies):
+    valid = []
+    for row_number, row in batch:
+        if row is None:
+            errors.append({'row': row_number, 'errors': {'non_field_errors': ['Row could not be parsed.']}})
+            continue
+        serializer = EmployeeImportSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((row_number, serializer.validated_data))
+        else:
+            errors.append({'row': row_number, 'errors': serializer.errors})
+    if not valid:
+        return 0
+
+    # Relations and email uniqueness are checked with one query each per batch
+    department_companies = dict(
+        Department.objects.filter(pk__in={data['department'] for _, data in valid}).values_list('id', 'company_id')
+    )
+    known_companies = set(
+        companies.filter(pk__in={data['company'] for _, data in valid}).values_list('id', flat=True)
+    )
+    taken_emails = set(
+        Employee.objects.filter(email__in={data['email'] for _, data in valid}).values_list('email', flat=True)
+    )
+
+    today = timezone.now().date()
+    employees, row_numbers = [], []
+    for row_number, data in valid:
+        row_errors = {}
+        if data['company'] not in known_companies:
+            row_errors['company'] = [f"Invalid pk \"{data['company']}\" - object does not exist."]
+        if data['department'] not in department_companies:
+            row_errors['department'] = [f"Invalid pk \"{data['department']}\" - object does not exist."]
+        elif department_companies[data['department']] != data['company']:
+            row_errors['department'] = ['Department must belong to the selected company.']
+        if data['email'] in taken_emails:
+            row_errors['email'] = ['employee with this email already exists.']
+        if row_errors:
+            errors.append({'row': row_number, 'errors': row_errors})
+            continue
+        taken_emails.add(data['email'])
+
+        data['company_id'] = data.pop('company')
+        data['department_id'] = data.pop('department')
+        # Imported hires keep their original hire date when one is given
+        if data.get('status') == 'hired' and not data.get('hired_on'):
+            data['hired_on'] = today
+        employees.append(Employee(**data))
+        row_numbers.append(row_number)
+
+    if not employees:
+        return 0
+    try:
+        with transaction.atomic():
+            Employee.objects.bulk_create(employees)
+            Change.record(('employee', employee.pk, employee.company_id, 'create') for employee in employees)
+            # bulk_create skips save(), so recount the affected companies once
+            company_ids = {employee.company_id for employee in employees}
+            deferred = settings.COUNTER_UPDATES == 'deferred'
+            if deferred:
+                # The recount also rebuilds the snapshots
+                Task.enqueue('recount_company', company_ids)
+            else:
+                recount_denormalized_counters(company_ids)
+            for company_id in company_ids:
+                company_changed(company_id, snapshot=not deferred)
+    except IntegrityError as exc:
+        errors.extend({'row': row_number, 'errors': {'non_field_errors': [str(exc)]}} for row_number in row_numbers)
+        return 0
+    return len(employees)
+
+
+class Echo:
+    """A pseudo-buffer whose write() returns the value, for streaming csv.writer output"""
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset):
+    """
+    Yield employee rows as tuples in `EXPORT_COLUMNS` order, a chunk at a time.
+    `queryset` must be annotated with `with_days_employed()`.
+    """
+    columns = ['id', 'company_id', 'department_id', 'status', 'name', 'email',
+               'mobile_number', 'address', 'designation', 'hired_on', 'days_employed']
+    yield from queryset.values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def stream_csv(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in export_rows(queryset):
+        yield writer.writerow(row)
+
+
+def stream_ndjson(queryset):
+    for row in export_rows(queryset):
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str) + '\n'
@@ -0,0 +1,138 @@
+"""
+Incremental sync from the change log. Every create, update and delete of a
+company, department or employee appends a Change entry in the writer's
+transaction, numbered by an increasing `seq`: creates and deletes with
+`Change.record`, updates by a trigger on the UPDATE itself, so that a write
+path can't forget them and a plain update stays one statement.
+
+Readers only see the settled entries, the ones whose lower `seq`s were all
+committed or rolled back, so a client never moves past an entry that commits
+later. SQLite serializes writers, every committed entry is settled. On
+PostgreSQL writers don't wait for each other: an entry is settled once the
+oldest transaction still in progress (`pg_snapshot_xmin`) isn't older than
+its `horizon`, the first transaction id not yet handed out when it was
+written (see Change.record), and so is everything before it.
+
+`GET /api/changes/?since=<seq>` reads the entries after `seq`, at most
+`limit` of them, and compacts them: each changed row is sent once, with its
+current representation (as in the lists) when it still exists, or its id
+among the deletes. Clients apply a batch and ask again with `since=<next>`
+while `has_more` is true, so staying current costs O(changes) instead of
+re-downloading O(table). Cascades aren't logged row by row: a deleted
+company stands for its departments and employees, a deleted department for
+its employees.
+
+Entries older than CHANGE_LOG_RETENTION_DAYS are pruned by `manage.py
+prune_changes`; a client whose `since` is older than the oldest entry kept
+gets 410 Gone and downloads the lists again.
+"""
+from django.db import connections, router
+from django.db.models import BooleanField, Exists, Max, Min, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+from rest_framework import serializers
+
+from .models import Change, Company, Department, Employee
+from .scoping import company_ids, scope
+from .serializers import CompanySerializer, DepartmentSerializer, EmployeeSerializer, ValuesRepresentationMixin
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+# Change.kind -> (response key, the rows, their serializer)
+RESOURCES = {
+    'company': ('companies', Company.objects.all, CompanySerializer),
+    'department': ('departments', Department.objects.all, DepartmentSerializer),
+    'employee': ('employees', Employee.objects.with_days_employed, EmployeeSerializer),
+}
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_LIMIT, default=DEFAULT_LIMIT)
+
+
+class ChangesPruned(Exception):
+    """The entries right after `since` were pruned, `args[0]` is the oldest one kept"""
+
+
+def _settled(entries):
+    """`entries` without those after the latest settled entry"""
+    if connections[router.db_for_read(Change)].vendor != 'postgresql':
+        return entries
+    latest = Change.objects.alias(
+        settled=RawSQL('horizon <= pg_snapshot_xmin(pg_current_snapshot())', [], output_field=BooleanField()),
+    ).filter(settled=True).order_by('-seq').values('seq')[:1]
+    # In the same statement, so both parts see the same snapshot
+    return entries.filter(seq__lte=Subquery(latest))
+
+
+def head():
+    """The `seq` of the latest settled entry, 0 when there is none"""
+    return _settled(Change.objects.all()).aggregate(seq=Max('seq'))['seq'] or 0
+
+
+def _representations(queryset, serializer_class):
+    if issubclass(serializer_class, ValuesRepresentationMixin):
+        return serializer_class.represent_values(queryset.values(*serializer_class.value_names()))
+    return serializer_class(queryset, many=True).data
+
+
+def read_changes(user, since, limit=DEFAULT_LIMIT):
+    """
+    The next batch of changes after `since` that `user` may see. Raises
+    ChangesPruned when some of them were pruned.
+    """
+    oldest = Change.objects.aggregate(seq=Min('seq'))['seq']
+    if oldest is not None and since < oldest - 1:
+        raise ChangesPruned(oldest)
+
+    entries = _settled(Change.objects.filter(seq__gt=since)).order_by('seq')
+    ids = company_ids(user)
+    if ids is not None:
+        entries = entries.filter(company_id__in=ids)
+    entries = list(entries.values_list('seq', 'kind', 'object_id', 'action')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}  # (kind, object_id) -> action of its last entry
+    for seq, kind, object_id, action in entries:
+        latest[kind, object_id] = action
+
+    result = {'since': since, 'next': entries[-1][0] if entries else since, 'has_more': has_more}
+    for kind, (name, get_queryset, serializer_class) in RESOURCES.items():
+        upserts = [pk for (entry_kind, pk), action in latest.items() if entry_kind == kind and action != 'delete']
+        deletes = {pk for (entry_kind, pk), action in latest.items() if entry_kind == kind and action == 'delete'}
+        rows = []
+        if upserts:
+            rows = _representations(scope(get_queryset(), user).filter(pk__in=upserts).order_by('id'), serializer_class)
+            # Deleted or moved to another company after the entry (a later entry says so too)
+            deletes.update(set(upserts) - {row['id'] for row in rows})
+        result[name] = {'upserts': rows, 'deletes': sorted(deletes)}
+    return result
+
+
+def prune(before):
+    """
+    Delete the entries made before `before`, but not the latest one: the
+    oldest entry kept tells how far back clients can sync. Returns the
+    number of entries deleted.
+    """
+    cutoff = Change.objects.filter(changed_at__lt=before).aggregate(seq=Max('seq'))['seq']
+    if cutoff is None:
+        return 0
+    # Everything up to the cutoff, so what is kept has no holes
+    return Change.objects.filter(seq__lte=min(cutoff, head() - 1)).delete()[0]
+
+
+def compact():
+    """
+    Delete the entries followed by a newer one for the same row and company.
+    Syncing from any `since` still gives the same result, as only the last
+    entry of a row counts, but the history they recorded is lost. The oldest
+    entry is kept. Returns the number of entries deleted.
+    """
+    newer = Change.objects.filter(
+        kind=OuterRef('kind'), object_id=OuterRef('object_id'), company_id=OuterRef('company_id'), seq__gt=OuterRef('seq'),
+    )
+    oldest = Change.objects.aggregate(seq=Min('seq'))['seq']
+    return Change.objects.filter(Exists(newer)).exclude(seq=oldest).delete()[0]
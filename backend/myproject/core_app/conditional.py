@@ -0,0 +1,188 @@
+"""
+Conditional GET support (ETag / Last-Modified) for the read endpoints.
+
+Validators are computed from the `updated_at` columns with a cheap query, so
+a client that already has the current representation gets a 304 before the
+view fetches and serializes anything. Details have an ETag and a
+Last-Modified, lists only an ETag (see `list_validators`).
+
+Updates are conditional on the `version` a client edited instead, sent as
+`If-Match` (see `requested_version` and views.versioned_update).
+"""
+import hashlib
+from calendar import timegm
+from datetime import datetime, time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import serializers
+
+from .scoping import scope_key
+
+
+def make_etag(*parts):
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def start_of_today():
+    """Representations that include days_employed change at midnight even if no row did"""
+    return timezone.make_aware(datetime.combine(timezone.now().date(), time.min), timezone.get_current_timezone())
+
+
+def _check_preconditions(request, etag, last_modified):
+    """Returns the quoted ETag, the Last-Modified timestamp and a 304/412 response or None"""
+    etag = quote_etag(etag) if etag else None
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    return etag, timestamp, get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def _add_validators(response, etag, timestamp):
+    if response.status_code in (200, 304):
+        if timestamp is not None and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(timestamp)
+        if etag and not response.has_header('ETag'):
+            response.headers['ETag'] = etag
+    return response
+
+
+def conditional(get_validators):
+    """
+    Like django.views.decorators.http.condition, but with a single function
+    returning `(etag, last_modified)` so both come from one query. When it
+    returns `(None, None)` (e.g. the object doesn't exist) the view runs as usual.
+
+    Async views take async validators (`adetail_validators`, `alist_validators`).
+    """
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def ainner(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await func(request, *args, **kwargs)
+
+                etag, last_modified = await get_validators(request, *args, **kwargs)
+                if etag is None and last_modified is None:
+                    return await func(request, *args, **kwargs)
+
+                etag, timestamp, response = _check_preconditions(request, etag, last_modified)
+                if response is None:
+                    response = await func(request, *args, **kwargs)
+                return _add_validators(response, etag, timestamp)
+            return ainner
+
+        @wraps(func)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return func(request, *args, **kwargs)
+
+            etag, last_modified = get_validators(request, *args, **kwargs)
+            if etag is None and last_modified is None:
+                return func(request, *args, **kwargs)
+
+            etag, timestamp, response = _check_preconditions(request, etag, last_modified)
+            if response is None:
+                response = func(request, *args, **kwargs)
+            return _add_validators(response, etag, timestamp)
+        return inner
+    return decorator
+
+
+def _detail_validators(model, request, pk, updated_at, changes_daily):
+    # No scope in the ETag: a row is the same for everyone allowed to see it
+    if updated_at is None:
+        return None, None
+    parts = [model._meta.label, pk, updated_at.isoformat(), request.META.get('QUERY_STRING', '')]
+    if changes_daily:
+        today = start_of_today()
+        parts.append(today.date())
+        updated_at = max(updated_at, today)
+    return make_etag(*parts), updated_at
+
+
+def detail_validators(get_queryset, changes_daily=False):
+    """
+    Validators for a single row: its `updated_at`. `get_queryset(request)`
+    returns the rows the user may see; for others there are no validators.
+    """
+    def get_validators(request, pk):
+        queryset = get_queryset(request)
+        updated_at = queryset.filter(pk=pk).values_list('updated_at', flat=True).first()
+        return _detail_validators(queryset.model, request, pk, updated_at, changes_daily)
+    return get_validators
+
+
+def adetail_validators(get_queryset, changes_daily=False):
+    """Async `detail_validators`"""
+    async def get_validators(request, pk):
+        queryset = get_queryset(request)
+        updated_at = await queryset.filter(pk=pk).values_list('updated_at', flat=True).afirst()
+        return _detail_validators(queryset.model, request, pk, updated_at, changes_daily)
+    return get_validators
+
+
+def _list_validators(model, request, stats, changes_daily):
+    latest = stats['latest']
+    # Users with different scopes can get lists with the same count and latest change
+    parts = [model._meta.label, scope_key(request.user), stats['count'], latest.isoformat() if latest else '',
+             request.META.get('QUERY_STRING', '')]
+    if changes_daily:
+        parts.append(start_of_today().date())
+    # No Last-Modified: deleting a row, or moving it out of the list, doesn't
+    # move MAX(updated_at), so If-Modified-Since would answer a stale 304
+    return make_etag(*parts), None
+
+
+def list_validators(get_queryset, changes_daily=False):
+    """
+    Validators for a list: an ETag of `MAX(updated_at)` plus `COUNT(*)` of
+    the rows it would return, so edits, inserts and deletes all change it.
+    Lists have no Last-Modified. `get_queryset(request)` returns the (scoped
+    and filtered) queryset.
+    """
+    def get_validators(request):
+        queryset = get_queryset(request)
+        stats = queryset.order_by().aggregate(count=Count('pk'), latest=Max('updated_at'))
+        return _list_validators(queryset.model, request, stats, changes_daily)
+    return get_validators
+
+
+def alist_validators(get_queryset, changes_daily=False):
+    """Async `list_validators`; `get_queryset(request)` itself stays synchronous (it doesn't query)"""
+    async def get_validators(request):
+        queryset = get_queryset(request)
+        stats = await queryset.order_by().aaggregate(count=Count('pk'), latest=Max('updated_at'))
+        return _list_validators(queryset.model, request, stats, changes_daily)
+    return get_validators
+
+
+def requested_version(request):
+    """
+    The version of the row a client based its update on: the `If-Match`
+    header (`If-Match: "3"`), else the `version` field of the body. None when
+    it sent neither, or `If-Match: *`. Raises a ValidationError when it isn't
+    a single version number.
+    """
+    header = request.META.get('HTTP_IF_MATCH')
+    if header is not None:
+        if header.strip() == '*':
+            return None
+        # Also unquoted (`If-Match: 3`), as sent by hand
+        etags = parse_etags(header) or [header.strip()]
+        value = etags[0].strip('"') if len(etags) == 1 else None
+        source = 'If-Match'
+    else:
+        value = request.data.get('version') if hasattr(request.data, 'get') else None
+        if value is None:
+            return None
+        source = 'version'
+    try:
+        version = int(value)
+    except (TypeError, ValueError):
+        version = None
+    if version is None or version < 1:
+        raise serializers.ValidationError({source: ['Must be the version number of the row, e.g. "3".']})
+    return version
@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Employee
+
+
+class EmployeeFilterSerializer(serializers.Serializer):
+    """
+    Validates the query parameters accepted by the employee list endpoint.
+
+    Every filter maps onto an indexed column (see `Employee.Meta.indexes`), so
+    the database can answer it without scanning the whole table.
+    """
+    ORDERING_FIELDS = ['id', 'name', 'status', 'designation', 'hired_on', 'days_employed']
+
+    company = serializers.IntegerField(required=False, min_value=1)
+    department = serializers.IntegerField(required=False, min_value=1)
+    status = serializers.ChoiceField(choices=Employee.EMPLOYEE_STATUS, required=False)
+    designation = serializers.CharField(required=False, max_length=100)
+    hired_on_after = serializers.DateField(required=False)
+    hired_on_before = serializers.DateField(required=False)
+    min_days_employed = serializers.IntegerField(required=False, min_value=0)
+    max_days_employed = serializers.IntegerField(required=False, min_value=0)
+    search = serializers.CharField(required=False, max_length=100)
+    ordering = serializers.ChoiceField(
+        choices=ORDERING_FIELDS + [f'-{name}' for name in ORDERING_FIELDS],
+        required=False,
+    )
+
+    def validate(self, data):
+        after, before = data.get('hired_on_after'), data.get('hired_on_before')
+        if after and before and after > before:
+            raise serializers.ValidationError('hired_on_after must not be later than hired_on_before.')
+        return data
+
+
+def prefix_filter(field, value):
+    """
+    Prefix match written as a range (`field >= value AND field < value + U+10FFFF`)
+    so that it can use a plain b-tree index on both SQLite and PostgreSQL,
+    unlike `LIKE 'value%'`. U+10FFFF is the highest code point, so values
+    continuing with an emoji or another character beyond U+FFFF match too.
+    Matching is case-sensitive.
+    """
+    return Q(**{f'{field}__gte': value, f'{field}__lt': value + chr(0x10FFFF)})
+
+
+def filter_employees(request, queryset):
+    """
+    Apply the validated employee filters to `queryset`.
+
+    Returns the filtered queryset and the requested ordering (or None). The
+    ordering ends with `id`, so that ties have a fixed order and the cursor
+    (see `pagination.KeysetCursorPagination`) can position on any row.
+    """
+    params = EmployeeFilterSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    data = params.validated_data
+
+    if 'company' in data:
+        queryset = queryset.filter(company_id=data['company'])
+    if 'department' in data:
+        queryset = queryset.filter(department_id=data['department'])
+    if 'status' in data:
+        queryset = queryset.filter(status=data['status'])
+    if 'designation' in data:
+        queryset = queryset.filter(designation=data['designation'])
+    if 'hired_on_after' in data:
+        queryset = queryset.filter(hired_on__gte=data['hired_on_after'])
+    if 'hired_on_before' in data:
+        queryset = queryset.filter(hired_on__lte=data['hired_on_before'])
+    # Tenure bounds are rewritten as bounds on hired_on so they can use its index.
+    # Employees without hired_on have 0 days employed.
+    today = timezone.now().date()
+    if data.get('min_days_employed'):
+        queryset = queryset.filter(hired_on__lte=today - timedelta(days=data['min_days_employed']))
+    if 'max_days_employed' in data:
+        queryset = queryset.filter(
+            Q(hired_on__gte=today - timedelta(days=data['max_days_employed'])) | Q(hired_on__isnull=True)
+        )
+    if data.get('search'):
+        queryset = queryset.filter(prefix_filter('name', data['search']) | prefix_filter('email', data['search']))
+
+    ordering = data.get('ordering')
+    if ordering is None:
+        return queryset, None
+    if ordering.lstrip('-') == 'id':
+        return queryset, (ordering,)
+    return queryset, (ordering, 'id')
@@ -0,0 +1,200 @@
+"""
+Per-request metrics: SQL query count, database time, serialization time and
+response size, collected by `middleware.InstrumentationMiddleware`.
+
+Queries are counted by an execute wrapper installed on every database
+connection when it is opened. It records into the metrics of the request
+bound to the current context, which asgiref carries into the threads async
+views run their queries on.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more queries than its QUERY_BUDGETS entry allows"""
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        # How many times over the view's query budget is allowed (see extend_query_budget)
+        self.budget_units = 1
+        self._serializing = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+@contextmanager
+def collect():
+    """Bind fresh metrics to the current context for the duration of the block"""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper (see `connection.execute_wrappers`) counting queries and their time"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """`connection_created` receiver"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed_serialization():
+    """Add the time spent in the block to the current request's serialization time"""
+    metrics = _current.get()
+    if metrics is None or metrics._serializing:
+        # Nested serializers are already inside the outer one's timing
+        yield
+        return
+    metrics._serializing += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._serializing -= 1
+        metrics.serialization_time += time.perf_counter() - start
+
+
+def extend_query_budget(units=1):
+    """
+    Allow the current request its view's query budget `units` more times:
+    for an update retried on a version conflict, or each further batch of
+    an import, which run the same queries again.
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.budget_units += units
+
+
+def check_query_budget(view_name, queries, units=1):
+    """Log, or raise with QUERY_BUDGET_ACTION = 'raise', when `view_name` went over `units` times its budget"""
+    budget = settings.QUERY_BUDGETS.get(view_name)
+    if budget is None or queries <= budget * units:
+        return
+    BUDGET_EXCEEDED.inc(view_name)
+    message = f'{view_name} ran {queries} queries, its budget is {budget}'
+    if units > 1:
+        message += f' ({budget * units} for {units} attempts or batches)'
+    if settings.QUERY_BUDGET_ACTION == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class Histogram:
+    """A Prometheus histogram per view, kept in process memory"""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view, value):
+        with self._lock:
+            counts, total = self._series.get(view, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[view] = (counts, total + value)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((view, list(counts), total) for view, (counts, total) in self._series.items())
+        for view, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{self.name}_bucket{{view="{view}",le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {total:g}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, view):
+        with self._lock:
+            self._values[view] = self._values.get(view, 0) + 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{{view="{view}"}} {value}' for view, value in values)
+        return lines
+
+
+SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_DURATION = Histogram('core_app_request_duration_seconds', 'Time to produce the response.', SECONDS)
+REQUEST_QUERIES = Histogram('core_app_request_queries', 'SQL queries per request.', (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+REQUEST_DB_TIME = Histogram('core_app_request_db_seconds', 'Time spent executing SQL per request.', SECONDS)
+REQUEST_SERIALIZATION_TIME = Histogram(
+    'core_app_request_serialization_seconds', 'Time spent serializing and rendering per request.', SECONDS,
+)
+RESPONSE_SIZE = Histogram(
+    'core_app_response_size_bytes', 'Response body size (streaming responses excluded).',
+    (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+BUDGET_EXCEEDED = Counter('core_app_query_budget_exceeded_total', 'Requests that went over their query budget.')
+RESPONSE_CACHE_HITS = Counter('core_app_response_cache_hits_total', 'Responses served from the response cache.')
+RESPONSE_CACHE_MISSES = Counter(
+    'core_app_response_cache_misses_total', 'Cacheable responses that had to be rendered by the view.',
+)
+
+METRICS = (
+    REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_TIME, REQUEST_SERIALIZATION_TIME, RESPONSE_SIZE, BUDGET_EXCEEDED,
+    RESPONSE_CACHE_HITS, RESPONSE_CACHE_MISSES,
+)
+
+
+def observe(view_name, metrics, response):
+    REQUEST_DURATION.observe(view_name, metrics.elapsed)
+    REQUEST_QUERIES.observe(view_name, metrics.queries)
+    REQUEST_DB_TIME.observe(view_name, metrics.db_time)
+    REQUEST_SERIALIZATION_TIME.observe(view_name, metrics.serialization_time)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(view_name, len(response.content))
+
+
+def expose():
+    """The metrics in the Prometheus text exposition format"""
+    return '\n'.join(line for metric in METRICS for line in metric.expose()) + '\n'
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core_app import changelog
+
+
+class Command(BaseCommand):
+    help = "Delete change log entries older than the retention period, see core_app/changelog.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.CHANGE_LOG_RETENTION_DAYS,
+            help='Keep this many days of entries (default CHANGE_LOG_RETENTION_DAYS).',
+        )
+        parser.add_argument(
+            '--compact', action='store_true',
+            help='Also delete the entries followed by a newer one for the same row; sync results stay the same.',
+        )
+
+    def handle(self, *args, **options):
+        pruned = changelog.prune(timezone.now() - timedelta(days=options['days']))
+        message = f"Pruned {pruned} entries"
+        if options['compact']:
+            message += f", compacted {changelog.compact()}"
+        self.stdout.write(self.style.SUCCESS(f"{message}."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core_app import search
+
+
+class Command(BaseCommand):
+    help = "Create the employee search index if it is missing and rebuild it, see core_app/search.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='The database to rebuild the index in.')
+
+    def handle(self, *args, **options):
+        search.rebuild(connections[options['database']])
+        self.stdout.write(self.style.SUCCESS("Rebuilt the employee search index."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from django.db import transaction
+
+from core_app.models import recount_denormalized_counters
+from core_app.versioning import company_changed
+
+
+class Command(BaseCommand):
+    help = "Recompute the num_departments/num_employees counters of every company and department."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company', type=int, action='append', dest='company_ids',
+            help='Only recount this company id (can be repeated).',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            company_ids, department_ids = recount_denormalized_counters(options['company_ids'])
+            # Cached summaries and responses show the counters, only the corrected ones are outdated
+            for company_id in company_ids:
+                company_changed(company_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"Corrected the counters of {len(company_ids)} companies ({len(department_ids)} departments)."
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core_app.tasks import run_pending
+
+
+class Command(BaseCommand):
+    help = "Run the queued background tasks (see core_app/tasks.py), polling for new ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no task is left.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Tasks claimed at a time.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when idle.')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                close_old_connections()
+                count = run_pending(options['batch_size'])
+                if count:
+                    self.stdout.write(f"Ran {count} jobs.")
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core_app.synthetic import seed_synthetic_data
+
+
+class Command(BaseCommand):
+    help = "Create synthetic companies x departments x employees for load tests and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=10)
+        parser.add_argument('--departments', type=int, default=5, help='Departments per company.')
+        parser.add_argument('--employees', type=int, default=100, help='Employees per department.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data.')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per INSERT.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        companies, departments = seed_synthetic_data(
+            options['companies'], options['departments'], options['employees'],
+            seed=options['seed'], batch_size=options['batch_size'],
+        )
+        employees = len(departments) * options['employees']
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(companies)} companies, {len(departments)} departments and {employees} employees "
+            f"in {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core_app.routers import PRIMARY
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary database into the SQLite read replicas (DATABASE_REPLICAS) with SQLite's "
+        "online backup, standing in for replication in local setups. See core_app/routers.py."
+    )
+
+    def handle(self, *args, **options):
+        primary = connections[PRIMARY]
+        if primary.vendor != 'sqlite':
+            raise CommandError('The primary database is not SQLite, its replicas are kept current by replication.')
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if connections[alias].vendor == 'sqlite']
+        if not replicas:
+            raise CommandError('No SQLite read replica is configured, see DJANGO_DB_REPLICAS.')
+
+        primary.ensure_connection()
+        for alias in replicas:
+            # Replicas are opened with mode=rw, which doesn't create a missing file
+            target = sqlite3.connect(str(connections[alias].settings_dict['NAME']).replace('mode=rw', 'mode=rwc'), uri=True)
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f"Copied the primary database into {alias}."))
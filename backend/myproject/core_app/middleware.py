@@ -0,0 +1,98 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+from . import instrumentation, routers
+
+
+class InstrumentationMiddleware:
+    """
+    Record SQL query count, database time, serialization time and response
+    size for every request, per view (URL name). They are added to the
+    response as a `Server-Timing` header, aggregated into the histograms
+    served by the metrics view, and the query count is checked against the
+    view's entry in QUERY_BUDGETS.
+
+    Works natively under both WSGI and ASGI, so it adds no thread hop to
+    async views. Put it first so its timing covers the other middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with instrumentation.collect() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        with instrumentation.collect() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unmatched'
+        response.headers['Server-Timing'] = ', '.join((
+            f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+            f'serialize;dur={metrics.serialization_time * 1000:.2f}',
+            f'total;dur={metrics.elapsed * 1000:.2f}',
+        ))
+        instrumentation.observe(view_name, metrics, response)
+        instrumentation.check_query_budget(view_name, metrics.queries, metrics.budget_units)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets the reads of GET, HEAD and OPTIONS requests go to the read replicas
+    (see routers.py). Other requests read from the primary throughout, and so
+    do a user's requests for REPLICA_LAG seconds after one of them wrote: a
+    flag in the default cache, keyed by the authenticated user, so the user
+    reads their own writes while the replicas catch up. It works for token
+    clients, which keep no cookies.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        with routers.request_routing(self.reads_primary(request), request) as routing:
+            response = self.get_response(request)
+        user_id = self.writer_id(request, routing)
+        if user_id is not None:
+            cache.set(routers.pin_key(user_id), True, settings.REPLICA_LAG)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        with routers.request_routing(self.reads_primary(request), request) as routing:
+            response = await self.get_response(request)
+        user_id = self.writer_id(request, routing)
+        if user_id is not None:
+            await cache.aset(routers.pin_key(user_id), True, settings.REPLICA_LAG)
+        return response
+
+    @staticmethod
+    def reads_primary(request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS')
+
+    @staticmethod
+    def writer_id(request, routing):
+        """The user whose reads go to the primary for a while, when the request wrote"""
+        return routers.request_user_id(request) if routing.wrote else None
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0002_employee_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='employee',
+            name='days_employed',
+        ),
+    ]
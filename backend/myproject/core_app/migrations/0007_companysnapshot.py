@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0006_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanySnapshot',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='core_app.company')),
+                ('body', models.BinaryField()),
+                ('built_at', models.DateTimeField()),
+            ],
+        ),
+    ]
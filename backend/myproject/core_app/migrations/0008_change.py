@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0007_companysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('company_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=6)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company_id', 'seq'], name='change_company_seq_idx'), models.Index(fields=['kind', 'object_id', 'company_id', 'seq'], name='change_object_idx'), models.Index(fields=['changed_at'], name='change_changed_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+from django.db import migrations
+
+# The schema as of this migration, see core_app/search.py for the current one
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_app_employee_search USING fts5(
+        name, email, designation, address, company_id,
+        content='core_app_employee', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_app_employee_search_insert AFTER INSERT ON core_app_employee BEGIN
+        INSERT INTO core_app_employee_search (rowid, name, email, designation, address, company_id)
+        VALUES (new.id, new.name, new.email, new.designation, new.address, new.company_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_app_employee_search_delete AFTER DELETE ON core_app_employee BEGIN
+        INSERT INTO core_app_employee_search (core_app_employee_search, rowid, name, email, designation, address, company_id)
+        VALUES ('delete', old.id, old.name, old.email, old.designation, old.address, old.company_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_app_employee_search_update
+    AFTER UPDATE OF name, email, designation, address, company_id ON core_app_employee BEGIN
+        INSERT INTO core_app_employee_search (core_app_employee_search, rowid, name, email, designation, address, company_id)
+        VALUES ('delete', old.id, old.name, old.email, old.designation, old.address, old.company_id);
+        INSERT INTO core_app_employee_search (rowid, name, email, designation, address, company_id)
+        VALUES (new.id, new.name, new.email, new.designation, new.address, new.company_id);
+    END
+    """,
+    # Index the existing rows
+    "INSERT INTO core_app_employee_search (core_app_employee_search) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS core_app_employee_search_insert",
+    "DROP TRIGGER IF EXISTS core_app_employee_search_delete",
+    "DROP TRIGGER IF EXISTS core_app_employee_search_update",
+    "DROP TABLE IF EXISTS core_app_employee_search",
+]
+
+# PostgreSQL computes the generated column of the existing rows when adding it
+POSTGRESQL_SCHEMA = [
+    """
+    ALTER TABLE core_app_employee ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', name), 'A')
+        || setweight(to_tsvector('simple', translate(email, '@.', '  ')), 'B')
+        || setweight(to_tsvector('simple', designation), 'C')
+        || setweight(to_tsvector('simple', address), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS employee_search_idx ON core_app_employee USING gin (search_vector)",
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS employee_search_idx",
+    "ALTER TABLE core_app_employee DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        with schema_editor.connection.cursor() as cursor:
+            for statement in statements.get(schema_editor.connection.vendor, []):
+                cursor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0008_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_SCHEMA, 'postgresql': POSTGRESQL_SCHEMA}),
+            run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+# SQLite adds and removes a column by rebuilding the table, which drops its
+# triggers: the search index triggers of 0009_employee_search are created
+# again after the columns are added, and after they are removed when reversing
+SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS core_app_employee_search_insert AFTER INSERT ON core_app_employee BEGIN
+        INSERT INTO core_app_employee_search (rowid, name, email, designation, address, company_id)
+        VALUES (new.id, new.name, new.email, new.designation, new.address, new.company_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_app_employee_search_delete AFTER DELETE ON core_app_employee BEGIN
+        INSERT INTO core_app_employee_search (core_app_employee_search, rowid, name, email, designation, address, company_id)
+        VALUES ('delete', old.id, old.name, old.email, old.designation, old.address, old.company_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_app_employee_search_update
+    AFTER UPDATE OF name, email, designation, address, company_id ON core_app_employee BEGIN
+        INSERT INTO core_app_employee_search (core_app_employee_search, rowid, name, email, designation, address, company_id)
+        VALUES ('delete', old.id, old.name, old.email, old.designation, old.address, old.company_id);
+        INSERT INTO core_app_employee_search (rowid, name, email, designation, address, company_id)
+        VALUES (new.id, new.name, new.email, new.designation, new.address, new.company_id);
+    END
+    """,
+]
+DROP_SEARCH_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS core_app_employee_search_insert",
+    "DROP TRIGGER IF EXISTS core_app_employee_search_delete",
+    "DROP TRIGGER IF EXISTS core_app_employee_search_update",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            with schema_editor.connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0009_employee_search'),
+    ]
+
+    operations = [
+        # Reversed last, once the columns are removed
+        migrations.RunPython(migrations.RunPython.noop, run(SEARCH_TRIGGERS)),
+        migrations.AddField(
+            model_name='company',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(run(SEARCH_TRIGGERS), run(DROP_SEARCH_TRIGGERS)),
+    ]
@@ -0,0 +1,78 @@
+from django.db import migrations
+
+# pg_advisory_xact_lock key serializing change log writers, until 0014_change_horizon
+CHANGE_LOG_LOCK_ID = 0x6368616e6765
+
+# Table -> (Change.kind, the column holding its company id)
+LOGGED_TABLES = {
+    'core_app_company': ('company', 'id'),
+    'core_app_department': ('department', 'company_id'),
+    'core_app_employee': ('employee', 'company_id'),
+}
+
+
+def sqlite_statements(table, kind, company):
+    # A move is logged as a delete in the old company and an update in the new one
+    now = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+    return [f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_change AFTER UPDATE ON {table} BEGIN
+            INSERT INTO core_app_change (kind, object_id, company_id, action, changed_at)
+            SELECT '{kind}', new.id, old.{company}, 'delete', {now} WHERE old.{company} <> new.{company};
+            INSERT INTO core_app_change (kind, object_id, company_id, action, changed_at)
+            VALUES ('{kind}', new.id, new.{company}, 'update', {now});
+        END
+    """]
+
+
+def postgresql_statements(table, kind, company):
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {table}_change() RETURNS trigger AS $$
+        BEGIN
+            -- Held until commit like in Change.record(), so seq follows commit order
+            PERFORM pg_advisory_xact_lock({CHANGE_LOG_LOCK_ID});
+            IF OLD.{company} <> NEW.{company} THEN
+                INSERT INTO core_app_change (kind, object_id, company_id, action, changed_at)
+                VALUES ('{kind}', NEW.id, OLD.{company}, 'delete', now());
+            END IF;
+            INSERT INTO core_app_change (kind, object_id, company_id, action, changed_at)
+            VALUES ('{kind}', NEW.id, NEW.{company}, 'update', now());
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS {table}_change ON {table}",
+        f"CREATE TRIGGER {table}_change AFTER UPDATE ON {table} FOR EACH ROW EXECUTE FUNCTION {table}_change()",
+    ]
+
+
+def create_triggers(apps, schema_editor):
+    statements = {'sqlite': sqlite_statements, 'postgresql': postgresql_statements}.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, (kind, company) in LOGGED_TABLES.items():
+            for statement in statements(table, kind, company):
+                cursor.execute(statement)
+
+
+def drop_triggers(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        for table in LOGGED_TABLES:
+            if vendor == 'sqlite':
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_change")
+            elif vendor == 'postgresql':
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_change ON {table}")
+                cursor.execute(f"DROP FUNCTION IF EXISTS {table}_change()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0011_department_name_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_user_company(apps, schema_editor):
+    # Managers and employees added before 0005_user_company have no company,
+    # so they see nothing: take the company of the employee with their email
+    User = apps.get_model('core_app', 'User')
+    Employee = apps.get_model('core_app', 'Employee')
+    User.objects.filter(company__isnull=True).exclude(role='admin').update(
+        company=Subquery(Employee.objects.filter(email=OuterRef('email')).values('company_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0012_change_log_triggers'),
+    ]
+
+    operations = [
+        # Nothing to undo: 0005_user_company removes the column when reversed
+        migrations.RunPython(backfill_user_company, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+from importlib import import_module
+
+from django.db import migrations
+
+change_log_triggers = import_module('core_app.migrations.0012_change_log_triggers')
+
+
+def insert(kind, company, action):
+    # Numbered before the INSERT, whose snapshot gives the entry's horizon (see Change.record)
+    return f"""
+            entry_seq := nextval(pg_get_serial_sequence('core_app_change', 'seq'));
+            INSERT INTO core_app_change (seq, kind, object_id, company_id, action, changed_at)
+            VALUES (entry_seq, '{kind}', NEW.id, {company}, '{action}', now());"""
+
+
+def postgresql_statements(table, kind, company):
+    # A move is logged as a delete in the old company and an update in the new one
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {table}_change() RETURNS trigger AS $$
+        DECLARE
+            entry_seq bigint;
+        BEGIN
+            IF OLD.{company} <> NEW.{company} THEN{insert(kind, f'OLD.{company}', 'delete')}
+            END IF;{insert(kind, f'NEW.{company}', 'update')}
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+    ]
+
+
+def add_horizon(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        # The first transaction id not yet handed out when the entry was written
+        cursor.execute(
+            "ALTER TABLE core_app_change ADD COLUMN IF NOT EXISTS horizon xid8 NOT NULL "
+            "DEFAULT pg_snapshot_xmax(pg_current_snapshot())"
+        )
+        for table, (kind, company) in change_log_triggers.LOGGED_TABLES.items():
+            for statement in postgresql_statements(table, kind, company):
+                cursor.execute(statement)
+
+
+def remove_horizon(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Back to the triggers of 0012, which serialize the writers instead
+    change_log_triggers.create_triggers(apps, schema_editor)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("ALTER TABLE core_app_change DROP COLUMN IF EXISTS horizon")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0013_backfill_user_company'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_horizon, remove_horizon),
+    ]
@@ -1,8 +1,31 @@
-from django.db import models
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from django.utils import timezone
-from django.contrib.auth.hashers import make_password
+from django.contrib.auth.hashers import (
+    UNUSABLE_PASSWORD_PREFIX, UNUSABLE_PASSWORD_SUFFIX_LENGTH, identify_hasher, make_password,
+)
+from .versioning import company_changed
+
+
+def is_password_hash(value):
+    """Whether `value` is a hash from one of the configured PASSWORD_HASHERS or set_unusable_password()'s marker"""
+    if value.startswith(UNUSABLE_PASSWORD_PREFIX):
+        # `!` and random letters and digits; a raw password may start with `!` too
+        suffix = value[len(UNUSABLE_PASSWORD_PREFIX):]
+        return len(suffix) == UNUSABLE_PASSWORD_SUFFIX_LENGTH and suffix.isascii() and suffix.isalnum()
+    try:
+        identify_hasher(value)
+    except ValueError:
+        return False
+    return True
+
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -12,61 +35,216 @@ class User(AbstractUser):
     ]
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     email = models.EmailField(unique=True)
+    # The company managers and employees work for; they only see its data (see scoping.py)
+    company = models.ForeignKey('Company', on_delete=models.SET_NULL, null=True, blank=True, related_name='members')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
     def save(self, *args, **kwargs):
         # Always hash the password if it doesn't already look like a hashed password
-        if self.password and not self.password.startswith('pbkdf2_sha256$'):
+        if self.password and not is_password_hash(self.password):
             self.password = make_password(self.password)
         super().save(*args, **kwargs)
 
 
-class Company(models.Model):
+class VersionConflict(Exception):
+    """The row was changed by someone else since the version being saved; `args[0]` is its current version"""
+
+
+class VersionedModel(models.Model):
+    """
+    Optimistic concurrency control. Saving an existing row is a single
+    `UPDATE ... SET version = version + 1 ... WHERE id = ? AND version = ?`
+    for the version the instance was loaded with (or the one a client says it
+    edited, see views.versioned_update). When another write got in between
+    it raises VersionConflict instead of overwriting that write, without
+    locking the row while the request runs.
+
+    COUNTER_FIELDS are left out of those UPDATEs: they are only changed by
+    F() increments and recounts, which don't bump the version, and the loaded
+    values would undo increments made since.
+    """
+    COUNTER_FIELDS = ()
+
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        abstract = True
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        version_field = self._meta.get_field('version')
+        values = [
+            (field, model, value) for field, model, value in values
+            if field.name not in self.COUNTER_FIELDS and field is not version_field
+        ]
+        values.append((version_field, None, self.version + 1))
+        if base_qs.filter(pk=pk_val, version=self.version)._update(values):
+            self.version += 1
+            return True
+        current = base_qs.filter(pk=pk_val).values_list('version', flat=True).first()
+        if current is not None:
+            raise VersionConflict(current)
+        # Deleted meanwhile: save() inserts it again, like for any model
+        return False
+
+
+class Company(VersionedModel):
+    COUNTER_FIELDS = ('num_departments', 'num_employees')
+
     name = models.CharField(max_length=100, unique=True)
     num_departments = models.PositiveIntegerField(default=0)
     num_employees = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
-    def update_counts(self):
-        """Update department and employee counts"""
-        self.num_departments = self.departments.count()
-        self.num_employees = self.employees.count()
-        self.save()
+    def save(self, *args, **kwargs):
+        is_new = self.pk is None
+        # Atomic so the change log entry and the snapshot rebuild task commit with the change
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                Change.record([('company', self.pk, self.pk, 'create')])
+            company_changed(self.pk)
+
+    def delete(self, *args, **kwargs):
+        company_id = self.pk
+        with transaction.atomic():
+            # Its departments and employees are deleted with it (cascade), the entry stands for them
+            result = super().delete(*args, **kwargs)
+            Change.record([('company', company_id, company_id, 'delete')])
+            # Its snapshot went with it, there is nothing to rebuild
+            company_changed(company_id, snapshot=False)
+        return result
 
     def __str__(self):
         return self.name
 
-class Department(models.Model):
+class Department(VersionedModel):
+    COUNTER_FIELDS = ('num_employees',)
+
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='departments')
     name = models.CharField(max_length=100)
     num_employees = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so moving the department also invalidates its old company's data
+        instance._loaded_company_id = dict(zip(field_names, values)).get('company_id')
+        return instance
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None  # Check if this is a new department
-        super().save(*args, **kwargs)
-        
-        if is_new:  # Only update counts for new departments
-            self.company.update_counts()
+        previous_company_id = getattr(self, '_loaded_company_id', None)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:  # Only update counts for new departments
+                Change.record([('department', self.pk, self.company_id, 'create')])
+                Company.objects.filter(pk=self.company_id).update(
+                    num_departments=F('num_departments') + 1,
+                    updated_at=timezone.now(),
+                )
+            company_changed(self.company_id)
+            if previous_company_id not in (None, self.company_id):
+                company_changed(previous_company_id)
+        self._loaded_company_id = self.company_id
 
     def delete(self, *args, **kwargs):
-        # Update the company's department count before deleting
-        super().delete(*args, **kwargs)
-        self.company.update_counts()
+        with transaction.atomic():
+            # The department's hired employees are deleted with it (cascade)
+            hired = Department.objects.filter(pk=self.pk).values_list('num_employees', flat=True).first() or 0
+            department_id = self.pk
+            result = super().delete(*args, **kwargs)
+            # The entry stands for the department's employees too
+            Change.record([('department', department_id, self.company_id, 'delete')])
+            Company.objects.filter(pk=self.company_id).update(
+                num_departments=F('num_departments') - 1,
+                num_employees=F('num_employees') - hired,
+                updated_at=timezone.now(),
+            )
+            company_changed(self.company_id)
+        return result
 
-    def update_employee_count(self):
-        """Update employee count in the department"""
-        self.num_employees = self.employees.count()
-        self.save()
-        self.company.update_counts()
+    @staticmethod
+    def adjust_employee_counts(deltas):
+        """
+        Atomically add the hired-employee `deltas`, `{(department_id,
+        company_id): delta}`, to the counters of the departments and their
+        companies: one UPDATE for the departments and one for the companies,
+        however many there are. With COUNTER_UPDATES = 'deferred' a recount of
+        the departments is queued instead (see tasks.py), so the writer doesn't
+        wait on their rows. Returns the ids of the companies whose recount was
+        queued: the recount also rebuilds their bootstrap snapshots.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return set()
+        if settings.COUNTER_UPDATES == 'deferred':
+            Task.enqueue('recount_department', [department_id for department_id, company_id in deltas])
+            return {company_id for department_id, company_id in deltas}
+        company_deltas = defaultdict(int)
+        for (department_id, company_id), delta in deltas.items():
+            company_deltas[company_id] += delta
+        now = timezone.now()
+        Department.objects.filter(pk__in=[department_id for department_id, company_id in deltas]).update(
+            num_employees=F('num_employees') + _delta_by_pk(
+                {department_id: delta for (department_id, company_id), delta in deltas.items()}
+            ),
+            updated_at=now,
+        )
+        # A move between two departments of a company leaves its counter alone
+        company_deltas = {company_id: delta for company_id, delta in company_deltas.items() if delta}
+        if company_deltas:
+            Company.objects.filter(pk__in=company_deltas).update(
+                num_employees=F('num_employees') + _delta_by_pk(company_deltas), updated_at=now,
+            )
+        return set()
 
     def __str__(self):
         return f"{self.name} - {self.company.name}"
 
     class Meta:
         unique_together = ('company', 'name')
+        # The unique index leads with the company, this one serves name prefix searches (admin)
+        indexes = [
+            models.Index(fields=['name'], name='department_name_idx'),
+        ]
+
+
+def _delta_by_pk(deltas):
+    """A CASE expression picking each row's delta from `{pk: delta}`"""
+    return Case(
+        *(When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()), output_field=models.IntegerField(),
+    )
+
+
+class DaysSince(models.Func):
+    """Whole days from a date expression until `today`, computed by the database"""
+    output_field = models.IntegerField()
+
+    def __init__(self, expression, today, **extra):
+        super().__init__(models.Value(today, output_field=models.DateField()), expression, **extra)
 
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL (and most backends): date - date is a number of days
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
 
-class Employee(models.Model):
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(', **extra_context,
+        )
+
+
+class EmployeeQuerySet(models.QuerySet):
+    def with_days_employed(self):
+        """Annotate `days_employed`: whole days since `hired_on`, 0 when not hired"""
+        today = timezone.now().date()
+        return self.annotate(days_employed=Coalesce(DaysSince('hired_on', today), 0))
+
+
+class Employee(VersionedModel):
     EMPLOYEE_STATUS = [
         ('application_received', 'Application Received'),
         ('interview_scheduled', 'Interview Scheduled'),
@@ -74,6 +252,14 @@ class Employee(models.Model):
         ('not_accepted', 'Not Accepted')
     ]
 
+    # Hiring pipeline moves allowed by the status workflow
+    ALLOWED_STATUS_TRANSITIONS = {
+        'application_received': {'interview_scheduled', 'not_accepted'},
+        'interview_scheduled': {'hired', 'not_accepted'},
+        'hired': set(),
+        'not_accepted': set(),
+    }
+
     phone_regex = RegexValidator(
         regex=r'^\+?1?\d{9,15}$', 
         message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed."
@@ -89,44 +275,282 @@ class Employee(models.Model):
     address = models.TextField()
     designation = models.CharField(max_length=100)
     hired_on = models.DateField(null=True, blank=True)
-    days_employed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = EmployeeQuerySet.as_manager()
+
+    # Fields whose loaded values are remembered to detect changes on save
+    TRACKED_FIELDS = ('status', 'department_id', 'company_id', 'name', 'designation')
+    # Fields shown in the bootstrap snapshot (see snapshots.py)
+    SNAPSHOT_FIELDS = TRACKED_FIELDS
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # The refreshed values are the database's now, like after from_db()
+        refreshed = None if fields is None else {getattr(self._meta.get_field(name), 'attname', name) for name in fields}
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            **{
+                name: self.__dict__[name] for name in self.TRACKED_FIELDS
+                if name in self.__dict__ and (refreshed is None or name in refreshed)
+            },
+        }
+
+    def get_loaded_values(self):
+        """Tracked field values as last loaded from or saved to the database"""
+        loaded = getattr(self, '_loaded_values', {})
+        if self.pk is not None and len(loaded) < len(self.TRACKED_FIELDS):
+            # Some tracked fields were deferred when loading, fetch them once
+            loaded = Employee.objects.filter(pk=self.pk).values(*self.TRACKED_FIELDS).first() or {}
+        return loaded
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None  # Check if this is a new employee
-        current_status = None
+        current = {} if is_new else self.get_loaded_values()
 
-        if not is_new:
-            # Get the current state of the object from the database
-            current = Employee.objects.get(pk=self.pk)
-            current_status = current.status
+        was_hired = current.get('status') == 'hired'
+        is_hired = self.status == 'hired'
+        moved = not is_new and current.get('department_id') != self.department_id
 
         # Automatically set the 'hired_on' field if status changes to 'hired'
-        if self.status == 'hired' and current_status != 'hired':
+        if is_hired and not was_hired:
             self.hired_on = timezone.now().date()
-            # Update counts
-            self.department.update_employee_count()
 
         # # If status changes from 'hired' to another status, clear 'hired_on'
         # if current_status == 'hired' and self.status != 'hired':
         #     self.hired_on = None
 
-        # Calculate days employed if hired
-        if self.hired_on:
-            self.days_employed = (timezone.now().date() - self.hired_on).days
+        # Validate department belongs to the selected company. Unchanged
+        # relations were already validated, and a loaded department is used
+        # as is, so this only queries when a bare department_id was changed.
+        if is_new or moved or current.get('company_id') != self.company_id:
+            if Employee.department.is_cached(self):
+                department_company_id = self.department.company_id
+            else:
+                department_company_id = Department.objects.filter(pk=self.department_id).values_list('company_id', flat=True).first()
+            if department_company_id != self.company_id:
+                raise ValueError("Department must belong to the selected company")
 
-        # Validate department belongs to the selected company
-        if self.department.company != self.company:
-            raise ValueError("Department must belong to the selected company")
+        # Update counts only on transitions into or out of 'hired'
+        adjustments = Counter()  # (department_id, company_id) -> hired delta
+        if was_hired and (not is_hired or moved):
+            adjustments[current['department_id'], current['company_id']] -= 1
+        if is_hired and (not was_hired or moved):
+            adjustments[self.department_id, self.company_id] += 1
 
-        # Save the employee instance
-        super().save(*args, **kwargs)
+        in_snapshot = is_new or any(current.get(name) != getattr(self, name) for name in self.SNAPSHOT_FIELDS)
+        # An update that leaves the counters and the snapshot alone is a
+        # single UPDATE (its trigger logs it), it needs no transaction
+        with transaction.atomic() if is_new or adjustments or in_snapshot else nullcontext():
+            super().save(*args, **kwargs)
+            if is_new:
+                Change.record([('employee', self.pk, self.company_id, 'create')])
+            recounted = Department.adjust_employee_counts(adjustments)
+            for company_id in {self.company_id, current.get('company_id', self.company_id)}:
+                # Other fields don't change the snapshot, a queued recount rebuilds it anyway
+                company_changed(company_id, snapshot=in_snapshot and company_id not in recounted)
+        self._loaded_values = {name: getattr(self, name) for name in self.TRACKED_FIELDS}
 
     def delete(self, *args, **kwargs):
-        super().delete(*args, **kwargs)
+        current = self.get_loaded_values()
+        with transaction.atomic():
+            employee_id = self.pk
+            result = super().delete(*args, **kwargs)
+            Change.record([('employee', employee_id, current.get('company_id', self.company_id), 'delete')])
 
-        # Update counts
-        self.department.update_employee_count()
+            # Update counts
+            recounted = set()
+            if current.get('status') == 'hired':
+                recounted = Department.adjust_employee_counts({(current['department_id'], current['company_id']): -1})
+            company_id = current.get('company_id', self.company_id)
+            company_changed(company_id, snapshot=company_id not in recounted)
+        return result
 
     def __str__(self):
         return f"{self.name} - {self.designation}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'status'], name='employee_company_status_idx'),
+            models.Index(fields=['department', 'status'], name='employee_dept_status_idx'),
+            models.Index(fields=['hired_on'], name='employee_hired_on_idx'),
+            models.Index(fields=['name'], name='employee_name_idx'),
+        ]
+
+
+class Task(models.Model):
+    """
+    A queued background job, run by `manage.py run_worker` (see tasks.py).
+    `kind` names the job and `key` its argument; rows with the same kind and
+    key are coalesced into a single run. Rows are deleted once their job ran.
+    """
+    kind = models.CharField(max_length=50)
+    key = models.CharField(max_length=100)
+    # When a worker may claim the task: later while claimed or backing off
+    # after a failure, NULL once it failed TASK_MAX_ATTEMPTS times
+    available_at = models.DateTimeField(default=timezone.now, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def enqueue(cls, kind, keys):
+        """
+        Queue a `kind` job for each of `keys`, with one INSERT. Inside a
+        transaction the tasks only become visible when it commits.
+        """
+        cls.objects.bulk_create(cls(kind=kind, key=str(key)) for key in keys)
+
+    def __str__(self):
+        return f"{self.kind}({self.key})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='task_available_idx'),
+            models.Index(fields=['kind', 'key'], name='task_kind_key_idx'),
+        ]
+
+
+class Change(models.Model):
+    """
+    An entry of the change log: a company, department or employee was
+    created, updated or deleted (see changelog.py). Clients sync with
+    `/api/changes/?since=<seq>`, which only returns an entry once every
+    lower `seq` was committed or rolled back.
+    """
+    ACTIONS = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=20)  # 'company', 'department' or 'employee'
+    object_id = models.BigIntegerField()
+    # The company the object belongs to, for scoping: a move is logged as a
+    # delete in the old company and an update in the new one. Not a foreign
+    # key, entries outlive the company.
+    company_id = models.BigIntegerField()
+    action = models.CharField(max_length=6, choices=ACTIONS)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def record(cls, entries):
+        """
+        Append `(kind, object_id, company_id, action)` entries, in order, with
+        bulk_create. Call it inside the transaction making the change, after
+        its writes.
+
+        Only creates and deletes are recorded this way: every UPDATE of a
+        company, department or employee row is logged by a trigger, in the
+        statement itself (see migrations 0012 and 0014). SQLite drops a
+        table's triggers when a migration rebuilds it; such a migration
+        creates them again.
+
+        On PostgreSQL writers don't wait for each other, so `seq` isn't in
+        commit order. The entries are numbered first, in a statement of their
+        own, and the INSERT then stores its snapshot's xmax as their
+        `horizon` column: every transaction that holds a lower `seq` has an
+        id below it, and readers only go past an entry once all of those
+        finished (see changelog.py).
+        """
+        entries = list(entries)
+        if not entries:
+            return
+        connection = connections[router.db_for_write(cls)]
+        seqs = [None] * len(entries)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence('core_app_change', 'seq')) FROM generate_series(1, %s)",
+                    [len(entries)],
+                )
+                seqs = sorted(seq for seq, in cursor.fetchall())
+        now = timezone.now()
+        cls.objects.bulk_create(
+            cls(seq=seq, kind=kind, object_id=object_id, company_id=company_id, action=action, changed_at=now)
+            for seq, (kind, object_id, company_id, action) in zip(seqs, entries)
+        )
+
+    def __str__(self):
+        return f"{self.seq}: {self.action} {self.kind} {self.object_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company_id', 'seq'], name='change_company_seq_idx'),
+            models.Index(fields=['kind', 'object_id', 'company_id', 'seq'], name='change_object_idx'),
+            models.Index(fields=['changed_at'], name='change_changed_at_idx'),
+        ]
+
+
+class CompanySnapshot(models.Model):
+    """
+    The rendered bootstrap tree (departments and employee summaries) of a
+    company, rebuilt when its data changes (see snapshots.py).
+    """
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    body = models.BinaryField()
+    built_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Snapshot of company {self.company_id}"
+
+
+def _count_of(queryset, group_by):
+    """Correlated `(SELECT COUNT(*) ... GROUP BY group_by)` subquery, 0 when empty"""
+    counts = queryset.order_by().values(group_by).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts), 0)
+
+
+def recount_denormalized_counters(company_ids=None, department_ids=None):
+    """
+    Recompute num_departments/num_employees from the source tables.
+
+    Finds the departments and companies whose counters drifted with one
+    grouped aggregate query each, optionally restricted to `company_ids`,
+    and the departments to `department_ids`, and only updates those: a
+    recount that moves no counter writes nothing, and logs no change.
+    Returns `(company_ids, department_ids)`: the ids of the companies whose
+    counters, or whose departments' counters, were corrected (their cached
+    data is outdated), and those of the corrected departments.
+    """
+    companies = Company.objects.all()
+    departments = Department.objects.all()
+    if company_ids is not None:
+        companies = companies.filter(pk__in=company_ids)
+        departments = departments.filter(company_id__in=company_ids)
+    if department_ids is not None:
+        departments = departments.filter(pk__in=department_ids)
+    hired = Employee.objects.filter(status='hired')
+    department_employees = _count_of(hired.filter(department=OuterRef('pk')), 'department')
+    company_departments = _count_of(Department.objects.filter(company=OuterRef('pk')), 'company')
+    company_employees = _count_of(hired.filter(company=OuterRef('pk')), 'company')
+
+    now = timezone.now()
+    # No savepoint inside a caller's transaction (the import): an error rolls it all back anyway
+    with transaction.atomic(savepoint=False):
+        # Only the rows whose counters drifted are updated, and so logged as changed
+        drifted = dict(
+            departments.annotate(count=department_employees).exclude(num_employees=F('count'))
+            .values_list('pk', 'company_id')
+        )
+        if drifted:
+            Department.objects.filter(pk__in=drifted).update(num_employees=department_employees, updated_at=now)
+        company_ids = list(
+            companies.annotate(departments_count=company_departments, employees_count=company_employees)
+            .exclude(num_departments=F('departments_count'), num_employees=F('employees_count'))
+            .values_list('pk', flat=True)
+        )
+        if company_ids:
+            Company.objects.filter(pk__in=company_ids).update(
+                num_departments=company_departments, num_employees=company_employees, updated_at=now,
+            )
+        return set(drifted.values()) | set(company_ids), set(drifted)
@@ -0,0 +1,31 @@
+import io
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib json module is used without it
+    orjson = None
+
+from django.conf import settings
+from rest_framework import parsers
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    DRF's JSONParser, decoding UTF-8 bodies with orjson when it is installed.
+    Bodies orjson rejects are parsed again by the stdlib parser, so invalid
+    JSON gets DRF's usual error and what only the stdlib accepts (e.g. lone
+    surrogate escapes) still parses. Integers beyond 64 bits become floats.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            # orjson never accepts NaN or Infinity, like STRICT_JSON
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
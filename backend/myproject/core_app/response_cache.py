@@ -0,0 +1,200 @@
+"""
+Cache of rendered company and department read responses.
+
+Entries hold the JSON bytes with their ETag and Last-Modified headers, not
+model instances, so a hit is answered without touching the ORM, the
+serializers or the renderer. They live in the RESPONSE_CACHE_ALIAS cache and
+are tagged with the data version (see versioning.py) of the company they
+belong to, or of all companies; an entry is only served while that version
+is unchanged. Company and department saves and deletes, employee changes and
+counter updates all bump it once their transaction commits.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from . import instrumentation
+from .scoping import company_ids, in_scope, scope_key
+from .routers import cache_timeout, read_replica, reads_primary
+from .versioning import ALL_COMPANIES, company_scope, get_version
+
+# Response headers stored with the body
+CACHED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def get_response_cache():
+    """
+    The cache holding rendered responses, `RESPONSE_CACHE_ALIAS` in CACHES:
+    an in-process LocMemCache (LRU bounded by MAX_ENTRIES) by default, see
+    DJANGO_CACHE in the settings for the multi-process backends.
+    """
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _version_scope(company_id):
+    return ALL_COMPANIES if company_id is None else company_scope(company_id)
+
+
+def list_key(request):
+    """Lists differ per scope and query string (filters, fields, cursor)"""
+    return f"{scope_key(request.user)}:{request.META.get('QUERY_STRING', '')}"
+
+
+def user_company(request, response):
+    """The company whose changes invalidate the list: the user's own, or all of them"""
+    ids = company_ids(request.user)
+    return ids[0] if ids else None
+
+
+def detail_key(request, pk):
+    # No scope: a row is the same for everyone allowed to see it, checked on every hit
+    return f"{pk}:{request.META.get('QUERY_STRING', '')}"
+
+
+def company_pk(request, response, pk):
+    return pk
+
+
+def department_company(request, response, pk):
+    # None (all companies) when `?fields=` left the company out
+    if isinstance(response, Response):
+        return response.data.get('company')
+    return json.loads(response.content).get('company')
+
+
+def get_entry(resource, key):
+    """The cached entry, if it is still current"""
+    entry = get_response_cache().get(f'response:{resource}:{key}')
+    if entry is None or entry['version'] != get_version(_version_scope(entry['company'])):
+        return None
+    if entry.get('replica') and reads_primary():
+        return None
+    return entry
+
+
+def set_entry(resource, key, company_id, response, versions_before):
+    """
+    Store a rendered 200 response, unless data changed while it was built:
+    `versions_before` is the all-companies version read before the view ran,
+    and every change bumps it, so an unchanged value means the body isn't
+    older than the version it is tagged with.
+    """
+    version = get_version(_version_scope(company_id))
+    if get_version(ALL_COMPANIES) != versions_before:
+        return
+    entry = {
+        'body': response.content,
+        'content_type': response['Content-Type'],
+        'headers': {name: response[name] for name in CACHED_HEADERS if response.has_header(name)},
+        'company': company_id,
+        'version': version,
+        'replica': read_replica() is not None,
+    }
+    get_response_cache().set(f'response:{resource}:{key}', entry, cache_timeout(settings.RESPONSE_CACHE_TTL))
+
+
+def entry_response(request, entry):
+    """The cached response, or a 304/412 when the client's validators match"""
+    etag = entry['headers'].get('ETag')
+    last_modified = entry['headers'].get('Last-Modified')
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified and parse_http_date_safe(last_modified),
+    )
+    if response is None:
+        response = HttpResponse(entry['body'], content_type=entry['content_type'])
+    for name, value in entry['headers'].items():
+        response.headers[name] = value
+    return response
+
+
+def _rendered(request, response):
+    """Render a DRF Response in place with the negotiated renderer, as DRF would later"""
+    if isinstance(response, Response):
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = {'request': request, 'response': response}
+        response.render()
+    return response
+
+
+def _is_cacheable(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    # The browsable API renders HTML around the data, only JSON is cached
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer is None or renderer.format == 'json'
+
+
+def cached_response(resource, get_key, get_company):
+    """
+    Serve a read view from the response cache. `resource` names the view (its
+    URL name) in keys and in the hit/miss counters, `get_key(request, **kwargs)`
+    returns the rest of the key and `get_company(request, response, **kwargs)` the
+    company whose version the entry is tagged with, None for all companies.
+
+    Goes between the permission checks and `conditional`, so a hit skips the
+    validator query too; the stored ETag and Last-Modified answer conditional
+    requests. Only JSON 200 responses are stored.
+    """
+    def hit(request, key):
+        entry = get_entry(resource, key)
+        if entry is None or not in_scope(request.user, entry['company']):
+            instrumentation.RESPONSE_CACHE_MISSES.inc(resource)
+            return None
+        instrumentation.RESPONSE_CACHE_HITS.inc(resource)
+        return entry_response(request, entry)
+
+    def store(request, key, response, versions_before, kwargs):
+        response = _rendered(request, response)
+        set_entry(resource, key, get_company(request, response, **kwargs), response, versions_before)
+        return response
+
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def ainner(request, **kwargs):
+                if not _is_cacheable(request):
+                    return await func(request, **kwargs)
+                key = get_key(request, **kwargs)
+                response = await sync_to_async(hit)(request, key)
+                if response is not None:
+                    return response
+                versions_before = await sync_to_async(get_version)(ALL_COMPANIES)
+                response = await func(request, **kwargs)
+                if response.status_code == 200:
+                    await sync_to_async(store)(request, key, response, versions_before, kwargs)
+                return response
+            return ainner
+
+        @wraps(func)
+        def inner(request, **kwargs):
+            if not _is_cacheable(request):
+                return func(request, **kwargs)
+            key = get_key(request, **kwargs)
+            response = hit(request, key)
+            if response is not None:
+                return response
+            versions_before = get_version(ALL_COMPANIES)
+            response = func(request, **kwargs)
+            if response.status_code == 200:
+                response = store(request, key, response, versions_before, kwargs)
+            return response
+        return inner
+    return decorator
+
+
+def cached_list(resource):
+    """`cached_response` for a list, per scope of the user"""
+    return cached_response(resource, list_key, user_company)
+
+
+def cached_detail(resource, get_company):
+    """`cached_response` for a single row, per primary key"""
+    return cached_response(resource, detail_key, get_company)
@@ -0,0 +1,175 @@
+"""
+Read replica routing (DATABASE_ROUTERS). The `default` database is the
+primary; DATABASE_REPLICAS lists the aliases of read-only copies of it.
+
+Only the reads of GET/HEAD/OPTIONS requests go to a replica (see
+middleware.ReplicaRoutingMiddleware), and only those of REPLICATED_MODELS,
+the data served by the list, detail, search and change feed views. Every
+other read uses the primary:
+
+- reads outside of a request (management commands, the task worker);
+- reads of other requests, which may write based on what they read;
+- reads in a transaction on the primary (model saves, select_for_update);
+- reads after the request wrote one of REPLICATED_MODELS, and those of the
+  user's requests for REPLICA_LAG seconds after it wrote (a flag in the
+  default cache, shared by the workers), so a user reads their own writes;
+- users, tokens, sessions, tasks, snapshots and cache tables, so a lagging
+  replica never brings back a logged out token or a done task.
+
+A request reads from a single replica, picked round-robin, so its ETag and
+its body agree. A replica that can't be connected to is skipped for
+REPLICA_RETRY seconds; with none left, reads use the primary.
+"""
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = DEFAULT_DB_ALIAS
+REPLICATED_MODELS = {'core_app.company', 'core_app.department', 'core_app.employee', 'core_app.change'}
+
+
+class RequestRouting:
+    """Where the reads of the current request go"""
+
+    def __init__(self, primary=False, request=None):
+        self.primary = primary
+        self.request = request
+        self.wrote = False
+        self.replica = None  # picked on the first read
+        self.pin_checked = False
+
+    def reads_primary(self):
+        """
+        Whether the reads go to the primary, also when the user wrote a moment
+        ago. Authentication reads the user (from the primary) before the view
+        reads anything else, so the flag is checked once the user is known.
+        """
+        if not self.primary and not self.pin_checked:
+            user_id = request_user_id(self.request)
+            if user_id is not None:
+                self.pin_checked = True
+                self.primary = bool(cache.get(pin_key(user_id)))
+        return self.primary
+
+
+_current = ContextVar('request_routing', default=None)
+
+
+@contextmanager
+def request_routing(primary=False, request=None):
+    """Route the reads in the block as those of `request`, to the primary with `primary`"""
+    routing = RequestRouting(primary, request)
+    token = _current.set(routing)
+    try:
+        yield routing
+    finally:
+        _current.reset(token)
+
+
+def pin_to_primary():
+    """Send the current request's remaining reads to the primary"""
+    routing = _current.get()
+    if routing is not None:
+        routing.primary = True
+
+
+def pin_key(user_id):
+    """Cache key set for REPLICA_LAG seconds after `user_id` wrote"""
+    return f'read-primary:{user_id}'
+
+
+def request_user_id(request):
+    """The id of the user `request` is authenticated as (by DRF or the session), or None"""
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+def read_replica():
+    """The replica the current request read from, or None"""
+    routing = _current.get()
+    if routing is None or routing.replica in (None, PRIMARY):
+        return None
+    return routing.replica
+
+
+def reads_primary():
+    """Whether the current request (if any) reads from the primary"""
+    routing = _current.get()
+    return routing is None or routing.reads_primary()
+
+
+def cache_timeout(timeout):
+    """
+    `timeout` for a cache entry built by the current request, at most
+    REPLICA_LAG seconds when it read from a replica: the data may be that
+    old while the entry's version key already is the current one. Requests
+    reading from the primary skip such entries (see `reads_primary`), so a
+    client still reads its own writes.
+    """
+    return min(timeout, settings.REPLICA_LAG) if read_replica() else timeout
+
+
+class ReplicaRouter:
+
+    def __init__(self):
+        self._turns = itertools.count()
+        self._down_until = {}
+
+    def db_for_read(self, model, **hints):
+        routing = _current.get()
+        if (
+            routing is None or model._meta.label_lower not in REPLICATED_MODELS
+            or connections[PRIMARY].in_atomic_block or routing.reads_primary()
+        ):
+            return PRIMARY
+        if routing.replica is None:
+            routing.replica = self.pick_replica()
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in REPLICATED_MODELS:
+            routing = _current.get()
+            if routing is not None:
+                routing.primary = routing.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary
+        return False if db in settings.DATABASE_REPLICAS else None
+
+    def pick_replica(self):
+        """The next reachable replica in turn, or the primary"""
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return PRIMARY
+        start = next(self._turns)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if self.is_reachable(alias):
+                return alias
+        return PRIMARY
+
+    def is_reachable(self, alias):
+        if time.monotonic() < self._down_until.get(alias, 0):
+            return False
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as exc:
+            logger.warning('Read replica %s is unreachable, skipping it for %ss: %s', alias, settings.REPLICA_RETRY, exc)
+            self._down_until[alias] = time.monotonic() + settings.REPLICA_RETRY
+            return False
+        return True
@@ -0,0 +1,42 @@
+"""
+Company scoping of querysets. Admins see every company; managers and
+employees only see the company they belong to (`User.company`), or nothing
+when they don't belong to one.
+
+The restriction is a `company__in` filter in SQL, so rows of other companies
+are never read, and it is covered by the company indexes.
+"""
+from .models import Company, Department, Employee
+
+# The lookup leading to the company, per model
+SCOPE_FIELDS = {
+    Company: 'pk',
+    Department: 'company',
+    Employee: 'company',
+}
+
+
+def company_ids(user):
+    """The ids of the companies `user` may see, or None for all of them"""
+    if user.role == 'admin':
+        return None
+    return () if user.company_id is None else (user.company_id,)
+
+
+def scope(queryset, user):
+    """Restrict `queryset` to the companies `user` may see"""
+    ids = company_ids(user)
+    if ids is None:
+        return queryset
+    return queryset.filter(**{f'{SCOPE_FIELDS[queryset.model]}__in': ids})
+
+
+def in_scope(user, company_id):
+    ids = company_ids(user)
+    return ids is None or company_id in ids
+
+
+def scope_key(user):
+    """Identifies what `user` can see, for cache keys and ETags"""
+    ids = company_ids(user)
+    return 'all' if ids is None else 'companies:' + ','.join(map(str, ids))
@@ -0,0 +1,194 @@
+"""
+Full-text search over employees (`GET /api/employees/search/?q=`) by name,
+email, designation and address, ranked by relevance with matches in the name
+first, then the email, the designation and the address. Every word of the
+query must match: the last one as a prefix (type-ahead), the others as whole
+words. One-character words are left out unless the query has no other word,
+as they match a large part of the table.
+
+The index lives in the database and is kept current by the database itself,
+for every write path (model saves and deletes, bulk imports, status
+transitions, seeding):
+
+- SQLite: the FTS5 table `core_app_employee_search`, an external content
+  index over `core_app_employee` updated by insert, update and delete
+  triggers, ranked with bm25(). The company id is indexed as a word too, so
+  the company scope is part of the full-text query.
+- PostgreSQL: the generated `tsvector` column `core_app_employee.search_vector`
+  with a GIN index, ranked with ts_rank().
+- Other databases have no index: every word must be contained in one of the
+  fields (`icontains`), matches come by id. A scan of the company's
+  employees, but the endpoint works the same.
+
+Every match is ranked in the database, which keeps only the requested page
+(`ORDER BY rank ... LIMIT`, a top-N sort), so the best matches are found
+however broad the query is.
+
+`manage.py rebuild_search_index` recreates whatever is missing and rebuilds
+the index from the table, e.g. after SQLite rebuilt the table in a migration
+(which drops its triggers).
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from rest_framework import serializers
+
+from .models import Employee
+from .scoping import company_ids
+
+TABLE = 'core_app_employee_search'
+MAX_TERMS = 8
+# Weights of the name, email, designation, address and company id matches (bm25)
+WEIGHTS = (10.0, 5.0, 2.0, 1.0, 0.0)
+
+# Words as both backends' default parsers see them: no punctuation, `_` included
+TERM_RE = re.compile(r'[^\W_]+')
+
+SQLITE_SCHEMA = [
+    # Prefix indexes for the 1 to 3 character prefixes type-ahead starts with
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+        name, email, designation, address, company_id,
+        content='core_app_employee', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_insert AFTER INSERT ON core_app_employee BEGIN
+        INSERT INTO {TABLE} (rowid, name, email, designation, address, company_id)
+        VALUES (new.id, new.name, new.email, new.designation, new.address, new.company_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_delete AFTER DELETE ON core_app_employee BEGIN
+        INSERT INTO {TABLE} ({TABLE}, rowid, name, email, designation, address, company_id)
+        VALUES ('delete', old.id, old.name, old.email, old.designation, old.address, old.company_id);
+    END
+    """,
+    # Only when an indexed column changed, status transitions don't touch the index
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_update
+    AFTER UPDATE OF name, email, designation, address, company_id ON core_app_employee BEGIN
+        INSERT INTO {TABLE} ({TABLE}, rowid, name, email, designation, address, company_id)
+        VALUES ('delete', old.id, old.name, old.email, old.designation, old.address, old.company_id);
+        INSERT INTO {TABLE} (rowid, name, email, designation, address, company_id)
+        VALUES (new.id, new.name, new.email, new.designation, new.address, new.company_id);
+    END
+    """,
+]
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {TABLE}_update",
+    f"DROP TABLE IF EXISTS {TABLE}",
+]
+
+POSTGRESQL_SCHEMA = [
+    # `simple` keeps words as written (no stemming or stop words), fitting
+    # names and addresses; the email is split at `@` and `.` like in SQLite
+    """
+    ALTER TABLE core_app_employee ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', name), 'A')
+        || setweight(to_tsvector('simple', translate(email, '@.', '  ')), 'B')
+        || setweight(to_tsvector('simple', designation), 'C')
+        || setweight(to_tsvector('simple', address), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS employee_search_idx ON core_app_employee USING gin (search_vector)",
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS employee_search_idx",
+    "ALTER TABLE core_app_employee DROP COLUMN IF EXISTS search_vector",
+]
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=100)
+    page = serializers.IntegerField(min_value=1, max_value=100, default=1)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+def _connection():
+    return connections[router.db_for_read(Employee)]
+
+
+def install(connection):
+    """Create the index on `connection` if it doesn't exist yet"""
+    statements = {'sqlite': SQLITE_SCHEMA, 'postgresql': POSTGRESQL_SCHEMA}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def uninstall(connection):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def rebuild(connection=None):
+    """Create the index if needed and rebuild its content from the employee table"""
+    connection = connection or _connection()
+    install(connection)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+        elif connection.vendor == 'postgresql':
+            # The generated column can't drift, only the index can bloat
+            cursor.execute("REINDEX INDEX employee_search_idx")
+
+
+def terms(query):
+    """The lowercased words of `query` to match, at most MAX_TERMS"""
+    words = TERM_RE.findall(query.lower())
+    return ([word for word in words if len(word) > 1] or words)[:MAX_TERMS]
+
+
+def search_ids(user, query, offset=0, limit=20):
+    """
+    The ids of the employees `user` may see matching `query`, best match
+    first, from `offset`, at most `limit`.
+    """
+    words = terms(query)
+    ids = company_ids(user)
+    if not words or (ids is not None and not ids):
+        return []
+    connection = _connection()
+
+    if connection.vendor == 'sqlite':
+        match = '{name email designation address} : (' + ' '.join(
+            [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+        ) + ')'
+        if ids is not None:
+            match = f'({match}) AND company_id : (' + ' OR '.join(f'"{pk}"' for pk in ids) + ')'
+        params = [match]
+        sql = (
+            f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s"
+            f" ORDER BY bm25({TABLE}, {', '.join(map(str, WEIGHTS))}), rowid LIMIT %s OFFSET %s"
+        )
+    elif connection.vendor == 'postgresql':
+        match = ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+        params = [match, *(ids or ())]
+        scoped = f" AND company_id IN ({', '.join(['%s'] * len(ids))})" if ids is not None else ""
+        sql = (
+            "SELECT id FROM core_app_employee, to_tsquery('simple', %s) q"
+            f" WHERE search_vector @@ q{scoped}"
+            " ORDER BY ts_rank(search_vector, q) DESC, id LIMIT %s OFFSET %s"
+        )
+    else:
+        employees = Employee.objects.using(connection.alias)
+        if ids is not None:
+            employees = employees.filter(company_id__in=ids)
+        for word in words:
+            employees = employees.filter(
+                Q(name__icontains=word) | Q(email__icontains=word)
+                | Q(designation__icontains=word) | Q(address__icontains=word)
+            )
+        return list(employees.order_by('id').values_list('id', flat=True)[offset:offset + limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
@@ -1,37 +1,201 @@
+import itertools
+from datetime import date
+
 from rest_framework import serializers
 from .models import Company, Department, Employee, User
+from .instrumentation import timed_serialization
 from django.utils import timezone
 
 
-class CompanySerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """
+    Count the time spent building `.data` as the serialization time of the
+    current request. Set `list_serializer_class = TimedListSerializer` in
+    Meta to time `many=True` serializers as well.
+    """
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class DynamicFieldsModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    A ModelSerializer that takes an additional `fields` argument that
+    controls which fields should be serialized (sparse fieldsets).
+    """
+    # Model columns a non-model serializer field needs loaded to be computed
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            # Drop any fields that are not specified in the `fields` argument
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+    @classmethod
+    def parse_fields(cls, request):
+        """
+        Read the `?fields=a,b` query parameter. Returns None when it is absent
+        and raises a ValidationError for names the serializer doesn't know.
+        """
+        raw = request.query_params.get('fields')
+        if raw is None:
+            return None
+        fields = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in cls.Meta.fields]
+        if unknown or not fields:
+            raise serializers.ValidationError(
+                {'fields': f"Unknown field(s): {', '.join(unknown)}" if unknown else 'No fields requested.'}
+            )
+        return fields
+
+    @classmethod
+    def select_columns(cls, fields):
+        """Model columns to load with `.only()` to serialize `fields`."""
+        columns = []
+        for name in fields:
+            for column in cls.field_sources.get(name, (name,)):
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+
+class ValuesRepresentationMixin:
+    """
+    A lean read-only path for lists: `represent_values()` turns the dicts of
+    `queryset.values(*value_names(fields))` into the same representation
+    `many=True` serialization of the model instances would produce, without
+    building instances or running the fields' `to_representation` per row.
+
+    Only for serializers whose fields are model columns, foreign keys
+    (primary keys) or annotations output as loaded, except the ones listed in
+    `value_representations`, which map a field to the function formatting its
+    non-null values.
+    """
+    value_representations = {}
+
+    @classmethod
+    def value_names(cls, fields=None, extra=()):
+        """The names to pass to `values()`: the serialized fields, in output order, then `extra`"""
+        names = [name for name in cls.Meta.fields if fields is None or name in fields]
+        return names + [name for name in extra if name not in names]
+
+    @classmethod
+    def represent_values(cls, rows, fields=None):
+        names = cls.value_names(fields)
+        representations = [(name, func) for name, func in cls.value_representations.items() if name in names]
+        data = []
+        with timed_serialization():
+            rows = iter(rows)
+            first = next(rows, None)
+            if first is None:
+                return data
+            # values() puts annotations after the columns and may carry sort-only columns
+            reorder = list(first) != names
+            for row in itertools.chain((first,), rows):
+                if reorder:
+                    row = {name: row[name] for name in names}
+                for name, func in representations:
+                    value = row[name]
+                    if value is not None:
+                        row[name] = func(value)
+                data.append(row)
+        return data
+
+
+class CompanySerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Company
-        fields = ['id', 'name', 'num_departments', 'num_employees']
+        fields = ['id', 'name', 'num_departments', 'num_employees', 'version']
+        # Counters are maintained by the server, the version by every save
+        read_only_fields = ['num_departments', 'num_employees', 'version']
+        list_serializer_class = TimedListSerializer
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Department
-        fields = ['id', 'company', 'name', 'num_employees']
+        fields = ['id', 'company', 'name', 'num_employees', 'version']
+        read_only_fields = ['num_employees', 'version']
+        list_serializer_class = TimedListSerializer
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class EmployeeSerializer(ValuesRepresentationMixin, DynamicFieldsModelSerializer):
     days_employed = serializers.SerializerMethodField()
+    # days_employed comes from the `with_days_employed()` annotation on lists
+    field_sources = {'days_employed': ()}
+    # DateField's ISO 8601 output (DATE_FORMAT); everything else is output as loaded
+    value_representations = {'hired_on': date.isoformat}
 
     class Meta:
         model = Employee
-        fields = ['id', 'company', 'department', 'status', 'name', 'email', 'mobile_number', 'address', 'designation', 'hired_on', 'days_employed']
+        fields = ['id', 'company', 'department', 'status', 'name', 'email', 'mobile_number', 'address', 'designation', 'hired_on', 'days_employed', 'version']
+        read_only_fields = ['version']
+        list_serializer_class = TimedListSerializer
 
     def get_days_employed(self, obj):
-        # Calculate days employed based on the hired_on date
+        # Use the value computed by the database when the queryset was annotated
+        days_employed = getattr(obj, 'days_employed', None)
+        if days_employed is not None:
+            return days_employed
+        # Otherwise calculate days employed based on the hired_on date
         if obj.hired_on:
             return (timezone.now().date() - obj.hired_on).days
         return 0
 
-class UserSerializer(serializers.ModelSerializer):
+    def validate(self, data):
+        # Validate department belongs to the selected company
+        if 'company' in data or 'department' in data:
+            company_id = data['company'].pk if 'company' in data else self.instance.company_id
+            department = data['department'] if 'department' in data else self.instance.department
+            if department.company_id != company_id:
+                raise serializers.ValidationError({'department': 'Department must belong to the selected company.'})
+        return data
+
+
+class EmployeeImportSerializer(EmployeeSerializer):
+    """
+    Per-row validation for bulk imports. Relations and email uniqueness are
+    checked for a whole batch at once by `bulk.import_employees` instead of
+    with one query per row.
+    """
+    company = serializers.IntegerField(min_value=1)
+    department = serializers.IntegerField(min_value=1)
+
+    class Meta(EmployeeSerializer.Meta):
+        extra_kwargs = {'email': {'validators': []}}
+
+    def validate(self, data):
+        return data
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'password', 'role']
+        fields = ['id', 'username', 'email', 'password', 'role', 'company']
+        list_serializer_class = TimedListSerializer
         extra_kwargs = {'password': {'write_only': True}}  # Ensure password is write-only
 
+    # Only admins assign roles and companies; they are read-only unless the
+    # serializer's `request` context comes from an admin
+    ADMIN_FIELDS = ('role', 'company')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or getattr(request.user, 'role', None) != 'admin':
+            for name in self.ADMIN_FIELDS:
+                fields[name].read_only = True
+        return fields
+
     def create(self, validated_data):
         # Hash the password before saving the user
         password = validated_data.pop('password', None)
@@ -0,0 +1,177 @@
+"""
+The bootstrap snapshot served by `GET /api/bootstrap/`: the companies a user
+can see, each with its departments and a summary of its employees, in one
+response instead of the company, department and employee lists. Rows are
+sent as column arrays (`{"id": [...], "name": [...]}`) rather than a dict
+per row, so the keys aren't repeated for every employee.
+
+Each company's part is rendered once into its CompanySnapshot row.
+`company_changed` queues a `rebuild_snapshot` task in the writer's
+transaction and the worker (`manage.py run_worker`) renders the company
+again; a read that finds a company whose rebuild is still queued, or that
+has no snapshot yet, rebuilds it first. Only changed companies are rendered,
+never per request. Responses are assembled from the stored bytes, compressed
+for the client's Accept-Encoding (brotli when installed, else gzip) and kept
+in the response cache under their ETag.
+"""
+import gzip
+from collections import defaultdict
+
+try:
+    import brotli
+except ImportError:  # optional, only gzip is offered without it
+    brotli = None
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, Exists, OuterRef
+from django.db.models.functions import Cast
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+
+from .conditional import make_etag
+from .models import Company, CompanySnapshot, Department, Employee, Task
+from .renderers import JSONRenderer
+from .response_cache import get_response_cache
+from .routers import pin_to_primary
+
+COMPANY_FIELDS = ('id', 'name', 'num_departments', 'num_employees')
+DEPARTMENT_COLUMNS = ('id', 'name', 'num_employees')
+# A summary for the tree, the details come from /api/employees/<pk>/
+EMPLOYEE_COLUMNS = ('id', 'department', 'name', 'designation', 'status')
+
+GZIP_LEVEL = 6
+# Brotli's default (11) takes seconds on large bodies
+BROTLI_QUALITY = 5
+
+
+def _columns(rows, names):
+    """`{name: [the value of every row]}` for value tuples in `names` order"""
+    return {name: [row[i] for row in rows] for i, name in enumerate(names)}
+
+
+def render_companies(company_ids):
+    """
+    Render the snapshot bodies of `company_ids` with three queries. Returns
+    `{company_id: bytes}`, without the companies that don't exist.
+    """
+    companies = Company.objects.filter(pk__in=company_ids).values(*COMPANY_FIELDS)
+    departments = defaultdict(list)
+    rows = Department.objects.filter(company_id__in=company_ids).order_by('id')
+    for company_id, *row in rows.values_list('company_id', *DEPARTMENT_COLUMNS):
+        departments[company_id].append(row)
+    employees = defaultdict(list)
+    rows = Employee.objects.filter(company_id__in=company_ids).order_by('id')
+    for company_id, *row in rows.values_list('company_id', 'id', 'department_id', 'name', 'designation', 'status'):
+        employees[company_id].append(row)
+
+    renderer = JSONRenderer()
+    return {
+        company['id']: renderer.render({
+            **company,
+            'departments': _columns(departments[company['id']], DEPARTMENT_COLUMNS),
+            'employees': _columns(employees[company['id']], EMPLOYEE_COLUMNS),
+        })
+        for company in companies
+    }
+
+
+def rebuild(company_ids):
+    """
+    Render and store the snapshots of `company_ids`, and delete the rebuild
+    tasks queued for them before they were read. Returns `{company_id: built_at}`.
+    """
+    keys = [str(company_id) for company_id in company_ids]
+    with transaction.atomic():
+        # Tasks queued from now on are for changes the rendered rows may miss, they stay
+        task_ids = list(Task.objects.filter(kind='rebuild_snapshot', key__in=keys).values_list('id', flat=True))
+        built_at = timezone.now()
+        snapshots = [
+            CompanySnapshot(company_id=company_id, body=body, built_at=built_at)
+            for company_id, body in render_companies(company_ids).items()
+        ]
+        CompanySnapshot.objects.bulk_create(
+            snapshots, update_conflicts=True, unique_fields=['company'], update_fields=['body', 'built_at'],
+        )
+        Task.objects.filter(pk__in=task_ids).delete()
+    return {snapshot.company_id: built_at for snapshot in snapshots}
+
+
+def current_versions(company_ids=None):
+    """
+    `[(company_id, built_at)]` of the current snapshots of `company_ids`
+    (None for all companies), rebuilding the missing and outdated ones.
+    """
+    companies = Company.objects.order_by('id')
+    if company_ids is not None:
+        companies = companies.filter(pk__in=company_ids)
+    queued = Task.objects.filter(kind='rebuild_snapshot', key=Cast(OuterRef('pk'), CharField()))
+    rows = list(companies.annotate(queued=Exists(queued)).values_list('id', 'snapshot__built_at', 'queued'))
+
+    versions = {company_id: built_at for company_id, built_at, queued in rows if built_at is not None and not queued}
+    outdated = [company_id for company_id, built_at, queued in rows if company_id not in versions]
+    if outdated:
+        versions.update(rebuild(outdated))
+    return sorted(versions.items())
+
+
+def choose_encoding(accept_encoding):
+    """`br` (when brotli is installed), `gzip` or `identity`, whichever an Accept-Encoding header prefers first"""
+    accepted = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        params = params.replace(' ', '')
+        try:
+            if params.startswith('q=') and float(params[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    for coding in ('br', 'gzip') if brotli else ('gzip',):
+        if coding in accepted or '*' in accepted:
+            return coding
+    return 'identity'
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # No timestamp, so the same body always compresses to the same bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def assemble(company_ids):
+    """The response body: the stored company snapshots inside `{"companies": [...]}`"""
+    bodies = dict(CompanySnapshot.objects.filter(company_id__in=company_ids).values_list('company_id', 'body'))
+    return b'{"companies":[' + b','.join(bytes(bodies[pk]) for pk in company_ids if pk in bodies) + b']}'
+
+
+def bootstrap_response(request, company_ids=None):
+    """
+    The bootstrap snapshot of `company_ids` (None for all companies), or a
+    304 when the client has it. The ETag covers the snapshot versions and
+    the content coding.
+    """
+    # Outdated snapshots are rebuilt from what is read here, it must be current
+    pin_to_primary()
+    versions = current_versions(company_ids)
+    encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    etag = quote_etag(make_etag('bootstrap', encoding, *(f'{pk}@{built_at.isoformat()}' for pk, built_at in versions)))
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        key = f'bootstrap:{etag}'
+        body = get_response_cache().get(key)
+        if body is None:
+            body = compress(assemble([pk for pk, built_at in versions]), encoding)
+            get_response_cache().set(key, body, settings.RESPONSE_CACHE_TTL)
+        response = HttpResponse(body, content_type='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
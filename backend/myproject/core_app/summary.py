@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+from .models import Employee
+from .routers import cache_timeout, read_replica, reads_primary
+from .versioning import ALL_COMPANIES, company_scope, get_version
+
+
+def build_summary(company_id=None):
+    """
+    Headcount by status, department and designation plus hires per month,
+    for one company or for all of them.
+
+    Everything comes from a single GROUP BY over (status, department,
+    designation, hire month); the per-dimension totals are folded from those
+    groups, so the Python work depends on the number of groups, not rows.
+    """
+    employees = Employee.objects.all()
+    if company_id is not None:
+        employees = employees.filter(company_id=company_id)
+
+    groups = (
+        employees.annotate(month=TruncMonth('hired_on'))
+        .values('status', 'department_id', 'department__name', 'company_id', 'designation', 'month')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+    total = 0
+    by_status = {status: 0 for status, _ in Employee.EMPLOYEE_STATUS}
+    by_department, by_designation, hires_per_month = {}, {}, {}
+    for group in groups:
+        count = group['count']
+        total += count
+        by_status[group['status']] += count
+        department = by_department.setdefault(group['department_id'], {
+            'id': group['department_id'],
+            'name': group['department__name'],
+            'company': group['company_id'],
+            'count': 0,
+        })
+        department['count'] += count
+        by_designation[group['designation']] = by_designation.get(group['designation'], 0) + count
+        if group['status'] == 'hired' and group['month'] is not None:
+            month = group['month'].strftime('%Y-%m')
+            hires_per_month[month] = hires_per_month.get(month, 0) + count
+
+    return {
+        'company': company_id,
+        'total': total,
+        'by_status': by_status,
+        'by_department': sorted(by_department.values(), key=lambda department: department['id']),
+        'by_designation': dict(sorted(by_designation.items())),
+        'hires_per_month': [{'month': month, 'count': count} for month, count in sorted(hires_per_month.items())],
+    }
+
+
+def get_summary(company_id=None):
+    """
+    Cached `build_summary`. The key includes the company's data version,
+    which is bumped whenever one of its employees or departments changes.
+    """
+    scope = ALL_COMPANIES if company_id is None else company_scope(company_id)
+    key = f'summary:{scope}:{get_version(scope)}'
+    summary = cache.get(key)
+    if summary is None and not reads_primary():
+        # Built from a replica's data, kept apart: requests reading the primary don't use it
+        summary = cache.get(f'{key}:replica')
+    if summary is None:
+        summary = build_summary(company_id)
+        cache.set(f'{key}:replica' if read_replica() else key, summary, cache_timeout(settings.SUMMARY_CACHE_TTL))
+    return summary
@@ -0,0 +1,105 @@
+"""
+Synthetic companies, departments and employees for load tests and
+benchmarks. The same seed always produces the same data.
+"""
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Change, Company, Department, Employee, recount_denormalized_counters
+from .versioning import company_changed
+
+BATCH_SIZE = 5000
+
+DESIGNATIONS = [
+    'Accountant', 'Analyst', 'Architect', 'Designer', 'Developer', 'Engineer', 'Lead', 'Manager',
+    'Recruiter', 'Support Specialist', 'Technician', 'Tester',
+]
+FIRST_NAMES = [
+    'Aaliyah', 'Adam', 'Aisha', 'Alejandro', 'Amelia', 'Ana', 'Arjun', 'Ben', 'Carlos', 'Chen', 'Chloe', 'Daniel',
+    'David', 'Elena', 'Emma', 'Fatima', 'Grace', 'Hana', 'Hiro', 'Ivan', 'Jack', 'James', 'Jane', 'Javier', 'John',
+    'Julia', 'Kai', 'Laura', 'Leila', 'Liam', 'Lucas', 'Maria', 'Mateo', 'Mei', 'Mohammed', 'Nina', 'Noah', 'Olivia',
+    'Omar', 'Priya', 'Rahul', 'Sara', 'Sofia', 'Tariq', 'Thomas', 'Wei', 'Yuki', 'Zara',
+]
+LAST_NAMES = [
+    'Ahmed', 'Anderson', 'Brown', 'Chen', 'Clark', 'Davis', 'Diaz', 'Evans', 'Fernandez', 'Garcia', 'Gupta', 'Hall',
+    'Hernandez', 'Ito', 'Jackson', 'Johnson', 'Khan', 'Kim', 'Kowalski', 'Lee', 'Lopez', 'Martin', 'Martinez',
+    'Miller', 'Moore', 'Nguyen', 'Novak', 'Okafor', 'Patel', 'Perez', 'Rossi', 'Sanchez', 'Schmidt', 'Silva', 'Singh',
+    'Smith', 'Suzuki', 'Taylor', 'Thomas', 'Walker', 'Wang', 'White', 'Williams', 'Wilson', 'Wright', 'Young',
+]
+STREETS = [
+    'Main Street', 'High Street', 'Park Avenue', 'Oak Lane', 'Maple Drive', 'Cedar Road', 'Elm Street', 'Church Road',
+    'Station Road', 'Mill Lane', 'Harbour Road', 'King Street', 'Queen Street', 'River Walk', 'Hill Road',
+]
+DEPARTMENTS = ['Engineering', 'Finance', 'Human Resources', 'Legal', 'Marketing', 'Operations', 'Sales', 'Support']
+
+
+def create_companies(companies, departments):
+    """Bulk insert `companies` companies with `departments` departments each."""
+    # Continue after existing rows so seeding twice doesn't collide on unique names
+    offset = (Company.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    company_objs = Company.objects.bulk_create(Company(name=f'Company {offset + i}') for i in range(companies))
+    department_objs = Department.objects.bulk_create(
+        Department(company=company, name=f'{DEPARTMENTS[j % len(DEPARTMENTS)]} {j // len(DEPARTMENTS) + 1}')
+        for company in company_objs for j in range(departments)
+    )
+    Change.record(
+        [('company', company.pk, company.pk, 'create') for company in company_objs]
+        + [('department', department.pk, department.company_id, 'create') for department in department_objs]
+    )
+    return company_objs, department_objs
+
+
+def create_employees(departments, count, seed=0, batch_size=None, **kwargs):
+    """
+    Bulk insert `count` employees spread round-robin over `departments`,
+    with names, addresses, statuses, designations and hire dates drawn from
+    `seed`.
+    Counters are not updated, see `seed_synthetic_data`.
+    """
+    rng = random.Random(seed)
+    today = timezone.now().date()
+    statuses = [choice for choice, _ in Employee.EMPLOYEE_STATUS]
+    offset = (Employee.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def employees():
+        for i in range(offset, offset + count):
+            department = departments[i % len(departments)]
+            status = rng.choice(statuses)
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            yield Employee(
+                company_id=department.company_id,
+                department_id=department.id,
+                status=status,
+                name=f'{first} {last}',
+                email=f'{first.lower()}.{last.lower()}{i}@synthetic.example.com',
+                mobile_number=f'+1{rng.randrange(10 ** 9, 10 ** 10)}',
+                address=f'{rng.randrange(1, 1000)} {rng.choice(STREETS)}',
+                designation=rng.choice(DESIGNATIONS),
+                hired_on=today - timedelta(days=rng.randrange(3650)) if status == 'hired' else None,
+                **kwargs,
+            )
+
+    created = Employee.objects.bulk_create(employees(), batch_size=batch_size or BATCH_SIZE)
+    Change.record(('employee', employee.pk, employee.company_id, 'create') for employee in created)
+    return count
+
+
+def seed_synthetic_data(companies, departments, employees, seed=0, batch_size=None):
+    """
+    Create `companies` x `departments` x `employees` (per department) rows in
+    one transaction, then recount the denormalized counters of the new
+    companies. Returns the new companies and departments.
+    """
+    with transaction.atomic():
+        company_objs, department_objs = create_companies(companies, departments)
+        if department_objs:
+            create_employees(department_objs, len(department_objs) * employees, seed, batch_size)
+        company_ids = [company.id for company in company_objs]
+        recount_denormalized_counters(company_ids)
+        for company_id in company_ids:
+            company_changed(company_id)
+    return company_objs, department_objs
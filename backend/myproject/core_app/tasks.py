@@ -0,0 +1,117 @@
+"""
+A small task queue kept in the database (the `Task` table), for work that
+doesn't have to happen inside the request: with COUNTER_UPDATES =
+'deferred', hires, moves, deletes and imports queue a recount of the
+denormalized counters instead of updating the department and company rows
+themselves. There is no broker: a task is a row inserted in the writer's
+transaction, so it exists exactly when the write committed, and
+`manage.py run_worker` claims and runs the tasks.
+
+Tasks with the same kind and key are coalesced: a worker claims them
+together and runs the job once. Jobs recompute from the source tables, so
+running one late, twice or for several writes at once gives the same
+result. A failed job is retried with exponential backoff; a worker that
+dies leaves its claim to expire after TASK_LEASE seconds.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import snapshots
+from .models import Department, Task, recount_denormalized_counters
+from .versioning import company_changed
+
+logger = logging.getLogger(__name__)
+
+# Task kind -> function taking the task key
+JOBS = {}
+
+
+def job(func):
+    """Register `func` as the job run for tasks of the kind named after it"""
+    JOBS[func.__name__] = func
+    return func
+
+
+@job
+def recount_department(department_id):
+    """Recount the hired employees of a department, and its company's totals"""
+    company_id = Department.objects.filter(pk=department_id).values_list('company_id', flat=True).first()
+    if company_id is None:
+        return  # Deleted since, its company was updated then
+    recount_denormalized_counters([company_id], department_ids=[department_id])
+    company_changed(company_id)
+
+
+@job
+def recount_company(company_id):
+    recount_denormalized_counters([company_id])
+    company_changed(int(company_id))
+
+
+@job
+def rebuild_snapshot(company_id):
+    """Render the bootstrap snapshot of a company again"""
+    snapshots.rebuild([int(company_id)])
+
+
+def claim(batch_size):
+    """
+    Claim up to `batch_size` available tasks, plus the available duplicates
+    of the claimed ones, for TASK_LEASE seconds. Returns
+    `{(kind, key): [task ids]}`.
+    """
+    now = timezone.now()
+    available = Task.objects.select_for_update(skip_locked=True).filter(available_at__lte=now)
+    with transaction.atomic():
+        jobs = defaultdict(list)
+        for pk, kind, key in available.order_by('id').values_list('id', 'kind', 'key')[:batch_size]:
+            jobs[kind, key].append(pk)
+        keys_by_kind = defaultdict(list)
+        for kind, key in jobs:
+            keys_by_kind[kind].append(key)
+        claimed = [pk for ids in jobs.values() for pk in ids]
+        for kind, keys in keys_by_kind.items():
+            duplicates = available.filter(kind=kind, key__in=keys).exclude(pk__in=claimed)
+            for pk, key in duplicates.values_list('id', 'key'):
+                jobs[kind, key].append(pk)
+        ids = [pk for ids in jobs.values() for pk in ids]
+        if ids:
+            Task.objects.filter(pk__in=ids).update(available_at=now + timedelta(seconds=settings.TASK_LEASE))
+    return dict(jobs)
+
+
+def run_job(kind, key, ids):
+    """Run one coalesced job; its tasks are deleted in the same transaction, or rescheduled when it fails"""
+    try:
+        with transaction.atomic():
+            JOBS[kind](key)
+            Task.objects.filter(pk__in=ids).delete()
+        return True
+    except Exception as exc:
+        logger.exception('Task %s(%s) failed', kind, key)
+        tasks = Task.objects.filter(pk__in=ids)
+        attempts = (tasks.aggregate(attempts=Max('attempts'))['attempts'] or 0) + 1
+        if attempts >= settings.TASK_MAX_ATTEMPTS:
+            available_at = None  # Give up, the row stays for inspection
+        else:
+            available_at = timezone.now() + timedelta(seconds=2 ** attempts)
+        tasks.update(attempts=attempts, available_at=available_at, last_error=f'{type(exc).__name__}: {exc}')
+        return False
+
+
+def run_pending(batch_size=100):
+    """Run available tasks until there are none left. Returns the number of jobs run (coalesced)."""
+    count = 0
+    while True:
+        jobs = claim(batch_size)
+        if not jobs:
+            return count
+        for (kind, key), ids in jobs.items():
+            run_job(kind, key, ids)
+        count += len(jobs)
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the tests with QUERY_BUDGET_ACTION = 'raise': a request going over its query budget fails its test"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._query_budget_action = settings.QUERY_BUDGET_ACTION
+        settings.QUERY_BUDGET_ACTION = 'raise'
+
+    def teardown_test_environment(self, **kwargs):
+        settings.QUERY_BUDGET_ACTION = self._query_budget_action
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,2300 @@
-from django.test import TestCase
+import base64
+import contextvars
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.contrib.auth.hashers import make_password
+from django.conf import settings
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.db.models import F
+from django.db.utils import load_backend
+from django.test import AsyncRequestFactory, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from rest_framework import renderers
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+
+from . import async_views, bulk, changelog, routers, search, snapshots, tasks, urls
+from .authentication import get_token_cache
+from .filters import prefix_filter
+from .instrumentation import QueryBudgetExceeded
+from .response_cache import get_response_cache
+from .scoping import scope
+from .models import (
+    Change, Company, CompanySnapshot, Department, Employee, Task, User, VersionConflict, recount_denormalized_counters,
+)
+from .pagination import EstimatedCountPaginator
+from .parsers import JSONParser
+from .renderers import JSONRenderer
+from .serializers import CompanySerializer, EmployeeSerializer
+from .tasks import run_pending
+
+
+class APITestCase(TestCase):
+    """Shared fixtures: one company, one department and an admin client."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin', email='admin@example.com', password='secret', role='admin')
+        cls.company = Company.objects.create(name='Acme')
+        cls.department = Department.objects.create(company=cls.company, name='Engineering')
+
+    def setUp(self):
+        get_token_cache().clear()
+        get_response_cache().clear()
+        self.client = APIClient()
+        token, _ = Token.objects.get_or_create(user=self.admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def make_employees(self, count, **kwargs):
+        start = Employee.objects.count()
+        return [
+            Employee.objects.create(
+                company=self.company,
+                department=self.department,
+                name=f'Employee {i}',
+                email=f'employee{i}@example.com',
+                mobile_number='+123456789',
+                address='1 Main Street',
+                designation='Developer',
+                **kwargs,
+            )
+            for i in range(start, start + count)
+        ]
+
+
+class ListPaginationTests(APITestCase):
+
+    def test_list_without_pagination_params_returns_plain_list(self):
+        self.make_employees(3)
+        response = self.client.get('/api/employees/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+
+    def test_cursor_pagination_walks_every_row_once(self):
+        employees = self.make_employees(5)
+        seen = []
+        response = self.client.get('/api/employees/', {'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, [e.id for e in employees])
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_fields_limits_serialized_keys(self):
+        self.make_employees(1)
+        response = self.client.get('/api/employees/', {'fields': 'id,name,days_employed'})
+        self.assertEqual(set(response.data[0]), {'id', 'name', 'days_employed'})
+
+        response = self.client.get('/api/companies/', {'fields': 'name', 'page_size': 10})
+        self.assertEqual(response.data['results'], [{'name': 'Acme'}])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/departments/', {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class EmployeeFilterTests(APITestCase):
+
+    def test_filters_and_ordering(self):
+        first, second, third = self.make_employees(3)
+        Employee.objects.filter(pk=second.pk).update(status='hired', hired_on='2024-03-01', name='Zed')
+        Employee.objects.filter(pk=third.pk).update(status='hired', hired_on='2024-06-01', name='Amy')
+
+        response = self.client.get('/api/employees/', {'company': self.company.id, 'status': 'hired', 'ordering': 'name'})
+        self.assertEqual([row['id'] for row in response.data], [third.id, second.id])
+
+        response = self.client.get('/api/employees/', {'hired_on_after': '2024-04-01'})
+        self.assertEqual([row['id'] for row in response.data], [third.id])
+
+        response = self.client.get('/api/employees/', {'search': 'employee0@'})
+        self.assertEqual([row['id'] for row in response.data], [first.id])
+
+        # A character beyond U+FFFF after the prefix
+        Employee.objects.filter(pk=first.pk).update(name='Zed\U0001F600')
+        response = self.client.get('/api/employees/', {'search': 'Zed', 'ordering': 'id'})
+        self.assertEqual([row['id'] for row in response.data], [first.id, second.id])
+
+    def test_ordering_with_cursor_pagination(self):
+        employees = self.make_employees(4)
+        response = self.client.get('/api/employees/', {'ordering': '-id', 'page_size': 3})
+        self.assertEqual([row['id'] for row in response.data['results']], [e.id for e in employees[::-1][:3]])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], [employees[0].id])
+
+    def test_cursor_pagination_pages_through_ties_and_nulls(self):
+        employees = self.make_employees(7)
+        hiring_dates = ['2024-03-01', '2024-03-01', None, '2023-01-01', '2024-03-01', None, '2022-05-05']
+        for employee, hired_on in zip(employees, hiring_dates):
+            Employee.objects.filter(pk=employee.pk).update(
+                hired_on=hired_on, status='hired' if hired_on else 'application_received',
+            )
+
+        for ordering in ('hired_on', '-hired_on', 'status', '-status', 'days_employed', '-days_employed'):
+            with self.subTest(ordering):
+                column = ordering.lstrip('-')
+                key = F(column).desc(nulls_first=True) if ordering.startswith('-') else F(column).asc(nulls_last=True)
+                expected = list(Employee.objects.with_days_employed().order_by(key, 'id').values_list('id', flat=True))
+
+                response = self.client.get('/api/employees/', {'ordering': ordering, 'page_size': 2})
+                seen = [row['id'] for row in response.data['results']]
+                while response.data['next']:
+                    response = self.client.get(response.data['next'])
+                    seen.extend(row['id'] for row in response.data['results'])
+                self.assertEqual(seen, expected)
+
+                # And back from the last page
+                seen = [row['id'] for row in response.data['results']]
+                while response.data['previous']:
+                    response = self.client.get(response.data['previous'])
+                    seen[:0] = [row['id'] for row in response.data['results']]
+                self.assertEqual(seen, expected)
+
+                # The plain list has the same order
+                response = self.client.get('/api/employees/', {'ordering': ordering})
+                self.assertEqual([row['id'] for row in response.data], expected)
+
+    def test_malformed_cursor_is_not_found(self):
+        self.make_employees(1)
+        for position in ('[1]', '["x","y"]', 'nope'):
+            cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+            response = self.client.get('/api/employees/', {'ordering': 'hired_on', 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'status': 'retired'}, {'ordering': 'address'}, {'hired_on_after': 'yesterday'}):
+            response = self.client.get('/api/employees/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_filters_use_indexes(self):
+        plans = {
+            'employee_company_status_idx': Employee.objects.filter(company=self.company, status='hired'),
+            'employee_dept_status_idx': Employee.objects.filter(department=self.department, status='hired'),
+            'employee_hired_on_idx': Employee.objects.filter(hired_on__gte='2024-01-01'),
+            'employee_name_idx': Employee.objects.filter(prefix_filter('name', 'Am')),
+        }
+        for index, queryset in plans.items():
+            self.assertIn(index, queryset.explain(), index)
+
+
+class EmployeeSearchTests(APITestCase):
+
+    def make_employee(self, name, email, designation='Developer', address='1 Main Street', **kwargs):
+        return Employee.objects.create(
+            company=self.company, department=self.department, name=name, email=email,
+            mobile_number='+123456789', address=address, designation=designation, **kwargs,
+        )
+
+    def search(self, q, **params):
+        response = self.client.get('/api/employees/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def names(self, q, **params):
+        return [row['name'] for row in self.search(q, **params)['results']]
+
+    def test_matches_words_and_prefixes_of_every_field(self):
+        self.make_employee('Jane Doe', 'jane@acme.example.com', address='4 Harbour Road')
+        self.make_employee('John Roe', 'jroe@example.com', designation='Tester')
+        self.assertEqual(self.names('jane'), ['Jane Doe'])
+        self.assertEqual(self.names('Ja'), ['Jane Doe'])
+        self.assertEqual(self.names('acme'), ['Jane Doe'])
+        self.assertEqual(self.names('jroe@example.com'), ['John Roe'])
+        self.assertEqual(self.names('test'), ['John Roe'])
+        self.assertEqual(self.names('harbour rd'), [])
+        self.assertEqual(self.names('harbour ro'), ['Jane Doe'])
+        self.assertEqual(self.names('DOE jane'), ['Jane Doe'])
+        self.assertEqual(self.names('jane roe'), [])
+        # Only the last word is a prefix, and one letter only counts on its own
+        self.assertEqual(self.names('ja doe'), [])
+        self.assertEqual(self.names('jane r'), ['Jane Doe'])
+        self.assertCountEqual(self.names('j'), ['Jane Doe', 'John Roe'])
+        self.assertEqual(self.names('?!'), [])
+
+    def test_name_matches_rank_first(self):
+        self.make_employee('Ann Smith', 'ann@example.com', address='1 Baker Street')
+        self.make_employee('Bob Baker', 'bob@example.com')
+        self.make_employee('Cy Jones', 'baker@example.com')
+        self.assertEqual(self.names('baker'), ['Bob Baker', 'Cy Jones', 'Ann Smith'])
+
+    def test_the_index_follows_every_write(self):
+        employee = self.make_employee('Jane Doe', 'jane@example.com')
+        employee.name = 'Janet Doe'
+        employee.save()
+        self.assertEqual(self.names('janet'), ['Janet Doe'])
+        Employee.objects.filter(pk=employee.pk).update(designation='Architect')
+        self.assertEqual(self.names('architect'), ['Janet Doe'])
+        self.assertEqual(self.names('developer'), [])
+        employee.delete()
+        self.assertEqual(self.names('janet'), [])
+
+        rows = f'{self.company.pk},{self.department.pk},Ann,ann@example.com,+123456789,Street 1,Developer\n'
+        self.client.post('/api/employees/bulk/', {'file': SimpleUploadedFile(
+            'rows.csv', ('company,department,name,email,mobile_number,address,designation\n' + rows).encode(),
+        )}, format='multipart')
+        self.assertEqual(self.names('ann'), ['Ann'])
+
+    def test_pages(self):
+        for i in range(5):
+            self.make_employee(f'Jane {i}', f'jane{i}@example.com')
+        first = self.search('jane', page_size=2)
+        self.assertEqual([row['name'] for row in first['results']], ['Jane 0', 'Jane 1'])
+        self.assertIsNone(first['previous'])
+        last = self.client.get(self.client.get(first['next']).data['next']).data
+        self.assertEqual([row['name'] for row in last['results']], ['Jane 4'])
+        self.assertIsNone(last['next'])
+        self.assertIn('page=2', last['previous'])
+        self.assertEqual(self.search('jane', fields='id,name')['results'][0], {'id': Employee.objects.first().pk, 'name': 'Jane 0'})
+
+    def test_scoped_to_the_users_company(self):
+        other_company = Company.objects.create(name='Globex')
+        other_department = Department.objects.create(company=other_company, name='Sales')
+        self.make_employee('Jane Doe', 'jane@example.com')
+        Employee.objects.create(
+            company=other_company, department=other_department, name='Jane Roe', email='jroe@example.com',
+            mobile_number='+123456789', address='1 Main Street', designation='Developer',
+        )
+        manager = User.objects.create(
+            username='manager', email='manager@example.com', password='secret', role='manager', company=self.company,
+        )
+        self.client.force_authenticate(manager)
+        self.assertEqual(self.names('jane'), ['Jane Doe'])
+        Employee.objects.filter(name='Jane Roe').update(company=self.company, department=self.department)
+        self.assertEqual(self.names('jane'), ['Jane Doe', 'Jane Roe'])
+        manager.company = None
+        self.assertEqual(self.names('jane'), [])
+
+    def test_other_databases_match_every_word_anywhere(self):
+        self.make_employee('Jane Doe', 'jane@acme.example.com', address='4 Harbour Road')
+        self.make_employee('John Roe', 'jroe@example.com', designation='Tester')
+        self.make_employee('Joan Harbour', 'joan@example.com')
+        with patch.object(connection, 'vendor', 'mysql'):
+            self.assertEqual(self.names('harbour'), ['Jane Doe', 'Joan Harbour'])
+            self.assertEqual(self.names('ROAD harb'), ['Jane Doe'])
+            self.assertEqual(self.names('test'), ['John Roe'])
+            self.assertEqual(self.names('jane roe'), [])
+            self.assertEqual(self.names('o', page=2, page_size=2), ['Joan Harbour'])
+
+    def test_validation(self):
+        self.assertEqual(self.client.get('/api/employees/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/employees/search/?q=a&page_size=1000').status_code, 400)
+
+    def test_rebuild_command(self):
+        self.make_employee('Jane Doe', 'jane@example.com')
+        search.uninstall(connection)
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.names('jane'), ['Jane Doe'])
+        self.make_employee('John Roe', 'jroe@example.com')
+        self.assertEqual(self.names('john'), ['John Roe'])
+
+
+@override_settings(COUNTER_UPDATES='inline')
+class CounterTests(APITestCase):
+
+    def assertCounts(self, company_departments, company_employees, department_employees):
+        self.company.refresh_from_db()
+        self.department.refresh_from_db()
+        self.assertEqual(
+            (self.company.num_departments, self.company.num_employees, self.department.num_employees),
+            (company_departments, company_employees, department_employees),
+        )
+
+    def test_counters_follow_hired_transitions(self):
+        employee, other = self.make_employees(2)
+        self.assertCounts(1, 0, 0)
+
+        employee.status = 'hired'
+        employee.save()
+        employee.save()  # Re-saving a hired employee is not a transition
+        self.assertCounts(1, 1, 1)
+
+        other.status = 'hired'
+        other.save()
+        other.status = 'not_accepted'
+        other.save()
+        self.assertCounts(1, 1, 1)
+
+        employee.delete()
+        self.assertCounts(1, 0, 0)
+
+    def test_department_create_and_delete(self):
+        sales = Department.objects.create(company=self.company, name='Sales')
+        employee = self.make_employees(1)[0]
+        employee.department = sales
+        employee.status = 'hired'
+        employee.save()
+        self.assertCounts(2, 1, 0)
+
+        sales.delete()
+        self.assertCounts(1, 0, 0)
+
+    def test_hire_runs_constant_number_of_queries(self):
+        employee = self.make_employees(1)[0]
+        employee.status = 'hired'
+        # savepoint, UPDATE the employee, the department and the company (their triggers log them),
+        # queue the snapshot rebuild, release
+        with self.assertNumQueries(6):
+            employee.save()
+
+    def test_recount_command_fixes_drift(self):
+        for employee in self.make_employees(3):
+            employee.status = 'hired'
+            employee.save()
+        Company.objects.update(num_departments=9, num_employees=0)
+        Department.objects.update(num_employees=42)
+
+        call_command('recount_denormalized_counters', stdout=StringIO())
+        self.assertCounts(1, 3, 3)
+
+    def test_command_only_invalidates_corrected_companies(self):
+        other = Company.objects.create(name='Globex')
+        Department.objects.filter(pk=self.department.pk).update(num_employees=4)
+        out = StringIO()
+        with patch('core_app.management.commands.recount_denormalized_counters.company_changed') as changed:
+            call_command('recount_denormalized_counters', stdout=out)
+        changed.assert_called_once_with(self.company.pk)
+        self.assertEqual(out.getvalue().strip(), 'Corrected the counters of 1 companies (1 departments).')
+
+        with patch('core_app.management.commands.recount_denormalized_counters.company_changed') as changed:
+            call_command('recount_denormalized_counters', '--company', str(other.pk), stdout=StringIO())
+        changed.assert_not_called()
+
+    def test_recount_only_writes_and_logs_drifted_rows(self):
+        for employee in self.make_employees(2):
+            employee.status = 'hired'
+            employee.save()
+        sales = Department.objects.create(company=self.company, name='Sales')
+        seq = Change.objects.latest('seq').seq
+        self.assertEqual(recount_denormalized_counters(), (set(), set()))
+        self.assertFalse(Change.objects.filter(seq__gt=seq).exists())
+
+        Department.objects.filter(pk=sales.pk).update(num_employees=5)
+        seq = Change.objects.latest('seq').seq
+        self.assertEqual(recount_denormalized_counters(), ({self.company.pk}, {sales.pk}))
+        self.assertEqual(
+            list(Change.objects.filter(seq__gt=seq).values_list('kind', 'object_id', 'action')),
+            [('department', sales.pk, 'update')],
+        )
+        self.assertCounts(2, 2, 2)
+
+
+@override_settings(COUNTER_UPDATES='deferred')
+class TaskQueueTests(APITestCase):
+    """COUNTER_UPDATES = 'deferred': writes queue recounts that a worker runs later"""
+
+    def setUp(self):
+        super().setUp()
+        Task.objects.all().delete()  # Snapshot rebuilds queued by setUpTestData
+
+    def make_employees(self, count, **kwargs):
+        employees = super().make_employees(count, **kwargs)
+        # Only leave the tasks the tested writes queue
+        Task.objects.all().delete()
+        return employees
+
+    def hire(self, employee):
+        return self.client.put(f'/api/employees/{employee.pk}/update/', {'status': 'hired'}, format='json')
+
+    def counts(self):
+        self.company.refresh_from_db()
+        self.department.refresh_from_db()
+        return self.company.num_employees, self.department.num_employees
+
+    def test_counters_are_eventually_consistent(self):
+        employees = self.make_employees(3)
+        for employee in employees[:2]:
+            self.hire(employee)
+        self.client.delete(f'/api/employees/{employees[0].pk}/delete/')
+        self.assertEqual(self.counts(), (0, 0))
+        self.assertEqual(Task.objects.count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            # The recount, then the snapshot rebuild it queues
+            self.assertEqual(run_pending(), 2)
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertFalse(Task.objects.exists())
+        # The cached summaries and responses are invalidated
+        self.assertTrue(callbacks)
+
+    def test_hire_doesnt_write_counter_rows(self):
+        self.client.get('/api/companies/')  # Caches the token
+        for count in (1, 10):
+            employees = self.make_employees(count)
+            with CaptureQueriesContext(connection) as queries:
+                for employee in employees:
+                    self.assertEqual(self.hire(employee).status_code, 200)
+            # The same statements for every hire, and none locks the department or company row
+            self.assertEqual(len(queries), 5 * count)
+            statements = [query['sql'] for query in queries]
+            self.assertFalse([sql for sql in statements if re.match(r'UPDATE "core_app_(company|department)"', sql)])
+            self.assertEqual(sum(sql.startswith('INSERT INTO "core_app_task"') for sql in statements), count)
+
+    def test_duplicate_tasks_are_coalesced(self):
+        sales = Department.objects.create(company=self.company, name='Sales')
+        Task.objects.all().delete()
+        Task.enqueue('recount_department', [self.department.pk] * 5 + [sales.pk] * 2)
+        calls = []
+        with patch.dict(tasks.JOBS, recount_department=calls.append):
+            self.assertEqual(run_pending(batch_size=1), 2)
+        self.assertEqual(sorted(calls), sorted([str(self.department.pk), str(sales.pk)]))
+        self.assertFalse(Task.objects.exists())
+
+    def test_task_queued_while_the_job_runs_is_kept(self):
+        Task.enqueue('recount_department', [self.department.pk])
+        # A write committed while the worker runs needs another run
+        with patch.dict(tasks.JOBS, recount_department=lambda key: Task.enqueue('recount_department', [key])):
+            claimed = tasks.claim(10)
+            for (kind, key), ids in claimed.items():
+                tasks.run_job(kind, key, ids)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        Task.enqueue('recount_department', [self.department.pk])
+
+        def fail(key):
+            raise RuntimeError('database went away')
+
+        with patch.dict(tasks.JOBS, recount_department=fail), self.assertLogs('core_app.tasks', 'ERROR'):
+            run_pending()
+            task = Task.objects.get()
+            self.assertEqual((task.attempts, task.last_error), (1, 'RuntimeError: database went away'))
+            self.assertGreater(task.available_at, timezone.now())
+
+            for attempt in range(2, settings.TASK_MAX_ATTEMPTS + 1):
+                Task.objects.update(available_at=timezone.now())
+                run_pending()
+        task = Task.objects.get()
+        self.assertEqual((task.attempts, task.available_at), (settings.TASK_MAX_ATTEMPTS, None))
+
+    def test_expired_claim_is_claimed_again(self):
+        Task.enqueue('rebuild_snapshot', [self.company.pk])
+        self.assertEqual(len(tasks.claim(10)), 1)
+        # Claimed tasks are hidden from other workers until the lease expires
+        self.assertEqual(tasks.claim(10), {})
+        Task.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(run_pending(), 1)
+
+    def test_run_worker_command(self):
+        for employee in self.make_employees(2):
+            self.hire(employee)
+        out = StringIO()
+        call_command('run_worker', '--once', stdout=out)
+        self.assertEqual(out.getvalue(), 'Ran 2 jobs.\n')  # The recount, then the snapshot rebuild
+        self.assertEqual(self.counts(), (2, 2))
+
+    @override_settings(COUNTER_UPDATES='inline')
+    def test_inline_updates_queue_nothing(self):
+        self.hire(self.make_employees(1)[0])
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertEqual(list(Task.objects.values_list('kind', flat=True)), ['rebuild_snapshot'])
+
+
+class SeedSyntheticDataTests(TestCase):
+
+    def test_seed_is_reproducible_and_counters_match(self):
+        call_command('seed_synthetic_data', companies=2, departments=3, employees=4, seed=7, stdout=StringIO())
+        self.assertEqual((Company.objects.count(), Department.objects.count(), Employee.objects.count()), (2, 6, 24))
+        for department in Department.objects.all():
+            self.assertEqual(department.employees.count(), 4)
+            self.assertEqual(department.num_employees, department.employees.filter(status='hired').count())
+        for company in Company.objects.all():
+            self.assertEqual(company.num_departments, 3)
+            self.assertEqual(company.num_employees, company.employees.filter(status='hired').count())
+        first = list(Employee.objects.order_by('id').values_list('status', 'designation', 'mobile_number'))
+
+        # Seeding again adds new rows with the same random draws
+        call_command('seed_synthetic_data', companies=2, departments=3, employees=4, seed=7, stdout=StringIO())
+        second = list(Employee.objects.order_by('id').values_list('status', 'designation', 'mobile_number')[24:])
+        self.assertEqual(second, first)
+
+
+class FastJSONTests(APITestCase):
+    """orjson rendering/parsing and the values() path of EmployeeSerializer match DRF's output byte for byte"""
+
+    def drf_bytes(self, data):
+        return renderers.JSONRenderer().render(data)
+
+    def test_values_path_matches_serializer(self):
+        employees = self.make_employees(3)
+        employees[0].name = 'Zoë \u2028 Ünicode'
+        employees[0].status = 'hired'
+        employees[0].save()
+        Employee.objects.filter(pk=employees[1].pk).update(status='hired', hired_on='2021-02-03')
+
+        for params in ({}, {'fields': 'name,hired_on'}, {'ordering': '-days_employed'},
+                       {'ordering': 'hired_on', 'fields': 'id', 'page_size': 2}, {'page_size': 1, 'fields': 'email'}):
+            with self.subTest(params):
+                with patch.object(EmployeeSerializer, 'to_representation') as to_representation:
+                    response = self.client.get('/api/employees/', params)
+                to_representation.assert_not_called()
+
+                ordering = params.get('ordering', 'id')
+                column = ordering.lstrip('-')
+                key = F(column).desc(nulls_first=True) if ordering.startswith('-') else F(column).asc(nulls_last=True)
+                rows = Employee.objects.with_days_employed().order_by(key, 'id')[:params.get('page_size')]
+                fields = params['fields'].split(',') if 'fields' in params else None
+                expected = self.drf_bytes(EmployeeSerializer(rows, many=True, fields=fields).data)
+                if 'page_size' in params:
+                    # The rows rendered on their own
+                    self.assertEqual(self.drf_bytes(json.loads(response.content)['results']), expected)
+                else:
+                    self.assertEqual(response.content, expected)
+
+    def test_values_path_follows_cursors(self):
+        employees = self.make_employees(5)
+        seen, url = [], '/api/employees/?page_size=2&ordering=name'
+        while url:
+            body = json.loads(self.client.get(url).content)
+            seen.extend(row['id'] for row in body['results'])
+            url = body['next']
+        self.assertEqual(seen, sorted((e.id for e in employees), key=lambda pk: Employee.objects.get(pk=pk).name))
+
+    def test_renderer_matches_stdlib(self):
+        data = {
+            'text': 'line\u2028paragraph\u2029 ünïcode ✓', 'int': 2 ** 62, 'none': None, 'bool': True,
+            'when': timezone.now(), 'day': timezone.now().date(), 'time': timezone.now().time(),
+            'decimal': Decimal('1.50'), 'lazy': gettext_lazy('Invalid token.'), 1: 'int key', 'nested': [(1, 2), {}],
+        }
+        self.assertEqual(JSONRenderer().render(data), self.drf_bytes(data))
+        # Beyond orjson's range, and indented output, fall back to the stdlib encoder
+        self.assertEqual(JSONRenderer().render({'big': 2 ** 70}), self.drf_bytes({'big': 2 ** 70}))
+        self.assertEqual(JSONRenderer().render(data, 'application/json; indent=4'),
+                         renderers.JSONRenderer().render(data, 'application/json; indent=4'))
+        with patch('core_app.renderers.orjson', None):
+            self.assertEqual(JSONRenderer().render(data), self.drf_bytes(data))
+
+    def test_parser(self):
+        parse = lambda body: JSONParser().parse(BytesIO(body))
+        self.assertEqual(parse('{"name": "Zoë", "ids": [1, 2]}'.encode()), {'name': 'Zoë', 'ids': [1, 2]})
+        for body in (b'{"a": NaN}', b'{"a": '):
+            with self.subTest(body), self.assertRaisesMessage(ParseError, 'JSON parse error'):
+                parse(body)
+        # Only the stdlib accepts lone surrogates
+        self.assertEqual(parse(b'"\\ud800"'), '\ud800')
+        with patch('core_app.parsers.orjson', None):
+            self.assertEqual(parse(b'[1, "two"]'), [1, 'two'])
+
+        response = self.client.put(f'/api/employees/{self.make_employees(1)[0].pk}/update/', '{"address": "2 Side',
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class VersionTests(APITestCase):
+
+    def test_saves_bump_the_version(self):
+        employee = self.make_employees(1)[0]
+        self.assertEqual(self.client.get(f'/api/employees/{employee.pk}/').data['version'], 1)
+        response = self.client.put(f'/api/employees/{employee.pk}/update/', {'address': '2 Side Street'}, format='json')
+        self.assertEqual(response.data['version'], 2)
+        response = self.client.put(f'/api/companies/{self.company.pk}/update/', {'name': 'Acme Corp'}, format='json')
+        self.assertEqual(response.data['version'], 2)
+
+    def test_stale_version_conflicts(self):
+        employee = self.make_employees(1)[0]
+        self.client.put(f'/api/employees/{employee.pk}/update/', {'name': 'First'}, format='json')
+
+        for request in (
+            {'data': {'name': 'Second'}, 'HTTP_IF_MATCH': '"1"'},
+            {'data': {'name': 'Second', 'version': 1}},
+        ):
+            response = self.client.put(f'/api/employees/{employee.pk}/update/', format='json', **request)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.data['version'], 2)
+        employee.refresh_from_db()
+        self.assertEqual((employee.name, employee.version), ('First', 2))
+
+        response = self.client.put(
+            f'/api/employees/{employee.pk}/update/', {'name': 'Second'}, format='json', HTTP_IF_MATCH='"2"',
+        )
+        self.assertEqual((response.status_code, response.data['version']), (200, 3))
+        response = self.client.put(
+            f'/api/departments/{self.department.pk}/update/', {'company': self.company.pk, 'name': 'R&D', 'version': 5},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 409)
+
+    def test_version_format(self):
+        url = f'/api/companies/{self.company.pk}/update/'
+        self.assertEqual(self.client.put(url, {'name': 'A'}, format='json', HTTP_IF_MATCH='1').status_code, 200)
+        self.assertEqual(self.client.put(url, {'name': 'B'}, format='json', HTTP_IF_MATCH='*').status_code, 200)
+        for if_match in ('"abc"', '"2", "3"', '"0"'):
+            self.assertEqual(self.client.put(url, {'name': 'C'}, format='json', HTTP_IF_MATCH=if_match).status_code, 400)
+        self.assertEqual(self.client.put(url, {'name': 'C', 'version': 'x'}, format='json').status_code, 400)
+
+    def test_cross_origin_preflight_allows_if_match(self):
+        response = self.client.options(
+            f'/api/companies/{self.company.pk}/update/',
+            HTTP_ORIGIN='http://localhost:7070',
+            HTTP_ACCESS_CONTROL_REQUEST_METHOD='PUT',
+            HTTP_ACCESS_CONTROL_REQUEST_HEADERS='authorization, content-type, if-match',
+        )
+        self.assertEqual(response['Access-Control-Allow-Origin'], 'http://localhost:7070')
+        self.assertIn('if-match', response['Access-Control-Allow-Headers'].split(', '))
+
+    def test_stale_instance_conflicts(self):
+        employee = self.make_employees(1)[0]
+        stale = Employee.objects.get(pk=employee.pk)
+        employee.name = 'First'
+        employee.save()
+        stale.name = 'Second'
+        with self.assertRaises(VersionConflict):
+            stale.save()
+        self.assertEqual(Employee.objects.get(pk=employee.pk).name, 'First')
+
+    def test_transitions_bump_the_version(self):
+        employee = self.make_employees(1)[0]
+        self.client.post('/api/employees/transitions/', [{'id': employee.pk, 'status': 'interview_scheduled'}], format='json')
+        response = self.client.put(
+            f'/api/employees/{employee.pk}/update/', {'status': 'not_accepted', 'version': 1}, format='json',
+        )
+        self.assertEqual(response.status_code, 409)
+
+    @override_settings(COUNTER_UPDATES='inline')
+    def test_saves_keep_counter_increments(self):
+        company = Company.objects.get(pk=self.company.pk)
+        department = Department.objects.get(pk=self.department.pk)
+        self.make_employees(2, status='hired')
+        # Counter increments don't bump the version, and aren't written back
+        company.name = 'Acme Corp'
+        company.save()
+        department.name = 'R&D'
+        department.save()
+        company.refresh_from_db()
+        department.refresh_from_db()
+        self.assertEqual((company.num_departments, company.num_employees, department.num_employees), (1, 2, 2))
+
+
+class FileDatabaseTestCase(SimpleTestCase):
+    """Runs code in threads with their own connections to a migrated file database"""
+
+    databases = {'default'}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        # Connections opened from now on, by the threads, use the file
+        patcher = patch.dict(connections['default'].settings_dict, NAME=os.path.join(directory.name, 'db.sqlite3'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.in_thread(lambda: call_command('migrate', verbosity=0))
+
+    def in_thread(self, *functions):
+        """Run each function in a thread of its own, with a connection of its own, and return their errors"""
+        errors = []
+
+        def run(function):
+            try:
+                function()
+            except Exception as exc:  # pragma: no cover - reported by the caller
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(function,)) for function in functions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+
+class ConcurrentUpdateTests(FileDatabaseTestCase):
+    """Threads updating the same rows through their own connections to a file database"""
+
+    hirers = 4
+    hires_per_thread = 10
+    renamers = 4
+    renames_per_thread = 10
+
+    @override_settings(COUNTER_UPDATES='inline')
+    def test_no_lost_counter_increments_or_edits(self):
+        ids, renamed = {}, []
+
+        def create():
+            ids['admin'] = User.objects.create(username='admin', email='admin@example.com', password='!', role='admin')
+            company = Company.objects.create(name='Acme')
+            ids['company'], ids['department'] = company.pk, Department.objects.create(company=company, name='R&D').pk
+
+        self.assertEqual(self.in_thread(create), [])
+
+        def hire(thread):
+            for i in range(self.hires_per_thread):
+                Employee.objects.create(
+                    company_id=ids['company'], department_id=ids['department'], status='hired',
+                    name=f'Employee {thread}-{i}', email=f'employee{thread}-{i}@example.com',
+                    mobile_number='+123456789', address='1 Main Street', designation='Developer',
+                )
+
+        def rename(thread):
+            client = APIClient()
+            client.force_authenticate(ids['admin'])
+            for i in range(self.renames_per_thread):
+                # Without a version: retried when another rename got in between
+                response = client.put(f'/api/companies/{ids["company"]}/update/', {'name': f'Acme {thread}-{i}'}, format='json')
+                self.assertIn(response.status_code, (200, 409))
+                renamed.append(response.status_code == 200)
+                response = client.put(
+                    f'/api/departments/{ids["department"]}/update/',
+                    {'company': ids['company'], 'name': f'R&D {thread}-{i}'}, format='json',
+                )
+                self.assertIn(response.status_code, (200, 409))
+
+        # Retries and lock waits take these requests over their query budgets
+        with patch.object(logging.getLogger('core_app.instrumentation'), 'disabled', True):
+            errors = self.in_thread(
+                *(lambda thread=thread: hire(thread) for thread in range(self.hirers)),
+                *(lambda thread=thread: rename(thread) for thread in range(self.renamers)),
+            )
+        self.assertEqual(errors, [])
+
+        counts = {}
+
+        def read():
+            counts['company'] = Company.objects.values_list('num_employees', 'num_departments', 'version').get()
+            counts['department'] = Department.objects.values_list('num_employees', 'version').get()
+
+        self.in_thread(read)
+        hired = self.hirers * self.hires_per_thread
+        self.assertEqual(counts['company'][:2], (hired, 1))
+        self.assertEqual(counts['department'][0], hired)
+        # Every rename that went through is one version
+        self.assertEqual(counts['company'][2], 1 + sum(renamed))
+
+    def test_one_of_many_edits_of_a_version_wins(self):
+        ids = {}
+
+        def create():
+            ids['admin'] = User.objects.create(username='admin', email='admin@example.com', password='!', role='admin')
+            ids['company'] = Company.objects.create(name='Acme').pk
+
+        self.in_thread(create)
+        statuses = []
+
+        def edit(thread):
+            client = APIClient()
+            client.force_authenticate(ids['admin'])
+            response = client.put(
+                f'/api/companies/{ids["company"]}/update/', {'name': f'Acme {thread}'}, format='json', HTTP_IF_MATCH='"1"',
+            )
+            statuses.append(response.status_code)
+
+        self.assertEqual(self.in_thread(*(lambda thread=thread: edit(thread) for thread in range(8))), [])
+        self.assertEqual(sorted(statuses), [200] + [409] * 7)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL runs the change log writers concurrently')
+class ChangeLogWriterTests(TransactionTestCase):
+    """An update left uncommitted in a thread while the test writes and reads through its own connection"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', email='admin@example.com', password='!', role='admin')
+        company = Company.objects.create(name='Acme')
+        department = Department.objects.create(company=company, name='R&D')
+        self.first, self.second = (
+            Employee.objects.create(
+                company=company, department=department, name=f'Employee {i}', email=f'employee{i}@example.com',
+                mobile_number='+123456789', address='1 Main Street', designation='Developer',
+            ).pk
+            for i in range(2)
+        )
+
+    def update_while_first_is_open(self, meanwhile):
+        """Update the second employee, then call `meanwhile`, while an update of the first one is uncommitted"""
+        updated, finished = threading.Event(), threading.Event()
+
+        def update_first():
+            try:
+                with transaction.atomic():
+                    Employee.objects.filter(pk=self.first).update(name='First')
+                    updated.set()
+                    finished.wait(10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=update_first)
+        thread.start()
+        try:
+            self.assertTrue(updated.wait(10))
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    # Fails instead of waiting for the first update to commit
+                    cursor.execute("SET LOCAL lock_timeout = '2s'")
+                Employee.objects.filter(pk=self.second).update(name='Second')
+            meanwhile()
+        finally:
+            finished.set()
+            thread.join()
+
+    def test_updates_of_different_rows_dont_wait_for_each_other(self):
+        self.update_while_first_is_open(lambda: None)
+        updated = Change.objects.filter(action='update').values_list('object_id', flat=True)
+        self.assertEqual(sorted(updated), [self.first, self.second])
+
+    def test_feed_stops_before_an_uncommitted_entry(self):
+        since = changelog.head()
+        seen = {}
+
+        def read():
+            seen['head'] = changelog.head()
+            seen['changes'] = changelog.read_changes(self.admin, since)
+
+        self.update_while_first_is_open(read)
+        # The second update committed, after the first one's entry was numbered
+        self.assertEqual(seen['head'], since)
+        self.assertEqual((seen['changes']['next'], seen['changes']['has_more']), (since, False))
+        self.assertEqual(seen['changes']['employees'], {'upserts': [], 'deletes': []})
+
+        changes = changelog.read_changes(self.admin, since)
+        self.assertEqual([row['id'] for row in changes['employees']['upserts']], [self.first, self.second])
+        self.assertEqual(changes['next'], changelog.head())
+
+
+class ReplicaRoutingTests(FileDatabaseTestCase):
+    """A primary and read replicas in SQLite files, the replicas copied from the primary before the last write"""
+
+    def setUp(self):
+        super().setUp()
+        get_response_cache().clear()
+        get_token_cache().clear()
+        # Holds the read-your-writes flags, user ids start again from 1
+        cache.clear()
+        # A new router, so replicas marked unreachable by other tests are tried again
+        override = override_settings(
+            DATABASE_ROUTERS=['core_app.routers.ReplicaRouter'], DATABASE_REPLICAS=['replica1', 'replica2'],
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        for alias in ('replica1', 'replica2', 'missing'):
+            self.add_replica(alias)
+
+        def create():
+            self.admin = User.objects.create(username='admin', email='admin@example.com', password='!', role='admin')
+            self.other_admin = User.objects.create(
+                username='other', email='other@example.com', password='!', role='admin',
+            )
+            self.tokens = {user.pk: Token.objects.create(user=user).key for user in (self.admin, self.other_admin)}
+            Company.objects.create(name='Acme')
+            call_command('sync_sqlite_replicas', stdout=StringIO())
+            # Not replicated yet
+            Company.objects.create(name='Globex')
+
+        self.assertEqual(self.in_thread(create), [])
+
+    def add_replica(self, alias):
+        path = os.path.join(self.directory, f'{alias}.sqlite3')
+        databases = {
+            'default': dict(connections.settings['default']),
+            alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': f'file:{path}?mode=rw'},
+        }
+        connections.settings[alias] = connections.configure_settings(databases)[alias]
+        self.addCleanup(connections.settings.pop, alias)
+        patcher = patch.object(type(self), 'databases', type(self).databases | {alias})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def token_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.tokens[user.pk]}')
+        return client
+
+    def company_names(self, client):
+        # Like the frontend's cross-origin requests: no cookies
+        client.cookies.clear()
+        return [company['name'] for company in json.loads(client.get('/api/companies/').content)]
+
+    def test_get_requests_read_from_a_replica(self):
+        names = {}
+
+        def read():
+            client = self.client_for(self.admin)
+            names['replica'] = self.company_names(client)
+            # Other requests read from the primary, what they change is based on current data
+            response = client.put('/api/companies/2/update/', {'name': 'Globex Corp'}, format='json')
+            names['update'] = response.data['name']
+
+        self.assertEqual(self.in_thread(read), [])
+        self.assertEqual(names, {'replica': ['Acme'], 'update': 'Globex Corp'})
+
+    def test_reads_after_a_write_use_the_primary(self):
+        names = {}
+
+        def request():
+            with routers.request_routing() as routing:
+                names['before'] = list(Company.objects.values_list('name', flat=True))
+                Company.objects.create(name='Initech')
+                names['after'] = list(Company.objects.values_list('name', flat=True))
+                names['wrote'] = routing.wrote
+
+        def client_requests():
+            writer, reader = self.token_client(self.admin), self.token_client(self.other_admin)
+            response = writer.post('/api/companies/create/', {'name': 'Umbrella'}, format='json')
+            names['cookies'] = list(response.cookies)
+            # The reader's response is cached, built from the replica
+            names['reader'] = self.company_names(reader)
+            # The writer's next requests read from the primary for a while, its own write included
+            names['writer'] = self.company_names(writer)
+            # ... and replaced the cached response
+            names['reader again'] = self.company_names(reader)
+
+        self.assertEqual(self.in_thread(request), [])
+        self.assertEqual(self.in_thread(client_requests), [])
+        self.assertEqual(names, {
+            'before': ['Acme'], 'after': ['Acme', 'Globex', 'Initech'], 'wrote': True,
+            'cookies': [],
+            'reader': ['Acme'],
+            'writer': ['Acme', 'Globex', 'Initech', 'Umbrella'],
+            'reader again': ['Acme', 'Globex', 'Initech', 'Umbrella'],
+        })
+
+    def test_round_robin_skips_unreachable_replicas(self):
+        picks = []
+
+        def pick():
+            for _ in range(4):
+                with routers.request_routing():
+                    picks.append(router.db_for_read(Employee))
+                    # Tokens, users and tasks are read from the primary
+                    picks.append(router.db_for_read(Task))
+
+        with override_settings(DATABASE_REPLICAS=['replica1', 'missing', 'replica2']):
+            with self.assertLogs('core_app.routers', 'WARNING') as logs:
+                self.assertEqual(self.in_thread(pick), [])
+        self.assertEqual(picks, [
+            'replica1', 'default', 'replica2', 'default', 'replica2', 'default', 'replica1', 'default',
+        ])
+        # Skipped for REPLICA_RETRY seconds once found unreachable
+        self.assertEqual(len(logs.output), 1)
+
+        # With no reachable replica left, from the primary
+        names = {}
+        with override_settings(DATABASE_REPLICAS=['missing']):
+            self.assertEqual(self.in_thread(lambda: names.update(all=self.company_names(self.client_for(self.admin)))), [])
+        self.assertEqual(names, {'all': ['Acme', 'Globex']})
+
+
+class DirtyTrackingTests(APITestCase):
+
+    def test_plain_update_is_a_single_query(self):
+        employee = Employee.objects.get(pk=self.make_employees(1)[0].pk)
+        employee.address = '2 Side Street'
+        # The UPDATE, its trigger writes the change log entry
+        with self.assertNumQueries(1):
+            employee.save()
+        self.assertEqual(Change.objects.latest('seq').action, 'update')
+
+    def test_changing_department_checks_company_without_loading_rows(self):
+        other_company = Company.objects.create(name='Globex')
+        other_department = Department.objects.create(company=other_company, name='Sales')
+        employee = Employee.objects.get(pk=self.make_employees(1)[0].pk)
+
+        employee.department_id = other_department.pk
+        with self.assertNumQueries(1), self.assertRaises(ValueError):
+            employee.save()
+
+    def test_deferred_status_is_fetched_once(self):
+        employee = Employee.objects.only('name').get(pk=self.make_employees(1)[0].pk)
+        employee.status = 'hired'
+        employee.save()
+        run_pending()
+        self.department.refresh_from_db()
+        self.assertEqual(self.department.num_employees, 1)
+
+    @override_settings(COUNTER_UPDATES='inline')
+    def test_refresh_from_db_updates_the_loaded_values(self):
+        employee = self.make_employees(1, status='interview_scheduled')[0]
+        hired_on = timezone.now().date() - timedelta(days=30)
+        # Hired by someone else
+        Employee.objects.filter(pk=employee.pk).update(status='hired', hired_on=hired_on)
+        Department.objects.filter(pk=self.department.pk).update(num_employees=1)
+
+        employee.refresh_from_db()
+        employee.address = '2 Side Street'
+        employee.save()
+        employee.refresh_from_db(fields=['department'])
+        employee.save()
+
+        employee = Employee.objects.get(pk=employee.pk)
+        self.department.refresh_from_db()
+        self.assertEqual((employee.hired_on, employee.address), (hired_on, '2 Side Street'))
+        self.assertEqual(self.department.num_employees, 1)
+
+    def test_employee_update_view_query_count(self):
+        employee = self.make_employees(1)[0]
+        # token lookup, employee lookup, UPDATE
+        with self.assertNumQueries(3):
+            response = self.client.put(f'/api/employees/{employee.pk}/update/', {'address': '2 Side Street'})
+        self.assertEqual(response.status_code, 200)
+
+
+class BulkImportExportTests(APITestCase):
+
+    HEADER = 'company,department,name,email,mobile_number,address,designation\n'
+
+    def upload(self, name, content):
+        content = content if isinstance(content, bytes) else content.encode()
+        return self.client.post('/api/employees/bulk/', {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def row(self, name, email):
+        return f'{self.company.id},{self.department.id},{name},{email},+123456789,Street 1,Developer\n'
+
+    def test_csv_import_reports_bad_rows_and_updates_counters(self):
+        content = (
+            'company,department,status,name,email,mobile_number,address,designation,hired_on\n'
+            f'{self.company.id},{self.department.id},hired,Ann,ann@example.com,+123456789,Street 1,Developer,2020-01-01\n'
+            f'{self.company.id},{self.department.id},,Bob,bob@example.com,+123456789,Street 2,Developer,\n'
+            f'{self.company.id},{self.department.id},,Bad,not-an-email,+123456789,Street 3,Developer,\n'
+            f'{self.company.id},999,,Lost,lost@example.com,+123456789,Street 4,Developer,\n'
+            f'{self.company.id},{self.department.id},,Dup,ann@example.com,+123456789,Street 5,Developer,\n'
+        )
+        response = self.upload('employees.csv', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4, 5])
+
+        ann = Employee.objects.get(email='ann@example.com')
+        self.assertEqual(str(ann.hired_on), '2020-01-01')
+        run_pending()
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.num_employees, 1)
+
+    def test_ndjson_import_in_batches(self):
+        lines = [
+            json.dumps({
+                'company': self.company.id, 'department': self.department.id, 'name': f'N{i}',
+                'email': f'n{i}@example.com', 'mobile_number': '+123456789', 'address': 'x', 'designation': 'QA',
+            })
+            for i in range(5)
+        ]
+        with patch.object(bulk, 'IMPORT_BATCH_SIZE', 2):
+            response = self.upload('employees.ndjson', '\n'.join(lines + ['{broken']))
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(response.data['errors'][0]['row'], 6)
+
+    def test_csv_with_a_byte_order_mark(self):
+        # As Excel saves "CSV UTF-8"
+        response = self.upload('employees.csv', '\ufeff' + self.HEADER + self.row('Zoë', 'zoe@example.com'))
+        self.assertEqual((response.status_code, response.data['created'], response.data['errors']), (200, 1, []))
+        self.assertTrue(Employee.objects.filter(name='Zoë').exists())
+
+    def test_rows_in_another_encoding_are_reported(self):
+        content = b''.join([
+            (self.HEADER + self.row('Ann', 'ann@example.com')).encode(),
+            self.row('Zoë', 'zoe@example.com').encode('latin-1'),
+            self.row('Bob', 'bob@example.com').encode(),
+        ])
+        response = self.upload('employees.csv', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(
+            response.data['errors'], [{'row': 2, 'errors': {'non_field_errors': ['Row could not be parsed.']}}],
+        )
+
+        lines = [json.dumps({'name': 'Zoë'}, ensure_ascii=False).encode('cp1252')]
+        response = self.upload('employees.ndjson', b'\n'.join(lines))
+        self.assertEqual((response.data['created'], response.data['errors'][0]['row']), (0, 1))
+
+    def test_rows_with_nul_bytes_are_reported(self):
+        content = self.HEADER + self.row('Ann', 'ann@example.com') + self.row('N\0ll', 'null@example.com')
+        response = self.upload('employees.csv', content + self.row('Bob', 'bob@example.com'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2])
+        self.assertFalse(Employee.objects.filter(email='null@example.com').exists())
+
+    def test_unreadable_header_is_a_bad_request(self):
+        for header in (self.HEADER.replace('address', 'adresse_à').encode('latin-1'), b'company\0,name\n'):
+            with self.subTest(header=header):
+                response = self.upload('employees.csv', header + self.row('Ann', 'ann@example.com').encode())
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(Employee.objects.exists())
+
+    def test_export_streams_filtered_rows(self):
+        employees = self.make_employees(3)
+        response = self.client.get('/api/employees/export/', {'type': 'ndjson', 'ordering': '-id'})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [e.id for e in reversed(employees)])
+
+        response = self.client.get('/api/employees/export/')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ','.join(bulk.EXPORT_COLUMNS))
+        self.assertEqual(len(lines), 4)
+
+
+class DaysEmployedTests(APITestCase):
+
+    def test_days_employed_is_computed_by_the_database(self):
+        veteran, newcomer, applicant = self.make_employees(3)
+        today = timezone.now().date()
+        Employee.objects.filter(pk=veteran.pk).update(status='hired', hired_on=today - timedelta(days=400))
+        Employee.objects.filter(pk=newcomer.pk).update(status='hired', hired_on=today - timedelta(days=10))
+
+        days = dict(Employee.objects.with_days_employed().values_list('id', 'days_employed'))
+        self.assertEqual(days, {veteran.pk: 400, newcomer.pk: 10, applicant.pk: 0})
+
+        response = self.client.get(f'/api/employees/{veteran.pk}/')
+        self.assertEqual(response.data['days_employed'], 400)
+
+    def test_filter_and_order_by_tenure(self):
+        veteran, newcomer, applicant = self.make_employees(3)
+        today = timezone.now().date()
+        Employee.objects.filter(pk=veteran.pk).update(status='hired', hired_on=today - timedelta(days=400))
+        Employee.objects.filter(pk=newcomer.pk).update(status='hired', hired_on=today - timedelta(days=10))
+
+        response = self.client.get('/api/employees/', {'min_days_employed': 365})
+        self.assertEqual([row['id'] for row in response.data], [veteran.pk])
+
+        response = self.client.get('/api/employees/', {'max_days_employed': 30, 'ordering': '-days_employed'})
+        self.assertEqual([row['id'] for row in response.data], [newcomer.pk, applicant.pk])
+
+        response = self.client.get('/api/employees/', {'ordering': 'days_employed', 'page_size': 2, 'fields': 'id'})
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], [{'id': veteran.pk}])
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+
+    def test_cached_token_skips_the_database(self):
+        self.client.get('/api/employees/')
+        # Only the ETag validator and the employee list queries remain once the token is cached
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/employees/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout_invalidates_immediately(self):
+        self.client.get('/api/companies/')
+        self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/companies/').status_code, 401)
+
+    def test_role_change_invalidates_cached_role(self):
+        employee = User.objects.create(username='emp', email='emp@example.com', password='secret', role='employee')
+        token = Token.objects.create(user=employee)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(client.post('/api/companies/create/', {'name': 'Initech'}).status_code, 403)
+
+        self.client.put(f'/api/users/{employee.pk}/update/', {'role': 'admin'})
+        self.assertEqual(client.post('/api/companies/create/', {'name': 'Initech'}).status_code, 201)
+
+    def test_non_admins_cannot_change_their_role_or_company(self):
+        employee = User.objects.create(username='emp', email='emp@example.com', password='secret', role='employee')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=employee).key}')
+        response = client.put(
+            f'/api/users/{employee.pk}/update/', {'role': 'admin', 'company': self.company.pk, 'username': 'emp2'},
+        )
+        self.assertEqual((response.status_code, response.data['role'], response.data['company']), (200, 'employee', None))
+        employee.refresh_from_db()
+        self.assertEqual((employee.username, employee.role, employee.company_id), ('emp2', 'employee', None))
+        self.assertEqual(client.post('/api/companies/create/', {'name': 'Initech'}).status_code, 403)
+
+
+class CompanyScopingTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_company = Company.objects.create(name='Globex')
+        cls.other_department = Department.objects.create(company=cls.other_company, name='Sales')
+        cls.other_employee = Employee.objects.create(
+            company=cls.other_company, department=cls.other_department, name='Other', email='other@example.com',
+            mobile_number='+123456789', address='1 Main Street', designation='Seller',
+        )
+        cls.manager = User.objects.create(
+            username='manager', email='manager@example.com', password='secret', role='manager', company=cls.company,
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.employee = self.make_employees(1)[0]
+        self.manager_client = APIClient()
+        self.manager_client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.manager).key}')
+
+    def test_lists_only_contain_own_company(self):
+        ids = lambda path: [row['id'] for row in self.manager_client.get(path).data]
+        self.assertEqual(ids('/api/companies/'), [self.company.id])
+        self.assertEqual(ids('/api/departments/'), [self.department.id])
+        self.assertEqual(ids('/api/employees/'), [self.employee.id])
+        export = b''.join(self.manager_client.get('/api/employees/export/').streaming_content).decode()
+        self.assertNotIn('other@example.com', export)
+        self.assertEqual(self.manager_client.get('/api/summary/').data['company'], self.company.id)
+        # Admins still see everything
+        self.assertEqual(len(self.client.get('/api/employees/').data), 2)
+
+    def test_other_companies_are_not_found(self):
+        for path in (
+            f'/api/companies/{self.other_company.id}/',
+            f'/api/companies/{self.other_company.id}/summary/',
+            f'/api/departments/{self.other_department.id}/',
+            f'/api/employees/{self.other_employee.id}/',
+        ):
+            self.assertEqual(self.manager_client.get(path).status_code, 404, path)
+        response = self.manager_client.put(f'/api/employees/{self.other_employee.id}/update/', {'address': 'Elsewhere'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.manager_client.delete(f'/api/employees/{self.other_employee.id}/delete/').status_code, 404)
+
+    def test_writes_stay_in_own_company(self):
+        response = self.manager_client.post('/api/employees/create/', {
+            'company': self.other_company.id, 'department': self.other_department.id, 'name': 'Spy',
+            'email': 'spy@example.com', 'mobile_number': '+123456789', 'address': '1 Main Street', 'designation': 'Spy',
+        })
+        self.assertEqual(response.status_code, 403)
+
+        response = self.manager_client.post(
+            '/api/employees/transitions/', [{'id': self.other_employee.id, 'status': 'interview_scheduled'}], format='json',
+        )
+        self.assertEqual(response.data['results'][0]['errors'], {'id': ['Employee not found.']})
+
+        rows = (
+            'company,department,name,email,mobile_number,address,designation\n'
+            f'{self.other_company.id},{self.other_department.id},Spy,spy@example.com,+123456789,Street 1,Spy\n'
+        )
+        response = self.manager_client.post(
+            '/api/employees/bulk/', {'file': SimpleUploadedFile('rows.csv', rows.encode())}, format='multipart',
+        )
+        self.assertEqual((response.data['created'], list(response.data['errors'][0]['errors'])), (0, ['company']))
+
+    def test_migration_assigns_existing_users_their_employee_company(self):
+        backfill = import_module('core_app.migrations.0013_backfill_user_company').backfill_user_company
+        unassigned = User.objects.create(username='other', email='other@example.com', password='secret', role='employee')
+        unknown = User.objects.create(username='new', email='new@example.com', password='secret', role='manager')
+        backfill(django_apps, None)
+        companies = dict(User.objects.values_list('pk', 'company_id'))
+        # Admins and users already assigned are left alone, so are users without an employee row
+        self.assertEqual(
+            [companies[user.pk] for user in (unassigned, unknown, self.admin, self.manager)],
+            [self.other_company.pk, None, None, self.company.pk],
+        )
+
+    def test_users_without_company_see_nothing(self):
+        user = User.objects.create(username='loner', email='loner@example.com', password='secret', role='employee')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        with self.assertNumQueries(1):  # the token lookup; the empty scope needs no query
+            self.assertEqual(client.get('/api/employees/').data, [])
+        self.assertEqual(client.get('/api/summary/').status_code, 403)
+
+        # Only admins can assign a company, and the cached token picks it up right away
+        client.put(f'/api/users/{user.id}/update/', {'company': self.company.id})
+        self.assertEqual(client.get('/api/employees/').data, [])
+        self.assertEqual(self.client.put(f'/api/users/{user.id}/update/', {'company': self.company.id}).status_code, 200)
+        self.assertEqual(len(client.get('/api/employees/').data), 1)
+
+    def test_non_admins_are_refused_other_users_without_a_query(self):
+        get_token_cache().clear()
+        self.manager_client.get('/api/companies/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.manager_client.get(f'/api/users/{self.admin.id}/').status_code, 403)
+            self.assertEqual(self.manager_client.get('/api/users/').status_code, 403)
+
+    def test_scoped_queries_use_the_company_indexes(self):
+        plan = scope(Employee.objects.filter(status='hired'), self.manager).explain()
+        self.assertIn('employee_company_status_idx', plan)
+        plan = scope(Department.objects.all(), self.manager).explain()
+        self.assertRegex(plan, r'SEARCH core_app_department USING (COVERING )?INDEX \S+ \(company_id=\?\)')
+
+
+class PasswordHashingTests(TestCase):
+
+    def test_hashes_from_any_configured_hasher_are_not_rehashed(self):
+        for hasher in ('pbkdf2_sha256', 'pbkdf2_sha1', 'scrypt'):
+            encoded = make_password('secret-pass', hasher=hasher)
+            user = User.objects.create(username=hasher, email=f'{hasher}@example.com', password=encoded, role='employee')
+            self.assertEqual(user.password, encoded)
+            self.assertTrue(user.check_password('secret-pass'))
+
+    def test_raw_password_is_hashed_on_save(self):
+        user = User.objects.create(username='raw', email='raw@example.com', password='secret-pass', role='employee')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+    def test_raw_password_starting_with_the_unusable_prefix_is_hashed(self):
+        user = User.objects.create(username='bang', email='bang@example.com', password='!secret', role='employee')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('!secret'))
+
+        user.set_unusable_password()
+        unusable = user.password
+        user.save()
+        self.assertEqual(user.password, unusable)
+
+    def test_login_upgrades_outdated_hash(self):
+        user = User.objects.create(
+            username='old', email='old@example.com', password=make_password('secret-pass', hasher='pbkdf2_sha1'), role='employee',
+        )
+        response = APIClient().post('/api/login/', {'email': 'old@example.com', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('secret-pass'))
+
+
+class AsyncLoginTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='old', email='old@example.com', password=make_password('secret-pass', hasher='pbkdf2_sha1'), role='manager',
+        )
+
+    def login(self, email, password):
+        request = AsyncRequestFactory().post(
+            '/api/login/', json.dumps({'email': email, 'password': password}), content_type='application/json',
+        )
+        return async_to_sync(async_views.login_view)(request)
+
+    def test_login_returns_token_and_upgrades_hash(self):
+        response = self.login('old@example.com', 'secret-pass')
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual(body['token'], Token.objects.get(user=self.user).key)
+        self.assertEqual((body['userRole'], body['userId']), ('manager', self.user.pk))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+    def test_login_goes_through_the_authentication_backends(self):
+        failures = []
+        handler = lambda sender, credentials, **kwargs: failures.append(credentials['username'])
+        user_login_failed.connect(handler)
+        self.addCleanup(user_login_failed.disconnect, handler)
+        self.assertEqual(self.login('old@example.com', 'wrong').status_code, 401)
+        self.assertEqual(failures, ['old@example.com'])
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.login('old@example.com', 'secret-pass').status_code, 401)
+        with override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.AllowAllUsersModelBackend']):
+            self.assertEqual(self.login('old@example.com', 'secret-pass').status_code, 200)
+
+    def test_invalid_credentials(self):
+        self.assertEqual(self.login('old@example.com', 'wrong').status_code, 401)
+        self.assertEqual(self.login('nobody@example.com', 'secret-pass').status_code, 401)
+        self.assertEqual(self.login('old@example.com', '').status_code, 400)
+
+
+class AsyncReadViewTests(APITestCase):
+    """The async read views answer exactly like the sync ones"""
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.get(user=self.admin).key
+
+    def async_get(self, view, path, data=None, token=None, **kwargs):
+        headers = {'Authorization': f'Token {token or self.token}'} if token is not False else {}
+        request = AsyncRequestFactory().get(path, data, headers=headers)
+        return async_to_sync(getattr(async_views, view))(request, **kwargs)
+
+    def assertSameResponse(self, view, path, data=None, **kwargs):
+        expected = self.client.get(path, data)
+        response = self.async_get(view, path, data, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.get('ETag'), expected.get('ETag'))
+        return response
+
+    def test_lists_and_details_match_sync_views(self):
+        employee, _ = self.make_employees(2)
+        Employee.objects.filter(pk=employee.pk).update(status='hired', hired_on='2024-03-01')
+
+        self.assertSameResponse('company_list', '/api/companies/')
+        self.assertSameResponse('company_detail', f'/api/companies/{self.company.pk}/', pk=self.company.pk)
+        self.assertSameResponse('department_list', '/api/departments/', {'fields': 'id,name'})
+        self.assertSameResponse('department_detail', f'/api/departments/{self.department.pk}/', pk=self.department.pk)
+        self.assertSameResponse('employee_list', '/api/employees/', {'status': 'hired', 'ordering': '-days_employed'})
+        self.assertSameResponse('employee_list', '/api/employees/', {'page_size': 1})
+        self.assertSameResponse('employee_detail', f'/api/employees/{employee.pk}/', pk=employee.pk)
+        self.assertSameResponse('get_user', f'/api/users/{self.admin.pk}/', id=self.admin.pk)
+
+    def test_errors_match_sync_views(self):
+        self.assertSameResponse('company_detail', '/api/companies/0/', pk=0)
+        self.assertSameResponse('get_user', '/api/users/0/', id=0)
+        self.assertSameResponse('employee_list', '/api/employees/', {'status': 'retired'})
+        self.assertSameResponse('company_list', '/api/companies/', {'fields': 'nope'})
+
+        response = self.async_get('company_list', '/api/companies/', token=False)
+        self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, 'Token'))
+        self.assertEqual(self.async_get('company_list', '/api/companies/', token='invalid').status_code, 401)
+
+        user = User.objects.create(username='nobody', email='nobody@example.com', password='secret', role='')
+        token = Token.objects.create(user=user).key
+        self.assertEqual(self.async_get('company_list', '/api/companies/', token=token).status_code, 403)
+
+    def test_not_modified(self):
+        response = self.async_get('company_list', '/api/companies/')
+        request = AsyncRequestFactory().get(
+            '/api/companies/', headers={'Authorization': f'Token {self.token}', 'If-None-Match': response['ETag']},
+        )
+        self.assertEqual(async_to_sync(async_views.company_list)(request).status_code, 304)
+
+
+class SummaryTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_company_summary(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second, third = self.make_employees(3)
+            Employee.objects.filter(pk=first.pk).update(status='hired', hired_on='2024-03-05', designation='Lead')
+            Employee.objects.filter(pk=second.pk).update(status='hired', hired_on='2024-03-20')
+
+        with self.assertNumQueries(2):  # token lookup, grouped query
+            response = self.client.get(f'/api/companies/{self.company.pk}/summary/')
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(response.data['by_status']['hired'], 2)
+        self.assertEqual(response.data['by_status']['application_received'], 1)
+        self.assertEqual(response.data['by_designation'], {'Developer': 2, 'Lead': 1})
+        self.assertEqual(response.data['by_department'][0]['count'], 3)
+        self.assertEqual(response.data['hires_per_month'], [{'month': '2024-03', 'count': 2}])
+
+    def test_summary_is_cached_until_the_company_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_employees(1)
+        self.assertEqual(self.client.get('/api/summary/').data['total'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/summary/').data['total'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_employees(1)
+        self.assertEqual(self.client.get('/api/summary/').data['total'], 2)
+        self.assertEqual(self.client.get(f'/api/companies/{self.company.pk}/summary/').data['total'], 2)
+
+    def test_unknown_company(self):
+        self.assertEqual(self.client.get('/api/companies/999/summary/').status_code, 404)
+        empty = Company.objects.create(name='Empty')
+        self.assertEqual(self.client.get(f'/api/companies/{empty.pk}/summary/').data['total'], 0)
+
+
+class ConditionalGetTests(APITestCase):
+
+    def test_detail_not_modified_skips_serialization(self):
+        employee = self.make_employees(1)[0]
+        url = f'/api/employees/{employee.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with patch.object(EmployeeSerializer, 'to_representation') as to_representation:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        to_representation.assert_not_called()
+
+        employee.address = '2 Side Street'
+        employee.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_not_modified_skips_serialization(self):
+        self.make_employees(2)
+        response = self.client.get('/api/companies/')
+        etag = response['ETag']
+
+        with patch.object(CompanySerializer, 'to_representation') as to_representation:
+            # Answered from the response cache's stored ETag
+            with self.assertNumQueries(0):
+                response = self.client.get('/api/companies/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        to_representation.assert_not_called()
+
+        # Hiring changes the company's counters, so its representation too
+        employee = Employee.objects.first()
+        employee.status = 'hired'
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.save()
+            run_pending()
+        self.assertEqual(self.client.get('/api/companies/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etag_depends_on_filters_and_deletes(self):
+        first, second = self.make_employees(2)
+        etag = self.client.get('/api/employees/')['ETag']
+        self.assertNotEqual(self.client.get('/api/employees/', {'fields': 'id'})['ETag'], etag)
+
+        first.delete()
+        self.assertEqual(self.client.get('/api/employees/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_lists_ignore_if_modified_since(self):
+        first, second = self.make_employees(2)
+        response = self.client.get('/api/employees/')
+        self.assertNotIn('Last-Modified', response)
+        # Deleting a row doesn't move the latest updated_at of the others
+        since = http_date(timezone.now().timestamp() + 60)
+        first.delete()
+        response = self.client.get('/api/employees/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual((response.status_code, [row['id'] for row in response.data]), (200, [second.pk]))
+
+    def test_if_modified_since(self):
+        response = self.client.get(f'/api/departments/{self.department.pk}/')
+        response = self.client.get(
+            f'/api/departments/{self.department.pk}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class ResponseCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def metric(self, name, view):
+        match = re.search(rf'{name}\{{view="{view}"\}} (\d+)', self.client.get('/api/metrics/').content.decode())
+        return int(match.group(1)) if match else 0
+
+    def test_hit_skips_the_orm(self):
+        hits = self.metric('core_app_response_cache_hits_total', 'company-list')
+        misses = self.metric('core_app_response_cache_misses_total', 'company-list')
+        first = self.client.get('/api/companies/')
+        with patch.object(CompanySerializer, 'to_representation') as to_representation:
+            # The token is cached by now, and so is the response
+            with self.assertNumQueries(0):
+                second = self.client.get('/api/companies/')
+        to_representation.assert_not_called()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(second['ETag'], first['ETag'])
+        # The counters are per process, other tests add to them too
+        self.assertEqual(self.metric('core_app_response_cache_hits_total', 'company-list'), hits + 1)
+        self.assertEqual(self.metric('core_app_response_cache_misses_total', 'company-list'), misses + 1)
+
+    def test_writes_invalidate_entries(self):
+        url = f'/api/departments/{self.department.pk}/'
+        self.client.get(url)
+        self.client.get(f'/api/companies/{self.company.pk}/')
+
+        # Hiring updates the department's counter
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_employees(1, status='hired')
+            run_pending()
+        self.assertEqual(json.loads(self.client.get(url).content)['num_employees'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f'/api/companies/{self.company.pk}/update/', {'name': 'Acme Corp'}, format='json')
+        self.assertEqual(json.loads(self.client.get(f'/api/companies/{self.company.pk}/').content)['name'], 'Acme Corp')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/departments/{self.department.pk}/delete/')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(json.loads(self.client.get('/api/departments/').content), [])
+
+    def test_entries_respect_company_scope(self):
+        other = Company.objects.create(name='Globex')
+        manager = User.objects.create(
+            username='manager', email='manager@example.com', password='secret', role='manager', company=other,
+        )
+        manager_client = APIClient()
+        manager_client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=manager).key}')
+
+        # An entry cached for the admin is not served to a manager of another company
+        url = f'/api/departments/{self.department.pk}/'
+        self.client.get(url)
+        self.assertEqual(manager_client.get(url).status_code, 404)
+        self.client.get('/api/companies/')
+        self.assertEqual([row['id'] for row in manager_client.get('/api/companies/').data], [other.pk])
+
+        # Moving the department invalidates the entries of its old company too
+        with self.captureOnCommitCallbacks(execute=True):
+            self.department.company = other
+            self.department.save()
+        self.assertEqual(manager_client.get(url).status_code, 200)
+        self.assertEqual(json.loads(self.client.get(url).content)['company'], other.pk)
+
+    def test_not_modified_from_cache(self):
+        etag = self.client.get('/api/companies/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/companies/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_browsable_api_is_not_cached(self):
+        misses = self.metric('core_app_response_cache_misses_total', 'company-list')
+        self.client.get('/api/companies/', HTTP_ACCEPT='text/html')
+        self.assertEqual(self.metric('core_app_response_cache_misses_total', 'company-list'), misses)
+
+
+class BootstrapSnapshotTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.employees = self.make_employees(2)
+        self.other_company = Company.objects.create(name='Globex')
+        self.other_department = Department.objects.create(company=self.other_company, name='Sales')
+
+    def bootstrap(self, client=None, **extra):
+        response = (client or self.client).get('/api/bootstrap/', **extra)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_columnar_tree(self):
+        first, second = self.employees
+        Employee.objects.filter(pk=second.pk).update(status='hired')
+        Task.enqueue('rebuild_snapshot', [self.company.pk])
+        self.assertEqual(json.loads(self.bootstrap().content), {'companies': [
+            {
+                'id': self.company.pk, 'name': 'Acme', 'num_departments': 1, 'num_employees': 0,
+                'departments': {'id': [self.department.pk], 'name': ['Engineering'], 'num_employees': [0]},
+                'employees': {
+                    'id': [first.pk, second.pk],
+                    'department': [self.department.pk, self.department.pk],
+                    'name': ['Employee 0', 'Employee 1'],
+                    'designation': ['Developer', 'Developer'],
+                    'status': ['application_received', 'hired'],
+                },
+            },
+            {
+                'id': self.other_company.pk, 'name': 'Globex', 'num_departments': 1, 'num_employees': 0,
+                'departments': {'id': [self.other_department.pk], 'name': ['Sales'], 'num_employees': [0]},
+                'employees': {'id': [], 'department': [], 'name': [], 'designation': [], 'status': []},
+            },
+        ]})
+
+    def test_members_only_get_their_company(self):
+        manager = User.objects.create(
+            username='manager', email='manager@example.com', password='secret', role='manager', company=self.other_company,
+        )
+        client = APIClient()
+        client.force_authenticate(manager)
+        self.assertEqual([company['id'] for company in json.loads(self.bootstrap(client).content)['companies']],
+                         [self.other_company.pk])
+
+        manager.company = None
+        self.assertEqual(client.get('/api/bootstrap/').status_code, 403)
+
+    def test_only_changed_companies_are_rebuilt(self):
+        self.bootstrap()
+        built_at = dict(CompanySnapshot.objects.values_list('company_id', 'built_at'))
+        with self.assertNumQueries(1):  # The snapshot versions, the body is cached
+            self.bootstrap()
+
+        employee = Employee.objects.get(pk=self.employees[0].pk)
+        employee.name = 'Renamed'
+        employee.save()
+        with patch.object(snapshots, 'render_companies', wraps=snapshots.render_companies) as render:
+            body = json.loads(self.bootstrap().content)
+        render.assert_called_once_with([self.company.pk])
+        self.assertEqual(body['companies'][0]['employees']['name'], ['Renamed', 'Employee 1'])
+        rebuilt = dict(CompanySnapshot.objects.values_list('company_id', 'built_at'))
+        self.assertGreater(rebuilt[self.company.pk], built_at[self.company.pk])
+        self.assertEqual(rebuilt[self.other_company.pk], built_at[self.other_company.pk])
+
+    def test_fields_outside_the_snapshot_dont_queue_a_rebuild(self):
+        self.bootstrap()
+        employee = Employee.objects.get(pk=self.employees[0].pk)
+        employee.address = '2 Side Street'
+        employee.save()
+        self.assertFalse(Task.objects.exists())
+
+    def test_worker_rebuilds_snapshots(self):
+        self.bootstrap()
+        self.client.put(f'/api/employees/{self.employees[0].pk}/update/', {'status': 'interview_scheduled'}, format='json')
+        self.client.put(f'/api/employees/{self.employees[0].pk}/update/', {'status': 'hired'}, format='json')
+        self.client.delete(f'/api/companies/{self.other_company.pk}/delete/')
+        run_pending()
+
+        with patch.object(snapshots, 'render_companies') as render:
+            body = json.loads(self.bootstrap().content)
+        render.assert_not_called()
+        [company] = body['companies']
+        self.assertEqual((company['num_employees'], company['employees']['status'][0]), (1, 'hired'))
+
+    def test_change_during_rebuild_stays_queued(self):
+        def change():
+            Employee.objects.filter(pk=self.employees[0].pk).update(name='Changed meanwhile')
+            Task.enqueue('rebuild_snapshot', [self.company.pk])
+
+        def render_and_change(company_ids):
+            bodies = render_companies(company_ids)
+            # Another process's write, outside of the request's context: not counted as its queries
+            contextvars.Context().run(change)
+            return bodies
+
+        render_companies = snapshots.render_companies
+        with patch.object(snapshots, 'render_companies', render_and_change):
+            self.bootstrap()
+        self.assertEqual(list(Task.objects.values_list('key', flat=True)), [str(self.company.pk)])
+        self.assertEqual(json.loads(self.bootstrap().content)['companies'][0]['employees']['name'][0], 'Changed meanwhile')
+
+    def test_compression(self):
+        plain = self.bootstrap()
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        compressed = self.bootstrap(HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.8')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+
+        refused = self.bootstrap(HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+
+    @skipUnless(snapshots.brotli, 'brotli is not installed')
+    def test_brotli(self):
+        plain = self.bootstrap()
+        compressed = self.bootstrap(HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(compressed['Content-Encoding'], 'br')
+        self.assertEqual(snapshots.brotli.decompress(compressed.content), plain.content)
+
+    def test_choose_encoding(self):
+        with patch.object(snapshots, 'brotli', None):
+            self.assertEqual(snapshots.choose_encoding('gzip, deflate, br'), 'gzip')
+            self.assertEqual(snapshots.choose_encoding('*'), 'gzip')
+        with patch.object(snapshots, 'brotli', object()):
+            self.assertEqual(snapshots.choose_encoding('gzip, deflate, br'), 'br')
+            self.assertEqual(snapshots.choose_encoding('br;q=0, gzip'), 'gzip')
+        self.assertEqual(snapshots.choose_encoding(''), 'identity')
+        self.assertEqual(snapshots.choose_encoding('gzip;q=nope'), 'identity')
+
+    def test_not_modified(self):
+        etag = self.bootstrap()['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/bootstrap/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        Company.objects.get(pk=self.company.pk).save()
+        self.assertEqual(self.client.get('/api/bootstrap/', headers={'If-None-Match': etag}).status_code, 200)
+
+
+class ChangeLogTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.start = changelog.head()
+
+    def entries(self):
+        return list(Change.objects.filter(seq__gt=self.start).values_list('kind', 'object_id', 'company_id', 'action'))
+
+    def changes(self, since=None, client=None, **params):
+        params['since'] = self.start if since is None else since
+        response = (client or self.client).get('/api/changes/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_writes_are_logged_in_order(self):
+        employee = self.make_employees(1)[0]
+        self.client.put(f'/api/employees/{employee.pk}/update/', {'address': '2 Side Street'}, format='json')
+        sales = Department.objects.create(company=self.company, name='Sales')
+        self.client.delete(f'/api/employees/{employee.pk}/delete/')
+        self.client.delete(f'/api/departments/{sales.pk}/delete/')
+        company_id = self.company.pk
+        self.assertEqual(self.entries(), [
+            ('employee', employee.pk, company_id, 'create'),
+            ('employee', employee.pk, company_id, 'update'),
+            ('department', sales.pk, company_id, 'create'),
+            ('company', company_id, company_id, 'update'),
+            ('employee', employee.pk, company_id, 'delete'),
+            ('department', sales.pk, company_id, 'delete'),
+            ('company', company_id, company_id, 'update'),
+        ])
+        seqs = list(Change.objects.filter(seq__gt=self.start).values_list('seq', flat=True))
+        self.assertEqual(seqs, sorted(seqs))
+
+    def test_bulk_writes_are_logged(self):
+        employees = self.make_employees(2)
+        self.start = changelog.head()
+        self.client.post('/api/employees/transitions/', [{'id': employee.pk, 'status': 'interview_scheduled'} for employee in employees], format='json')
+        rows = f'{self.company.pk},{self.department.pk},Ann,ann@example.com,+123456789,Street 1,Developer\n'
+        self.client.post('/api/employees/bulk/', {'file': SimpleUploadedFile(
+            'rows.csv', ('company,department,name,email,mobile_number,address,designation\n' + rows).encode(),
+        )}, format='multipart')
+        imported = Employee.objects.get(email='ann@example.com')
+        self.assertEqual(self.entries(), [
+            ('employee', employees[0].pk, self.company.pk, 'update'),
+            ('employee', employees[1].pk, self.company.pk, 'update'),
+            ('employee', imported.pk, self.company.pk, 'create'),
+        ])
+
+    def test_rolled_back_writes_leave_no_entry(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.make_employees(1)
+            raise RuntimeError
+        self.assertEqual(self.entries(), [])
+
+    def test_deltas_are_compacted(self):
+        first, second, third = self.make_employees(3)
+        for name in ('Renamed', 'Renamed again'):
+            self.client.put(f'/api/employees/{first.pk}/update/', {'name': name}, format='json')
+        self.client.delete(f'/api/employees/{second.pk}/delete/')
+
+        changes = self.changes()
+        self.assertEqual(changes['next'], changelog.head())
+        self.assertFalse(changes['has_more'])
+        self.assertEqual([row['id'] for row in changes['employees']['upserts']], [first.pk, third.pk])
+        # The same representation as the list
+        self.assertEqual(changes['employees']['upserts'][0], self.client.get('/api/employees/?name=Renamed again').data[0])
+        self.assertEqual(changes['employees']['deletes'], [second.pk])
+        self.assertEqual(changes['companies'], {'upserts': [], 'deletes': []})
+
+        self.assertEqual(self.changes(changes['next'])['employees'], {'upserts': [], 'deletes': []})
+
+    def test_batches(self):
+        employees = self.make_employees(5)
+        seen, since = [], self.start
+        while True:
+            changes = self.changes(since, limit=2)
+            seen.extend(row['id'] for row in changes['employees']['upserts'])
+            since = changes['next']
+            if not changes['has_more']:
+                break
+        self.assertEqual(seen, [employee.pk for employee in employees])
+        self.assertEqual(since, changelog.head())
+
+    def test_start_and_validation(self):
+        self.make_employees(1)
+        self.assertEqual(self.client.get('/api/changes/').data, {'next': changelog.head()})
+        self.assertEqual(self.client.get('/api/changes/?since=-1').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/changes/?since=0&limit={changelog.MAX_LIMIT + 1}').status_code, 400)
+
+    def test_scoped_to_the_users_company(self):
+        other_company = Company.objects.create(name='Globex')
+        other_department = Department.objects.create(company=other_company, name='Sales')
+        employee = self.make_employees(1)[0]
+        manager = User.objects.create(
+            username='manager', email='manager@example.com', password='secret', role='manager', company=self.company,
+        )
+        client = APIClient()
+        client.force_authenticate(manager)
+        changes = self.changes(client=client)
+        self.assertEqual([row['id'] for row in changes['employees']['upserts']], [employee.pk])
+        self.assertEqual(changes['companies']['upserts'], [])
+        self.assertEqual(changes['departments']['upserts'], [])
+
+        since = changelog.head()
+        employee.company, employee.department = other_company, other_department
+        employee.save()
+        # Gone from the old company, updated in the new one
+        self.assertEqual(self.changes(since, client=client)['employees'], {'upserts': [], 'deletes': [employee.pk]})
+        self.assertEqual([row['id'] for row in self.changes(since)['employees']['upserts']], [employee.pk])
+
+    def test_prune_and_compact(self):
+        employee = self.make_employees(1)[0]
+        for name in ('One', 'Two'):
+            employee.name = name
+            employee.save()
+        Change.objects.update(changed_at=timezone.now() - timedelta(days=60))
+        old = changelog.head()
+        recent = self.make_employees(1)[0]
+        for name in ('Three', 'Four'):
+            recent.name = name
+            recent.save()
+        before = {since: self.changes(since) for since in range(old, changelog.head() + 1)}
+
+        out = StringIO()
+        call_command('prune_changes', '--days', '30', '--compact', stdout=out)
+        self.assertEqual(out.getvalue(), f'Pruned {old} entries, compacted 1.\n')
+        # Compaction doesn't change what clients get
+        self.assertEqual({since: self.changes(since) for since in before}, before)
+
+        response = self.client.get('/api/changes/', {'since': old - 1})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.data['oldest'], old + 1)
+
+    def test_prune_keeps_the_latest_entry(self):
+        self.make_employees(1)
+        Change.objects.update(changed_at=timezone.now() - timedelta(days=60))
+        call_command('prune_changes', '--days', '30', stdout=StringIO())
+        self.assertEqual(list(Change.objects.values_list('seq', flat=True)), [changelog.head()])
+        self.assertEqual(self.client.get('/api/changes/', {'since': changelog.head() - 1}).status_code, 200)
+
+
+class StatusTransitionTests(APITestCase):
+
+    def test_batch_transitions(self):
+        applicant, interviewing, hired = self.make_employees(3)
+        Employee.objects.filter(pk__in=[interviewing.pk, hired.pk]).update(status='interview_scheduled')
+        hired.refresh_from_db()
+        hired.status = 'hired'
+        hired.save()
+
+        payload = [
+            {'id': applicant.pk, 'status': 'interview_scheduled'},
+            {'id': interviewing.pk, 'status': 'hired'},
+            {'id': hired.pk, 'status': 'application_received'},
+            {'id': 999, 'status': 'hired'},
+            {'id': applicant.pk, 'status': 'not_accepted'},
+            {'id': 'x', 'status': 'hired'},
+        ]
+        response = self.client.post('/api/employees/transitions/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        results = response.data['results']
+        self.assertEqual([result.get('result') for result in results], ['updated', 'updated', None, None, None, None])
+        self.assertIn('status', results[2]['errors'])
+
+        interviewing.refresh_from_db()
+        self.assertEqual(interviewing.status, 'hired')
+        self.assertEqual(interviewing.hired_on, timezone.now().date())
+        run_pending()
+        self.company.refresh_from_db()
+        self.department.refresh_from_db()
+        self.assertEqual((self.company.num_employees, self.department.num_employees), (2, 2))
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        employees = self.make_employees(20)
+        Employee.objects.update(status='interview_scheduled')
+        payload = [{'id': employee.pk, 'status': 'hired'} for employee in employees]
+        # token, select, savepoint, UPDATE employees (logged by the trigger), UPDATE the department and the
+        # company counters, queue the snapshot rebuild, release
+        with self.assertNumQueries(8):
+            self.client.post('/api/employees/transitions/', payload, format='json')
+        run_pending()
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.num_employees, 20)
+
+    def test_payload_must_be_a_list(self):
+        response = self.client.post('/api/employees/transitions/', {'id': 1, 'status': 'hired'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AdminTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin.is_staff = self.admin.is_superuser = True
+        self.admin.save()
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        other = Department.objects.create(company=Company.objects.create(name='Globex'), name='Sales')
+        self.make_employees(2)
+        queries = {url: self.changelist_queries(url) for url in ('/admin/core_app/employee/', '/admin/core_app/department/')}
+        self.make_employees(20)
+        Employee.objects.filter(pk__in=Employee.objects.values('pk')[:10]).update(department=other, company=other.company)
+        for url, count in queries.items():
+            self.assertEqual(self.changelist_queries(url), count, url)
+
+    def test_search_matches_indexed_prefixes(self):
+        first = self.make_employees(2)[0]
+        Employee.objects.filter(pk=first.pk).update(name='Jane Smith')
+        response = self.client.get('/admin/core_app/employee/', {'q': 'Jane'})
+        self.assertEqual([employee.pk for employee in response.context['cl'].result_list], [first.pk])
+        # The emails, names are case-sensitive
+        response = self.client.get('/admin/core_app/employee/', {'q': 'employee'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        # Prefixes only
+        response = self.client.get('/admin/core_app/employee/', {'q': 'Smith'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_counts_are_bounded(self):
+        self.make_employees(6, status='hired')
+        self.make_employees(2)
+        queryset = Employee.objects.order_by('pk')
+        self.assertEqual(EstimatedCountPaginator(queryset, 2).count, 8)
+        with patch.object(EstimatedCountPaginator, 'exact_count_limit', 5):
+            # Unfiltered: the highest id, filtered: the bound
+            self.assertEqual(EstimatedCountPaginator(queryset, 2).count, queryset.last().pk)
+            self.assertEqual(EstimatedCountPaginator(queryset.filter(status='hired'), 2).count, 5)
+            self.assertEqual(EstimatedCountPaginator(queryset.filter(status='application_received'), 2).count, 2)
+
+    def token_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        # Cached from now on
+        self.assertEqual(client.get('/api/companies/').status_code, 200)
+        return client
+
+    def test_deactivating_a_user_logs_them_out(self):
+        user = User.objects.create(
+            username='emp', email='emp@example.com', password='secret', role='employee', company=self.company,
+        )
+        client = self.token_client(user)
+        response = self.client.post(f'/admin/core_app/user/{user.pk}/change/', {
+            'username': user.username, 'email': user.email, 'password': user.password, 'role': 'employee',
+            'company': self.company.pk, 'date_joined_0': '2024-01-01', 'date_joined_1': '09:00:00',
+            # is_active left unchecked
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(client.get('/api/companies/').status_code, 401)
+
+    def test_deleting_a_user_logs_them_out(self):
+        user = User.objects.create(username='emp', email='emp@example.com', password='secret', role='manager')
+        client = self.token_client(user)
+        response = self.client.post(f'/admin/core_app/user/{user.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(client.get('/api/companies/').status_code, 401)
+
+    def action(self, action, employees, **data):
+        return self.client.post('/admin/core_app/employee/', {
+            'action': action, '_selected_action': [employee.pk for employee in employees], **data,
+        }, follow=True)
+
+    def test_mark_hired(self):
+        interviewing, applicant = self.make_employees(2)
+        Employee.objects.filter(pk=interviewing.pk).update(status='interview_scheduled')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.action('mark_hired', [interviewing, applicant])
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['1 employee(s) marked as hired.', '1 employee(s) skipped: only scheduled interviews can be hired.'],
+        )
+        run_pending()
+        self.department.refresh_from_db()
+        self.assertEqual(self.department.num_employees, 1)
+        self.assertEqual(Employee.objects.get(pk=interviewing.pk).version, 2)
+
+    @override_settings(COUNTER_UPDATES='inline')
+    def test_move_to_department(self):
+        other = Department.objects.create(company=Company.objects.create(name='Globex'), name='Sales')
+        hired, applicant = self.make_employees(1, status='hired') + self.make_employees(1)
+        seq = Change.objects.latest('seq').seq
+        with CaptureQueriesContext(connection) as queries:
+            self.action('move_to_department', [hired, applicant], department=other.pk)
+        # One set-based UPDATE, not a save() per employee
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "core_app_employee"')]
+        self.assertEqual(len(updates), 1)
+
+        self.assertEqual(set(Employee.objects.values_list('department', 'company')), {(other.pk, other.company_id)})
+        counters = Department.objects.order_by('pk').values_list('num_employees', 'company__num_employees')
+        self.assertEqual(list(counters), [(0, 0), (1, 1)])
+        self.assertEqual(
+            sorted(Change.objects.filter(seq__gt=seq, kind='employee').values_list('object_id', 'company_id', 'action')),
+            sorted([(pk, company_id, action) for pk in (hired.pk, applicant.pk)
+                    for company_id, action in ((self.company.pk, 'delete'), (other.company_id, 'update'))]),
+        )
+        self.assertEqual(set(search.search_ids(self.admin, 'Employee')), {hired.pk, applicant.pk})
+
+        response = self.action('move_to_department', [hired], department=999)
+        self.assertEqual([str(message) for message in response.context['messages']],
+                         ['Enter the id of an existing department to move them to.'])
+
+    @override_settings(COUNTER_UPDATES='inline')
+    def test_delete_selected(self):
+        hired, applicant, kept = self.make_employees(1, status='hired') + self.make_employees(2)
+        self.action('delete_selected', [hired, applicant], post='yes')
+        self.assertEqual(list(Employee.objects.values_list('pk', flat=True)), [kept.pk])
+        self.department.refresh_from_db()
+        self.assertEqual(self.department.num_employees, 0)
+        self.assertEqual(Change.objects.filter(kind='employee', action='delete').count(), 2)
+
+
+class SQLiteConcurrencyTests(SimpleTestCase):
+    """Parallel writers against a file database using the SQLite profile from settings"""
+
+    # Connections are opened with the default database's settings, on a separate file
+    databases = {'default'}
+    writers = 8
+    writes_per_writer = 25
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.settings_dict = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(self.directory.name, 'concurrency.sqlite3'),
+        }
+
+    def connect(self):
+        # A connection of its own, outside the test database handler
+        return load_backend(self.settings_dict['ENGINE']).DatabaseWrapper(self.settings_dict)
+
+    def test_parallel_writers_do_not_hit_database_is_locked(self):
+        connection = self.connect()
+        self.addCleanup(connection.close)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)')
+            cursor.execute('INSERT INTO counter (id, value) VALUES (1, 0)')
+            cursor.execute('CREATE TABLE event (id INTEGER PRIMARY KEY, writer INTEGER NOT NULL)')
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+
+        errors = []
+
+        def write(writer):
+            connection = self.connect()
+            try:
+                for _ in range(self.writes_per_writer):
+                    # Starts the transaction like transaction.atomic() does (BEGIN IMMEDIATE)
+                    connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                    with connection.cursor() as cursor:
+                        # Read-modify-write: only safe because IMMEDIATE takes the write lock up front
+                        cursor.execute('SELECT value FROM counter WHERE id = 1')
+                        value = cursor.fetchone()[0]
+                        cursor.execute('UPDATE counter SET value = %s WHERE id = 1', [value + 1])
+                        cursor.execute('INSERT INTO event (writer) VALUES (%s)', [writer])
+                    connection.commit()
+                    connection.set_autocommit(True)
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=(writer,)) for writer in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT value FROM counter WHERE id = 1')
+            self.assertEqual(cursor.fetchone()[0], self.writers * self.writes_per_writer)
+            cursor.execute('SELECT COUNT(*) FROM event')
+            self.assertEqual(cursor.fetchone()[0], self.writers * self.writes_per_writer)
+
+
+class InstrumentationTests(APITestCase):
+
+    def queries(self, response):
+        return int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response['Server-Timing']).group(1))
+
+    def test_server_timing_and_metrics(self):
+        self.make_employees(2)
+        response = self.client.get('/api/employees/')
+        self.assertEqual(self.queries(response), 3)
+        self.assertRegex(response['Server-Timing'], r'serialize;dur=[\d.]+, total;dur=[\d.]+$')
+
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE core_app_request_queries histogram', body)
+        self.assertRegex(body, r'core_app_request_queries_bucket\{view="employee-list",le="3"\} [1-9]')
+        self.assertRegex(body, r'core_app_response_size_bytes_count\{view="employee-list"\} [1-9]')
+
+    def test_queries_run_in_threads_are_counted_under_asgi(self):
+        headers = {'Authorization': self.client._credentials['HTTP_AUTHORIZATION']}
+        response = async_to_sync(self.async_client.get)('/api/companies/', headers=headers)
+        self.assertEqual(self.queries(response), 3)
+
+    @override_settings(QUERY_BUDGETS={'employee-list': 1}, QUERY_BUDGET_ACTION='log')
+    def test_query_budget(self):
+        with self.assertLogs('core_app.instrumentation', 'WARNING') as logs:
+            self.client.get('/api/employees/')
+        self.assertEqual(logs.output, ['WARNING:core_app.instrumentation:employee-list ran 3 queries, its budget is 1'])
+
+        with self.settings(QUERY_BUDGET_ACTION='raise'), self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/api/employees/')
+
+
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class QueryBudgetTests(APITestCase):
+    """Pins the number of queries of every URL in core_app/urls.py to its QUERY_BUDGETS entry"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Several rows, so that a query per row shows up as a higher count
+        self.employees = self.make_employees(4)
+        # The first is hired by employee-update, the last by employee-transitions
+        Employee.objects.filter(pk__in=[self.employees[0].pk, self.employees[3].pk]).update(status='interview_scheduled')
+        self.other_company = Company.objects.create(name='Initech')
+        # Deleted by company-delete, the cascade collects its departments
+        Department.objects.create(company=self.other_company, name='Sales')
+        self.empty_company = Company.objects.create(name='Hooli')
+        self.other_department = Department.objects.create(company=self.company, name='Support')
+        # Logs in without a token yet, and with a hash the login upgrades
+        self.other_user = User.objects.create(
+            username='other', email='other@example.com', password=make_password('secret', hasher='pbkdf2_sha1'),
+            role='employee',
+        )
+
+    def url_requests(self):
+        """URL name -> (method, path, data), in the order they are sent"""
+        employee, second, third, fourth = self.employees
+        # A hire among them, so the recount corrects the counters
+        import_rows = (
+            'company,department,name,email,mobile_number,address,designation,status\n'
+            f'{self.company.id},{self.department.id},Ann,ann@example.com,+123456789,Street 1,Developer,hired\n'
+            f'{self.company.id},{self.department.id},Bob,bob@example.com,+123456789,Street 2,Developer,application_received\n'
+        )
+        return {
+            'login': ('post', '/api/login/', {'email': 'other@example.com', 'password': 'secret'}),
+            'get-all-users': ('get', '/api/users/', None),
+            'get-user': ('get', f'/api/users/{self.other_user.pk}/', None),
+            # A new company, which is looked up, and a new role, which logs the user out
+            'update-user': (
+                'put', f'/api/users/{self.other_user.pk}/update/', {'role': 'manager', 'company': self.company.pk},
+            ),
+            'company-create': ('post', '/api/companies/create/', {'name': 'Globex'}),
+            'company-list': ('get', '/api/companies/', None),
+            'company-detail': ('get', f'/api/companies/{self.company.pk}/', None),
+            'company-update': ('put', f'/api/companies/{self.company.pk}/update/', {'name': 'Acme Corp'}),
+            'company-delete': ('delete', f'/api/companies/{self.other_company.pk}/delete/', None),
+            # Without employees, so it also checks that the company exists
+            'company-summary': ('get', f'/api/companies/{self.empty_company.pk}/summary/', None),
+            'summary': ('get', '/api/summary/', None),
+            'department-list': ('get', '/api/departments/', None),
+            'department-detail': ('get', f'/api/departments/{self.department.pk}/', None),
+            'department-create': ('post', '/api/departments/create/', {'company': self.company.pk, 'name': 'Sales'}),
+            'department-update': (
+                'put', f'/api/departments/{self.department.pk}/update/', {'company': self.company.pk, 'name': 'R&D'},
+            ),
+            'department-delete': ('delete', f'/api/departments/{self.other_department.pk}/delete/', None),
+            'employee-list': ('get', '/api/employees/', None),
+            'employee-detail': ('get', f'/api/employees/{employee.pk}/', None),
+            'employee-search': ('get', '/api/employees/search/?q=emp', None),
+            'employee-create': ('post', '/api/employees/create/', {
+                'company': self.company.pk, 'department': self.department.pk, 'name': 'New', 'email': 'new@example.com',
+                'mobile_number': '+123456789', 'address': '1 Main Street', 'designation': 'Developer',
+            }),
+            'employee-update': ('put', f'/api/employees/{employee.pk}/update/', {'status': 'hired'}),
+            'employee-delete': ('delete', f'/api/employees/{third.pk}/delete/', None),
+            'employee-bulk-import': ('post', '/api/employees/bulk/', {'file': SimpleUploadedFile('rows.csv', import_rows.encode())}),
+            'employee-export': ('get', '/api/employees/export/', None),
+            # Two status pairs and a hire, which updates the counters
+            'employee-transitions': ('post', '/api/employees/transitions/', [
+                {'id': second.pk, 'status': 'interview_scheduled'}, {'id': fourth.pk, 'status': 'hired'},
+            ]),
+            # After the writes, so it rebuilds their companies' snapshots
+            'bootstrap': ('get', '/api/bootstrap/', None),
+            # Every kind of row changed, so each is fetched
+            'changes': ('get', '/api/changes/?since=0', None),
+            'metrics': ('get', '/api/metrics/', None),
+            # Last: it deletes the token the other requests use
+            'logout': ('post', '/api/logout/', None),
+        }
+
+    def test_every_url_has_a_budget_and_is_covered(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names - set(settings.QUERY_BUDGETS), set())
+        self.assertEqual(set(self.url_requests()), names)
+
+    def test_query_counts(self):
+        for name, (method, path, data) in self.url_requests().items():
+            with self.subTest(name):
+                # Cold caches: the budgets include the token and version lookups
+                get_token_cache().clear()
+                cache.clear()
+                get_response_cache().clear()
+                request_format = 'multipart' if name == 'employee-bulk-import' else 'json'
+                # Going over the budget raises QueryBudgetExceeded; the exact count pins it from below
+                response = getattr(self.client, method)(path, data, format=request_format)
+                self.assertLess(response.status_code, 300, name)
+                queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+                self.assertEqual(queries, settings.QUERY_BUDGETS.get(name))
@@ -0,0 +1,144 @@
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Change, Department, Employee
+from .versioning import company_changed
+
+
+class TransitionSerializer(serializers.Serializer):
+    id = serializers.IntegerField(min_value=1)
+    status = serializers.ChoiceField(choices=Employee.EMPLOYEE_STATUS)
+
+
+def apply_transitions(items, employees=None):
+    """
+    Move many employees through the status workflow at once.
+
+    `items` is a list of `{"id": ..., "status": ...}`, referring to rows of
+    the `employees` queryset (default: all employees). Invalid items are
+    reported and skipped; the valid ones are applied in one transaction with
+    one UPDATE, whatever their statuses, and the counters of the affected
+    departments and companies with one more each (see
+    Department.adjust_employee_counts). Returns one result dict per item, in order.
+    """
+    results = [None] * len(items)
+    requested = {}
+    for index, item in enumerate(items):
+        serializer = TransitionSerializer(data=item)
+        if not serializer.is_valid():
+            results[index] = {'id': item.get('id') if isinstance(item, dict) else None, 'errors': serializer.errors}
+        elif serializer.validated_data['id'] in requested:
+            results[index] = {'id': serializer.validated_data['id'], 'errors': {'id': ['Duplicate id.']}}
+        else:
+            requested[serializer.validated_data['id']] = (index, serializer.validated_data['status'])
+
+    if employees is None:
+        employees = Employee.objects.all()
+    today = timezone.now().date()
+    with transaction.atomic():
+        current = {
+            pk: (status, department_id, company_id)
+            for pk, status, department_id, company_id in employees.select_for_update()
+            .filter(pk__in=requested).values_list('id', 'status', 'department_id', 'company_id')
+        }
+
+        moves = defaultdict(list)  # (old status, new status) -> ids
+        counter_deltas = Counter()  # (department_id, company_id) -> hired delta
+        for pk, (index, new_status) in requested.items():
+            if pk not in current:
+                results[index] = {'id': pk, 'errors': {'id': ['Employee not found.']}}
+                continue
+            old_status, department_id, company_id = current[pk]
+            if old_status == new_status:
+                results[index] = {'id': pk, 'status': new_status, 'result': 'unchanged'}
+                continue
+            if new_status not in Employee.ALLOWED_STATUS_TRANSITIONS[old_status]:
+                results[index] = {'id': pk, 'errors': {'status': [f'Cannot move from "{old_status}" to "{new_status}".']}}
+                continue
+            moves[old_status, new_status].append(pk)
+            counter_deltas[department_id, company_id] += (new_status == 'hired') - (old_status == 'hired')
+            results[index] = {'id': pk, 'status': new_status, 'result': 'updated'}
+
+        if moves:
+            new_statuses = [When(pk__in=ids, then=Value(new_status)) for (old_status, new_status), ids in moves.items()]
+            # A new version, so edits based on the old status conflict (see VersionedModel)
+            changes = {'status': Case(*new_statuses), 'updated_at': timezone.now(), 'version': F('version') + 1}
+            hired = [pk for (old_status, new_status), ids in moves.items() if new_status == 'hired' for pk in ids]
+            if hired:
+                changes['hired_on'] = Case(When(pk__in=hired, then=Value(today)), default=F('hired_on'))
+            # All the pairs in one UPDATE, logged by the update trigger (see Change.record)
+            Employee.objects.filter(
+                reduce(or_, (Q(pk__in=ids, status=old_status) for (old_status, new_status), ids in moves.items()))
+            ).update(**changes)
+
+        recounted = Department.adjust_employee_counts(counter_deltas)
+        for company_id in {company_id for department_id, company_id in counter_deltas}:
+            # A queued recount rebuilds the snapshot too
+            company_changed(company_id, snapshot=company_id not in recounted)
+
+    return results
+
+
+def move_employees(employees, department):
+    """
+    Move the `employees` queryset into `department` (and its company) with one
+    UPDATE, without the per-object save() cascade. Counters, the change log and
+    caches are maintained as save() would, once per affected department and
+    company. Returns the number of moved employees.
+    """
+    with transaction.atomic():
+        current = {
+            pk: (status, department_id, company_id)
+            for pk, status, department_id, company_id in employees.select_for_update().order_by()
+            .exclude(department=department).values_list('id', 'status', 'department_id', 'company_id')
+        }
+        if not current:
+            return 0
+        # Logged by the update trigger, moves to another company as a delete there too
+        Employee.objects.filter(pk__in=current).update(
+            department=department, company=department.company_id,
+            updated_at=timezone.now(), version=F('version') + 1,
+        )
+
+        counter_deltas = Counter()  # (department_id, company_id) -> hired delta
+        for pk, (status, department_id, company_id) in current.items():
+            if status == 'hired':
+                counter_deltas[department_id, company_id] -= 1
+                counter_deltas[department.pk, department.company_id] += 1
+
+        recounted = Department.adjust_employee_counts(counter_deltas)
+        for company_id in {company_id for status, department_id, company_id in current.values()} | {department.company_id}:
+            company_changed(company_id, snapshot=company_id not in recounted)
+    return len(current)
+
+
+def delete_employees(employees):
+    """
+    Delete the `employees` queryset with one DELETE, maintaining counters, the
+    change log and caches like Employee.delete() does for a single employee.
+    Returns the number of deleted employees.
+    """
+    with transaction.atomic():
+        current = {
+            pk: (status, department_id, company_id)
+            for pk, status, department_id, company_id in employees.select_for_update().order_by()
+            .values_list('id', 'status', 'department_id', 'company_id')
+        }
+        if not current:
+            return 0
+        Employee.objects.filter(pk__in=current).delete()
+        Change.record(('employee', pk, company_id, 'delete') for pk, (status, department_id, company_id) in current.items())
+
+        hired = Counter(
+            (department_id, company_id) for status, department_id, company_id in current.values() if status == 'hired'
+        )
+        recounted = Department.adjust_employee_counts({key: -count for key, count in hired.items()})
+        for company_id in {company_id for status, department_id, company_id in current.values()}:
+            company_changed(company_id, snapshot=company_id not in recounted)
+    return len(current)
@@ -1,35 +1,56 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under ASGI (settings.ASYNC_API) login and the read endpoints are served by native async views
+api_views = async_views if settings.ASYNC_API else views
 
 urlpatterns = [
 
     # login and logout URLs
-    path('login/', views.login_view, name='login'),
+    path('login/', api_views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
 
     # User endpoints
     path('users/', views.get_all_users, name='get-all-users'),
-    path('users/<int:id>/', views.get_user, name='get-user'),
+    path('users/<int:id>/', api_views.get_user, name='get-user'),
     path('users/<int:id>/update/', views.update_user, name='update-user'),
 
     # Company URLs
     path('companies/create/', views.company_create, name='company-create'),
-    path('companies/', views.company_list, name='company-list'),
-    path('companies/<int:pk>/', views.company_detail, name='company-detail'),
+    path('companies/', api_views.company_list, name='company-list'),
+    path('companies/<int:pk>/', api_views.company_detail, name='company-detail'),
     path('companies/<int:pk>/update/', views.company_update, name='company-update'),
     path('companies/<int:pk>/delete/', views.company_delete, name='company-delete'),
+    path('companies/<int:pk>/summary/', views.company_summary, name='company-summary'),
+
+    # Summary of all companies
+    path('summary/', views.summary, name='summary'),
+
+    # Companies, departments and employee summaries in one snapshot
+    path('bootstrap/', views.bootstrap, name='bootstrap'),
+
+    # Changes after a change log sequence number (incremental sync)
+    path('changes/', views.changes, name='changes'),
 
     # Department URLs
-    path('departments/', views.department_list, name='department-list'),
-    path('departments/<int:pk>/', views.department_detail, name='department-detail'),
+    path('departments/', api_views.department_list, name='department-list'),
+    path('departments/<int:pk>/', api_views.department_detail, name='department-detail'),
     path('departments/create/', views.department_create, name='department-create'),
     path('departments/<int:pk>/update/', views.department_update, name='department-update'),
     path('departments/<int:pk>/delete/', views.department_delete, name='department-delete'),
 
     # Employee URLs
-    path('employees/', views.employee_list, name='employee-list'),
-    path('employees/<int:pk>/', views.employee_detail, name='employee-detail'),
+    path('employees/', api_views.employee_list, name='employee-list'),
+    path('employees/<int:pk>/', api_views.employee_detail, name='employee-detail'),
+    path('employees/search/', views.employee_search, name='employee-search'),
     path('employees/create/', views.employee_create, name='employee-create'),
     path('employees/<int:pk>/update/', views.employee_update, name='employee-update'),
     path('employees/<int:pk>/delete/', views.employee_delete, name='employee-delete'),
+    path('employees/bulk/', views.employee_bulk_import, name='employee-bulk-import'),
+    path('employees/export/', views.employee_export, name='employee-export'),
+    path('employees/transitions/', views.employee_transitions, name='employee-transitions'),
+
+    # Request metrics (Prometheus text format)
+    path('metrics/', views.metrics, name='metrics'),
 ]
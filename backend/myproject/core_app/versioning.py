@@ -0,0 +1,54 @@
+"""
+Version counters kept in the default cache, used to build cache keys that
+change whenever the underlying data changes. Bumping a version makes every
+key built from the old one unreachable, so nothing has to be deleted.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Scope covering data of every company
+ALL_COMPANIES = 'all'
+
+
+def _version_key(scope):
+    return f'version:{scope}'
+
+
+def get_version(scope):
+    version = cache.get(_version_key(scope))
+    if version is None:
+        # Start from the clock, not 1, so a version key that was evicted never
+        # comes back with a number an older cached entry still uses
+        cache.add(_version_key(scope), time.time_ns(), None)
+        version = cache.get(_version_key(scope), 0)
+    return version
+
+
+def bump_version(scope):
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        cache.add(_version_key(scope), time.time_ns(), None)
+
+
+def company_scope(company_id):
+    return f'company:{company_id}'
+
+
+def company_changed(company_id, snapshot=True):
+    """
+    Mark the data of `company_id` (and the all-companies scope) as changed
+    once the current transaction commits, so readers can't cache the old
+    data again after the bump. With `snapshot`, also queue the rebuild of
+    the company's bootstrap snapshot in the transaction (see snapshots.py).
+    """
+    from .models import Task  # models.py imports this module
+
+    def bump():
+        bump_version(company_scope(company_id))
+        bump_version(ALL_COMPANIES)
+    transaction.on_commit(bump)
+    if snapshot:
+        Task.enqueue('rebuild_snapshot', [company_id])
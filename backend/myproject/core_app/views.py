@@ -1,20 +1,117 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth import get_user_model
 from django.views.decorators.csrf import csrf_exempt
-from .models import Company, Department, Employee
-from .serializers import CompanySerializer, DepartmentSerializer, EmployeeSerializer, UserSerializer
+from .models import Company, Department, Employee, VersionConflict
+from .serializers import (
+    CompanySerializer, DepartmentSerializer, EmployeeSerializer, UserSerializer, ValuesRepresentationMixin,
+)
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from rest_framework.utils.urls import replace_query_param
 from django.contrib.auth import authenticate
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from .permissions import IsAdmin, IsAdminOrManager, IsAdminOrManagerOrEmployee
+from .pagination import KeysetCursorPagination, keyset_ordering
+from .filters import filter_employees
+from .summary import get_summary
+from .conditional import conditional, detail_validators, list_validators, requested_version
+from .response_cache import cached_detail, cached_list, company_pk, department_company
+from .scoping import company_ids, in_scope, scope
+from .transitions import apply_transitions
+from . import bulk, changelog, instrumentation, search, snapshots
+
+
+def prepare_list(request, queryset, serializer_class, ordering=None):
+    """
+    Apply `?fields=` (sparse fieldsets) and `ordering` to a list view's
+    queryset. Returns the queryset, the requested fields and the paginator.
+
+    Serializers with a values() path (`ValuesRepresentationMixin`) get a
+    values() queryset, see `serialize_list`.
+    """
+    fields = serializer_class.parse_fields(request)
+    # The ordering columns are needed to build the pagination cursor
+    sort_columns = [name.lstrip('-') for name in ordering or ('id',)]
+    if issubclass(serializer_class, ValuesRepresentationMixin):
+        queryset = queryset.values(*serializer_class.value_names(fields, sort_columns))
+    elif fields is not None:
+        queryset = queryset.only(*serializer_class.select_columns(fields + sort_columns))
+    if ordering is not None:
+        queryset = queryset.order_by(*keyset_ordering(queryset.model, ordering))
+
+    paginator = KeysetCursorPagination()
+    if ordering is not None:
+        paginator.ordering = ordering
+    return queryset, fields, paginator
+
+
+def serialize_list(rows, serializer_class, fields):
+    """The representation of the rows of a `prepare_list` queryset"""
+    if issubclass(serializer_class, ValuesRepresentationMixin):
+        return serializer_class.represent_values(rows, fields)
+    return serializer_class(rows, many=True, fields=fields).data
+
+
+def list_response(request, queryset, serializer_class, ordering=None):
+    """
+    Serialize a list view, honouring `?fields=` (sparse fieldsets) and
+    cursor pagination (`?page_size=` / `?cursor=`).
+    """
+    queryset, fields, paginator = prepare_list(request, queryset, serializer_class, ordering)
+    page = paginator.paginate_queryset(queryset, request)
+    if page is None:
+        return Response(serialize_list(queryset, serializer_class, fields))
+    return paginator.get_paginated_response(serialize_list(page, serializer_class, fields))
+
+# Tries of an update without a version that keeps losing races with other writes
+UPDATE_ATTEMPTS = 3
+
+
+def versioned_update(request, get_instance, serializer_class, partial=False, check=None):
+    """
+    Update the row `get_instance()` returns with `request.data`, saved with
+    a conditional UPDATE on its version (see VersionedModel). A client that
+    sent the version it edited (`If-Match` or `version` in the body) gets 409
+    Conflict with the current version when the row changed since; without
+    one the update is applied again to the fresh row. `check(serializer)`
+    may return an error response for the validated data.
+    """
+    expected = requested_version(request)
+    for attempt in range(UPDATE_ATTEMPTS):
+        instance = get_instance()
+        if expected is not None and expected != instance.version:
+            return version_conflict(instance.version)
+        serializer = serializer_class(instance, data=request.data, partial=partial)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        response = check(serializer) if check else None
+        if response is not None:
+            return response
+        try:
+            serializer.save()
+        except VersionConflict as exc:
+            if expected is None and attempt + 1 < UPDATE_ATTEMPTS:
+                # The retry runs the view's queries again
+                instrumentation.extend_query_budget()
+                continue
+            return version_conflict(exc.args[0])
+        return Response(serializer.data)
+
+
+def version_conflict(current):
+    return Response(
+        {"detail": "Changed by someone else since this version, reload it.", "version": current},
+        status=status.HTTP_409_CONFLICT,
+    )
 
 # login view
 @api_view(['POST'])
+# The credentials are in the body, a token sent along isn't looked up
+@authentication_classes([])
 def login_view(request):
     email = request.data.get('email')
     password = request.data.get('password')
@@ -38,7 +135,7 @@ def logout_view(request):
     try:
         # Get the user's token from the request
         token = Token.objects.get(user=request.user)
-        # Delete the token, effectively logging the user out
+        # Delete the token, effectively logging the user out (and out of the token cache, see apps.py)
         token.delete()
         return Response({"message": "Logout successful"}, status=200)
     except Token.DoesNotExist:
@@ -57,7 +154,8 @@ def get_all_users(request):
     if request.user.role != 'admin':
         return Response({"detail": "Not authorized to access this resource."}, status=status.HTTP_403_FORBIDDEN)
 
-    users = User.objects.all()
+    # Only the serialized columns
+    users = User.objects.only(*(name for name in UserSerializer.Meta.fields if name != 'password'))
     serializer = UserSerializer(users, many=True)
     return Response(serializer.data)
 
@@ -68,11 +166,11 @@ def get_user(request, id):
     """
     Retrieve details of a specific user.
     """
+    # Refuse before reading anything
+    if id != request.user.pk and request.user.role != 'admin':
+        return Response({"detail": "Not authorized to access this resource."}, status=status.HTTP_403_FORBIDDEN)
     try:
         user = User.objects.get(pk=id)
-        if user != request.user and request.user.role != 'admin':
-            return Response({"detail": "Not authorized to access this resource."}, status=status.HTTP_403_FORBIDDEN)
-        
         serializer = UserSerializer(user)
         return Response(serializer.data)
     except User.DoesNotExist:
@@ -85,14 +183,15 @@ def update_user(request, id):
     """
     Update details of a specific user.
     """
+    if id != request.user.pk and request.user.role != 'admin':
+        return Response({"detail": "Not authorized to access this resource."}, status=status.HTTP_403_FORBIDDEN)
     try:
         user = User.objects.get(pk=id)
-        if user != request.user and request.user.role != 'admin':
-            return Response({"detail": "Not authorized to access this resource."}, status=status.HTTP_403_FORBIDDEN)
-        
         data = request.data
-        serializer = UserSerializer(user, data=data, partial=True)  # Allow partial updates
+        # Allow partial updates; the role and company only change for admins
+        serializer = UserSerializer(user, data=data, partial=True, context={'request': request})
         if serializer.is_valid():
+            # Saving drops the user's cached token lookups (see authentication.user_saved)
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -114,51 +213,108 @@ def company_create(request):
 # View to get a list of all companies
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+@cached_list('company-list')
+@conditional(list_validators(lambda request: scope(Company.objects.all(), request.user)))
 def company_list(request):
-    companies = Company.objects.all()
-    serializer = CompanySerializer(companies, many=True)
-    return Response(serializer.data)
+    companies = scope(Company.objects.all(), request.user)
+    return list_response(request, companies, CompanySerializer)
 
 # View to get a single company
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+@cached_detail('company-detail', company_pk)
+@conditional(detail_validators(lambda request: scope(Company.objects.all(), request.user)))
 def company_detail(request, pk):
-    company = get_object_or_404(Company, pk=pk)
+    company = get_object_or_404(scope(Company.objects.all(), request.user), pk=pk)
     serializer = CompanySerializer(company)
     return Response(serializer.data)
 
+# View to get the headcount summary of a single company
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+def company_summary(request, pk):
+    if not in_scope(request.user, pk):
+        # Same answer as for a company that doesn't exist
+        raise Http404('No Company matches the given query.')
+    summary = get_summary(pk)
+    if summary['total'] == 0:
+        # Only an empty summary needs to tell a company without employees from a missing one
+        get_object_or_404(Company, pk=pk)
+    return Response(summary)
+
+# View to get the headcount summary of all companies
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+def summary(request):
+    ids = company_ids(request.user)
+    if ids is None:
+        return Response(get_summary())
+    if not ids:
+        return Response({"detail": "You are not a member of any company."}, status=status.HTTP_403_FORBIDDEN)
+    # Managers and employees get the summary of their own company
+    return Response(get_summary(ids[0]))
+
+# View to get the company -> department -> employee tree the frontend starts from
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+def bootstrap(request):
+    ids = company_ids(request.user)
+    if ids is not None and not ids:
+        return Response({"detail": "You are not a member of any company."}, status=status.HTTP_403_FORBIDDEN)
+    return snapshots.bootstrap_response(request, ids)
+
+# View to get what changed after a change log sequence number
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+def changes(request):
+    query = changelog.ChangesQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    ids = company_ids(request.user)
+    if ids is not None and not ids:
+        return Response({"detail": "You are not a member of any company."}, status=status.HTTP_403_FORBIDDEN)
+    if 'since' not in query.validated_data:
+        # Where to start from, before downloading the lists
+        return Response({'next': changelog.head()})
+    try:
+        return Response(changelog.read_changes(request.user, **query.validated_data))
+    except changelog.ChangesPruned as exc:
+        return Response(
+            {"detail": "Changes after this sequence number were pruned, download the lists again.", "oldest": exc.args[0]},
+            status=status.HTTP_410_GONE,
+        )
+
 # View to update company (Admin and Manager only)
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated, IsAdminOrManager])
 def company_update(request, pk):
-    company = get_object_or_404(Company, pk=pk)
-    serializer = CompanySerializer(company, data=request.data)
-    if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    return versioned_update(
+        request, lambda: get_object_or_404(scope(Company.objects.all(), request.user), pk=pk), CompanySerializer,
+    )
 
 # View to delete company (Admin only)
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated, IsAdmin])
 def company_delete(request, pk):
-    company = get_object_or_404(Company, pk=pk)
+    company = get_object_or_404(scope(Company.objects.all(), request.user), pk=pk)
     company.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 # View to list all departments
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+@cached_list('department-list')
+@conditional(list_validators(lambda request: scope(Department.objects.all(), request.user)))
 def department_list(request):
-    departments = Department.objects.all()
-    serializer = DepartmentSerializer(departments, many=True)
-    return Response(serializer.data)
+    departments = scope(Department.objects.all(), request.user)
+    return list_response(request, departments, DepartmentSerializer)
 
 # View to get a single department
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+@cached_detail('department-detail', department_company)
+@conditional(detail_validators(lambda request: scope(Department.objects.all(), request.user)))
 def department_detail(request, pk):
-    department = get_object_or_404(Department, pk=pk)
+    department = get_object_or_404(scope(Department.objects.all(), request.user), pk=pk)
     serializer = DepartmentSerializer(department)
     return Response(serializer.data)
 
@@ -176,34 +332,63 @@ def department_create(request):
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated, IsAdminOrManager])
 def department_update(request, pk):
-    department = get_object_or_404(Department, pk=pk)
-    serializer = DepartmentSerializer(department, data=request.data)
-    if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    def check(serializer):
+        if not in_scope(request.user, serializer.validated_data['company'].pk):
+            return Response({'company': ['You can only use your own company.']}, status=status.HTTP_403_FORBIDDEN)
+
+    return versioned_update(
+        request,
+        # The unique (company, name) validator compares against department.company
+        lambda: get_object_or_404(scope(Department.objects.select_related('company'), request.user), pk=pk),
+        DepartmentSerializer, check=check,
+    )
 
 # View to delete a department
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated, IsAdmin])
 def department_delete(request, pk):
-    department = get_object_or_404(Department, pk=pk)
+    department = get_object_or_404(scope(Department.objects.all(), request.user), pk=pk)
     department.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 # View to list all employees
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+@conditional(list_validators(
+    lambda request: filter_employees(request, scope(Employee.objects.all(), request.user))[0], changes_daily=True,
+))
 def employee_list(request):
-    employees = Employee.objects.all()
-    serializer = EmployeeSerializer(employees, many=True)
-    return Response(serializer.data)
+    employees, ordering = filter_employees(request, scope(Employee.objects.with_days_employed(), request.user))
+    return list_response(request, employees, EmployeeSerializer, ordering)
+
+# View to search employees by name, email, designation and address
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+def employee_search(request):
+    query = search.SearchQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    q, page, page_size = (query.validated_data[name] for name in ('q', 'page', 'page_size'))
+    fields = EmployeeSerializer.parse_fields(request)
+    # One more to know whether there is a next page
+    ids = search.search_ids(request.user, q, (page - 1) * page_size, page_size + 1)
+    rows = {}
+    if ids[:page_size]:
+        employees = scope(Employee.objects.with_days_employed(), request.user).filter(pk__in=ids[:page_size])
+        rows = {row['id']: row for row in employees.values(*EmployeeSerializer.value_names(fields, ['id']))}
+    url = request.build_absolute_uri()
+    return Response({
+        'next': replace_query_param(url, 'page', page + 1) if len(ids) > page_size else None,
+        'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+        # Best match first
+        'results': EmployeeSerializer.represent_values((rows[pk] for pk in ids[:page_size] if pk in rows), fields),
+    })
 
 # View to get a single employee
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+@conditional(detail_validators(lambda request: scope(Employee.objects.all(), request.user), changes_daily=True))
 def employee_detail(request, pk):
-    employee = get_object_or_404(Employee, pk=pk)
+    employee = get_object_or_404(scope(Employee.objects.with_days_employed(), request.user), pk=pk)
     serializer = EmployeeSerializer(employee)
     return Response(serializer.data)
 
@@ -213,6 +398,8 @@ def employee_detail(request, pk):
 def employee_create(request):
     serializer = EmployeeSerializer(data=request.data)
     if serializer.is_valid():
+        if not in_scope(request.user, serializer.validated_data['company'].pk):
+            return Response({'company': ['You can only use your own company.']}, status=status.HTTP_403_FORBIDDEN)
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -224,18 +411,81 @@ def employee_update(request, pk):
     """
     Update an employee's details. Accepts partial updates via PUT.
     """
-    employee = get_object_or_404(Employee, pk=pk)
-    serializer = EmployeeSerializer(employee, data=request.data, partial=True)  # Allow partial updates
-    if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    def check(serializer):
+        if 'company' in serializer.validated_data and not in_scope(request.user, serializer.validated_data['company'].pk):
+            return Response({'company': ['You can only use your own company.']}, status=status.HTTP_403_FORBIDDEN)
+
+    return versioned_update(
+        request, lambda: get_object_or_404(scope(Employee.objects.all(), request.user), pk=pk), EmployeeSerializer,
+        partial=True,  # Allow partial updates
+        check=check,
+    )
 
 
 # View to delete an employee (Admin and Manager only)
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated, IsAdminOrManager])
 def employee_delete(request, pk):
-    employee = get_object_or_404(Employee, pk=pk)
+    employee = get_object_or_404(scope(Employee.objects.all(), request.user), pk=pk)
     employee.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# View to import employees from a CSV or NDJSON upload (Admin and Manager only)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminOrManager])
+def employee_bulk_import(request):
+    """
+    Create employees from the uploaded `file` (CSV with a header row, or
+    NDJSON). Rows are validated and inserted in batches; invalid rows are
+    reported by row number and don't prevent the others from being created.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'Upload a CSV or NDJSON file in the "file" field.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    companies = scope(Company.objects.all(), request.user)
+    try:
+        created, errors = bulk.import_employees(bulk.read_rows(upload), companies=companies)
+    except bulk.UnreadableFile as exc:
+        # Raised at the header row, before anything was written
+        return Response({'error': f'The file could not be read: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'created': created, 'errors': errors})
+
+# View to export employees as CSV (default) or NDJSON (`?type=ndjson`)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminOrManagerOrEmployee])
+def employee_export(request):
+    export_type = request.query_params.get('type', 'csv')
+    if export_type not in ('csv', 'ndjson'):
+        return Response({'type': 'Must be "csv" or "ndjson".'}, status=status.HTTP_400_BAD_REQUEST)
+
+    employees, ordering = filter_employees(request, scope(Employee.objects.with_days_employed(), request.user))
+    employees = employees.order_by(*keyset_ordering(Employee, ordering or ('id',)))
+    if export_type == 'csv':
+        response = StreamingHttpResponse(bulk.stream_csv(employees), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="employees.csv"'
+    else:
+        response = StreamingHttpResponse(bulk.stream_ndjson(employees), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="employees.ndjson"'
+    return response
+
+# View to move many employees through the hiring pipeline at once (Admin and Manager only)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminOrManager])
+def employee_transitions(request):
+    """
+    Apply a list of `{"id": ..., "status": ...}` status transitions and
+    report the outcome for each id.
+    """
+    if not isinstance(request.data, list):
+        return Response({'error': 'Expected a list of {"id", "status"} objects.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = apply_transitions(request.data, scope(Employee.objects.all(), request.user))
+    return Response({'updated': sum(result.get('result') == 'updated' for result in results), 'results': results})
+
+# View exposing the per-view request metrics in the Prometheus text format (Admin only)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdmin])
+def metrics(request):
+    return HttpResponse(instrumentation.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
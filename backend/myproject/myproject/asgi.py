@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+# Route the endpoints that have native async views to them (see settings.ASYNC_API)
+os.environ.setdefault('DJANGO_ASYNC_API', '1')
 
 application = get_asgi_application()
@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack
+    'core_app.middleware.InstrumentationMiddleware',
+    # Before anything reads from the database
+    'core_app.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -56,17 +64,142 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'core_app.authentication.CachedTokenAuthentication',
+    ],
+    # orjson based when it is installed, with the same output as DRF's
+    'DEFAULT_RENDERER_CLASSES': [
+        'core_app.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core_app.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+#
+# DJANGO_CACHE selects where the shared caches live: 'locmem' (default), a
+# per-process LRU for a single worker, or 'file' / 'db' (run `manage.py
+# createcachetable` first) when several worker processes must see each
+# other's invalidations. 'default' holds the data versions that invalidate
+# the summaries and the response cache, so both always use the same backend.
+# The file and db backends cull a fraction of the entries (not the least
+# recently used ones) once MAX_ENTRIES is reached.
+
+CACHE_BACKEND = os.environ.get('DJANGO_CACHE', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+}
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f"Unknown DJANGO_CACHE {CACHE_BACKEND!r}, use one of {', '.join(CACHE_BACKENDS)}.")
+
+
+def shared_cache(name, max_entries):
+    location = {
+        'locmem': name,
+        'file': os.path.join(os.environ.get('DJANGO_CACHE_DIR', BASE_DIR / 'cache'), name),
+        'db': f'cache_{name}',
+    }[CACHE_BACKEND]
+    return {'BACKEND': CACHE_BACKENDS[CACHE_BACKEND], 'LOCATION': location, 'OPTIONS': {'MAX_ENTRIES': max_entries}}
+
+
+CACHES = {
+    'default': shared_cache('default', 1000),
+    # Rendered company/department read responses, see core_app.response_cache
+    'responses': shared_cache('responses', 5000),
+    # Token -> (user id, role, is_active, company id) lookups, see core_app.authentication.
+    # LocMemCache is a per-process LRU; point this at a shared backend (Redis,
+    # Memcached) so that logouts are seen by every worker immediately.
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tokens',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+TOKEN_CACHE_ALIAS = 'tokens'
+TOKEN_CACHE_TTL = 300  # seconds
+
+# Dashboard summaries are also invalidated on every change, this only bounds memory use
+SUMMARY_CACHE_TTL = 60 * 60  # seconds
+
+# Cached company/department responses, invalidated the same way
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TTL = 60 * 60  # seconds
+
+# num_departments/num_employees upkeep: 'inline' updates the counters in the
+# writing request. 'deferred' (opt-in) queues a recount instead, so writes
+# don't wait on the company and department rows; the counters only catch up
+# while `manage.py run_worker` (core_app.tasks) runs next to the web processes.
+COUNTER_UPDATES = os.environ.get('DJANGO_COUNTER_UPDATES', 'inline')
+if COUNTER_UPDATES not in ('inline', 'deferred'):
+    raise ImproperlyConfigured(f"Unknown DJANGO_COUNTER_UPDATES {COUNTER_UPDATES!r}, use 'inline' or 'deferred'.")
+TASK_LEASE = 60  # seconds a claimed task is hidden from other workers
+TASK_MAX_ATTEMPTS = 5
+
+# Days of change log entries `manage.py prune_changes` keeps (see core_app.changelog)
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('DJANGO_CHANGE_LOG_RETENTION_DAYS', '30'))
+
+# Request instrumentation (core_app.middleware.InstrumentationMiddleware).
+# Maximum number of SQL queries per request, by URL name, with a cold token
+# cache. Going over is logged, or raised as QueryBudgetExceeded when
+# QUERY_BUDGET_ACTION is 'raise', which the test runner sets for the whole
+# suite (core_app.test_runner). A view that retries an update, or imports
+# several batches, is allowed its budget once per attempt or batch.
+QUERY_BUDGET_ACTION = os.environ.get('DJANGO_QUERY_BUDGET_ACTION', 'log')
+QUERY_BUDGETS = {
+    'login': 6,  # creating the user's first token and upgrading an outdated password hash
+    'logout': 3,
+    'get-all-users': 2,
+    'get-user': 2,
+    'update-user': 5,
+    'company-create': 7,
+    'company-list': 3,
+    'company-detail': 3,
+    'company-update': 7,
+    'company-delete': 12,  # with departments, which the cascade collects
+    'company-summary': 3,  # 2 unless the company has no employees
+    'summary': 2,
+    'bootstrap': 11,  # rebuilding the changed snapshots; 2 once they are current
+    'changes': 6,  # with companies, departments and employees among the changes
+    'department-list': 3,
+    'department-detail': 3,
+    'department-create': 9,
+    'department-update': 8,
+    'department-delete': 10,
+    'employee-list': 3,
+    'employee-detail': 3,
+    'employee-search': 3,
+    'employee-create': 9,
+    'employee-update': 8,  # a hire also updates the department and company counters (COUNTER_UPDATES = 'inline')
+    'employee-delete': 7,
+    'employee-bulk-import': 13,  # per batch of IMPORT_BATCH_SIZE rows, recounting the companies
+    'employee-export': 1,  # the rows are read while the response streams
+    'employee-transitions': 8,  # for any batch: one UPDATE of the employees, one each of the counters
+    'metrics': 1,
+}
+
 # Allow requests from your frontend's domain (e.g., localhost:8080 for Vue)
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:7070',
 ]
+# The frontend sends the version it edited as If-Match (see core_app.conditional)
+CORS_ALLOW_HEADERS = (*default_headers, 'if-match')
 
 ROOT_URLCONF = 'myproject.urls'
 
+TEST_RUNNER = 'core_app.test_runner.TestRunner'
+
+# Serve the endpoints that have a native async implementation (core_app.async_views)
+# with it. Enabled by myproject/asgi.py; under WSGI the sync views are used.
+ASYNC_API = os.environ.get('DJANGO_ASYNC_API') == '1'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -89,12 +222,88 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DJANGO_DB_ENGINE selects the profile: 'sqlite' (default) for single-node
+# deployments, or 'postgresql' for production with several workers.
+
+DB_ENGINE = os.environ.get('DJANGO_DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'brainwise'),
+            'USER': os.environ.get('POSTGRES_USER', 'brainwise'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Reuse connections across requests, checking them before reuse. Not
+            # under ASGI: every concurrent request runs its queries on a thread of
+            # its own, so persistent connections would pile up (use the pool instead)
+            'CONN_MAX_AGE': 0 if ASYNC_API else int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'options': f"-c statement_timeout={int(os.environ.get('DJANGO_DB_STATEMENT_TIMEOUT_MS', 5000))}",
+            },
+        }
     }
-}
+    if os.environ.get('DJANGO_DB_POOL') == '1':
+        # psycopg's native connection pool (needs psycopg[pool]); replaces persistent connections
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DJANGO_DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DJANGO_DB_POOL_MAX_SIZE', 10)),
+            'timeout': 10,
+        }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Take the write lock when a transaction starts, so writers queue
+                # on busy_timeout instead of failing with "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+                # WAL lets readers run alongside a writer; NORMAL sync is safe with WAL
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA busy_timeout={int(os.environ.get('DJANGO_SQLITE_BUSY_TIMEOUT_MS', 5000))};"
+                ),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DJANGO_DB_ENGINE {DB_ENGINE!r}, use 'sqlite' or 'postgresql'.")
+
+# DJANGO_DB_REPLICAS adds read replicas of the primary (`default`), comma
+# separated: SQLite files or PostgreSQL hosts (`host[:port]`, with the
+# primary's database and credentials). Reads of GET requests go to them
+# round-robin (core_app.routers). Locally, two SQLite files stand in for a
+# primary and a replica, with `manage.py sync_sqlite_replicas` as replication:
+#
+#   DJANGO_DB_REPLICAS=replica.sqlite3 python manage.py sync_sqlite_replicas
+#
+# DJANGO_DB_REPLICA_LAG bounds how far behind a replica may be: a client
+# reads from the primary for that long after it wrote, and cache entries
+# built from a replica's data expire after it.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('DJANGO_DB_REPLICAS', '').split(',')), start=1):
+    replica_settings = {**DATABASES['default'], 'OPTIONS': dict(DATABASES['default']['OPTIONS'])}
+    if DB_ENGINE == 'sqlite':
+        # mode=rw: a missing file is an unreachable replica, not a new empty database
+        replica_settings['NAME'] = f'file:{replica.strip()}?mode=rw'
+    else:
+        host, _, port = replica.strip().partition(':')
+        replica_settings.update(HOST=host, PORT=port or replica_settings['PORT'])
+    # Tests read the replica's data from the test primary
+    replica_settings['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{number}'] = replica_settings
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['core_app.routers.ReplicaRouter']
+REPLICA_LAG = int(os.environ.get('DJANGO_DB_REPLICA_LAG', 5))  # seconds
+REPLICA_RETRY = 30  # seconds an unreachable replica is skipped
 
 
 # Password validation
@@ -116,6 +325,29 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/5.1/topics/auth/passwords/
+#
+# DJANGO_PASSWORD_HASHER picks the algorithm new passwords are hashed with.
+# The others stay listed so existing hashes still verify; they are upgraded
+# to the preferred algorithm the next time their user logs in.
+
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2_sha256': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',  # requires argon2-cffi
+    'bcrypt_sha256': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',  # requires bcrypt
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
+PASSWORD_HASHER = os.environ.get('DJANGO_PASSWORD_HASHER', 'pbkdf2_sha256')
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[PASSWORD_HASHER]] + [
+    path for name, path in PASSWORD_HASHER_CHOICES.items() if name != PASSWORD_HASHER
+]
+
+# Number of password checks the async login view runs at once
+LOGIN_HASH_WORKERS = int(os.environ.get('DJANGO_LOGIN_HASH_WORKERS', os.cpu_count() or 2))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 